@@ -0,0 +1,193 @@
+# Archivo: /services/api/admission.py
+# Control de admisión: límites de concurrencia por etapa con una cola de
+# espera acotada, rechazo temprano según el deadline y circuit breaker.
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+class Overloaded(Exception):
+    """La petición se rechaza para proteger la latencia (se traduce a 429/503 + Retry-After)."""
+
+    def __init__(self, detail: str, status_code: int = 503, retry_after: float = 1.0):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class ConcurrencyLimiter:
+    """
+    Permite como máximo 'max_concurrency' ejecuciones simultáneas de una etapa.
+    Las demás esperan en una cola FIFO de como máximo 'max_queue' elementos;
+    si la cola está llena, o la espera estimada no cabe en el deadline, la
+    petición se rechaza de inmediato en lugar de encolarse.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_wait_sec: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_sec = max_wait_sec
+        self.active = 0
+        self.rejected = 0
+        self.avg_service_sec = None # Media móvil (EWMA) del tiempo de servicio
+        self._waiters = deque()
+
+    def estimated_wait(self) -> float:
+        """Espera estimada para una petición nueva, según la cola y el tiempo medio de servicio."""
+        if self.active < self.max_concurrency and not self._waiters:
+            return 0.0
+        # Sin historial aún no se estima (se confía en el límite de la cola)
+        service = self.avg_service_sec or 0.0
+        return (len(self._waiters) + 1) / self.max_concurrency * service
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "avg_service_sec": round(self.avg_service_sec or 0.0, 4)
+        }
+
+    def _reject(self, detail: str, status_code: int, retry_after: float):
+        self.rejected += 1
+        raise Overloaded(f"{self.name}: {detail}", status_code=status_code, retry_after=retry_after)
+
+    def _release(self):
+        # El hueco pasa directamente al siguiente en la cola (active no cambia)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    async def _acquire(self, deadline: Optional[float]):
+        timeout = self.max_wait_sec
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("cola llena", 429, self.estimated_wait())
+        if self.estimated_wait() > timeout:
+            self._reject("la espera estimada excede el deadline", 503, self.estimated_wait())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # El hueco llegó justo al vencer el plazo: devolverlo
+                self._release()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("tiempo de espera agotado", 503, self.estimated_wait())
+
+    def _finish(self, start: float):
+        elapsed = time.monotonic() - start
+        if self.avg_service_sec is None:
+            self.avg_service_sec = elapsed
+        else:
+            self.avg_service_sec = 0.8 * self.avg_service_sec + 0.2 * elapsed
+        self._release()
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """
+        Context manager asíncrono que ocupa un hueco de la etapa.
+        'deadline' es un instante de time.monotonic() a partir del cual ya no
+        tiene sentido empezar.
+        """
+        await self._acquire(deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._finish(start)
+
+    async def run(self, make_awaitable: Callable[[], Awaitable], deadline: Optional[float] = None):
+        """
+        Ejecuta make_awaitable() en un hueco de la etapa y devuelve su resultado.
+        A diferencia de slot(), si quien espera se cancela (o vence su timeout)
+        el trabajo sigue en marcha y el hueco no se libera hasta que termina:
+        un hilo no se puede interrumpir y sigue consumiendo capacidad.
+        """
+        await self._acquire(deadline)
+        start = time.monotonic()
+        try:
+            task = asyncio.ensure_future(make_awaitable())
+        except BaseException:
+            self._finish(start)
+            raise
+
+        def done(task):
+            if not task.cancelled():
+                task.exception() # Marca el error como recogido si ya nadie espera
+            self._finish(start)
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico (cerrado -> abierto -> semiabierto).
+    Tras 'failure_threshold' fallos seguidos se abre y rechaza de inmediato
+    durante 'reset_timeout_sec'; después deja pasar una única llamada de
+    prueba que decide si se vuelve a cerrar.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_sec: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        """Lanza Overloaded si el circuito no admite la llamada."""
+        if self.state == "open":
+            remaining = self.reset_timeout_sec - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise Overloaded(f"{self.name}: circuito abierto", status_code=503, retry_after=remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                raise Overloaded(f"{self.name}: circuito en prueba", status_code=503, retry_after=1.0)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"Circuit breaker '{self.name}' ABIERTO tras {self.failures} fallos.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def release(self):
+        """Libera la llamada de prueba si terminó sin veredicto (p.ej. cancelada)."""
+        self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
@@ -0,0 +1,95 @@
+# Archivo: /services/api/batching.py
+# Micro-batching dinámico: agrupa las peticiones concurrentes que llegan
+# dentro de una ventana corta y las procesa con una sola llamada.
+
+import asyncio
+from typing import Any, Callable, List, Optional
+
+class MicroBatcher:
+    """
+    Acumula elementos enviados con submit() durante 'window_ms' (o hasta
+    'max_batch_size') y llama a batch_fn(lista_de_elementos) en un hilo.
+    batch_fn debe devolver una lista de resultados en el mismo orden; un
+    resultado que sea una excepción falla sólo la petición de ese elemento.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 window_ms: float = 5.0, max_concurrent_batches: int = 4, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = set()
+
+    def start(self):
+        """Arranca el bucle colector (debe llamarse dentro del event loop)."""
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self):
+        """Detiene el colector y falla las peticiones que quedaran en cola."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} detenido"))
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def submit(self, item: Any) -> Any:
+        """Encola un elemento y espera su resultado."""
+        if self._task is None:
+            raise RuntimeError(f"{self.name} no está iniciado")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Dar una ventana corta para que lleguen peticiones concurrentes
+            if self.window > 0 and self._queue.qsize() < self.max_batch_size - 1:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # Las peticiones canceladas mientras esperaban no se procesan
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _dispatch(self, batch):
+        try:
+            results = await asyncio.to_thread(self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,63 @@
+# Archivo: /services/api/coalescing.py
+# "Single-flight": las peticiones idénticas que llegan mientras otra igual
+# está en curso esperan ese mismo cómputo en lugar de repetirlo.
+
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+_SPACES_RE = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """Normalización usada para detectar consultas duplicadas."""
+    return _SPACES_RE.sub(" ", query).strip().lower()
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola tarea.
+    - Las excepciones se propagan a todos los que esperan.
+    - Si un cliente se cancela, el cómputo sigue para los demás; sólo se
+      cancela cuando ya no queda nadie esperando.
+    - No guarda resultados: al terminar, la clave se libera.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.coalesced = 0 # Peticiones que se ahorraron el cómputo
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable):
+        """Hay un cómputo en curso con esta clave (quien llegue ahora lo compartirá)."""
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task, key=key, call=call: self._forget(key, call))
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
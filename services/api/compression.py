@@ -0,0 +1,140 @@
+# Archivo: /services/api/compression.py
+# Middleware ASGI de compresión negociada: brotli si el cliente lo acepta y
+# el paquete 'brotli' está instalado, si no gzip. Sólo comprime respuestas
+# de tipos de texto por encima de un tamaño mínimo.
+
+import gzip
+from typing import Optional
+
+try:
+    import brotli # Opcional: sin él se usa sólo gzip
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# Por encima de esto no se comprime en memoria (se sirve tal cual)
+MAX_BUFFER_BYTES = 8 * 1024 * 1024
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """'br' o 'gzip' según Accept-Encoding (respetando q=0), o None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+class CompressionStats:
+    """Bytes antes/después de comprimir (por worker), para /health."""
+
+    def __init__(self):
+        self.responses_compressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "responses_compressed": self.responses_compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            "brotli_available": brotli is not None
+        }
+
+compression_stats = CompressionStats()
+
+def merge_vary(headers: list) -> list:
+    """Añade Accept-Encoding a la cabecera Vary existente (o la crea), sin duplicarla."""
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            tokens = {token.strip().lower() for token in value.split(b",")}
+            if b"*" not in tokens and b"accept-encoding" not in tokens:
+                headers[i] = (name, value + b", Accept-Encoding")
+            return headers
+    headers.append((b"vary", b"Accept-Encoding"))
+    return headers
+
+def weaken_etag(headers: list) -> list:
+    """
+    Un ETag fuerte identifica una representación byte a byte: la comprimida
+    es otra, así que se marca como débil (W/), que sí admite ambas.
+    """
+    return [(name, b"W/" + value if name.lower() == b"etag" and not value.startswith(b"W/") else value)
+            for name, value in headers]
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality   # Calidad baja: rápida para respuestas dinámicas
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+        chunks = []
+        size = 0
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, size, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                start_message = message
+                response_headers = dict(message.get("headers") or [])
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if message.get("more_body", False):
+                if size > MAX_BUFFER_BYTES:
+                    # Demasiado grande para comprimir en memoria: enviar lo acumulado tal cual
+                    passthrough = True
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            body = b"".join(chunks)
+            response_headers = [(k, v) for k, v in start_message.get("headers", []) if k != b"content-length"]
+            if len(body) >= self.minimum_size and start_message.get("status", 200) not in (204, 304):
+                compressed = self.compress(body, encoding)
+                if len(compressed) < len(body):
+                    compression_stats.responses_compressed += 1
+                    compression_stats.bytes_in += len(body)
+                    compression_stats.bytes_out += len(compressed)
+                    body = compressed
+                    response_headers = weaken_etag(response_headers)
+                    response_headers.append((b"content-encoding", encoding.encode("latin-1")))
+            response_headers = merge_vary(response_headers)
+            response_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
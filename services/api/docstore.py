@@ -0,0 +1,162 @@
+# Archivo: /services/api/docstore.py
+# Lector del almacén local de chunks que escribe el indexer
+# (services/indexer/docstore.py; el formato debe coincidir).
+# El texto se lee bajo demanda desde un archivo mapeado en memoria.
+
+import os
+import json
+import mmap
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+DOCSTORE_FORMAT_VERSION = 1
+TEXT_FILE_NAME = "chunks.bin"
+INDEX_FILE_NAME = "index.json"
+CURRENT_FILE_NAME = "CURRENT"
+# Versiones distintas de la que está en servicio que se mantienen abiertas
+MAX_OPEN_VERSIONS = 2
+
+class DocStore:
+    """Acceso por id a (texto, archivo fuente) de cada chunk."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE_NAME), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get("version") != DOCSTORE_FORMAT_VERSION:
+            raise ValueError(f"Versión de almacén no soportada: {index.get('version')}")
+
+        self._positions = {doc_id: i for i, doc_id in enumerate(index["ids"])}
+        self._source_names = index["source_names"]
+        self._source_idx = index["source_idx"]
+        self._offsets = index["offsets"]
+
+        self._file = open(os.path.join(directory, TEXT_FILE_NAME), 'rb')
+        # mmap no admite archivos vacíos
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._offsets[-1] else b""
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._positions
+
+    @property
+    def source_names(self):
+        """Archivos fuente presentes en el almacén."""
+        return self._source_names
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, str]]:
+        """Devuelve (texto, archivo fuente) o None si el id no existe."""
+        i = self._positions.get(doc_id)
+        if i is None:
+            return None
+        text = self._mm[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+        return text, self._source_names[self._source_idx[i]]
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._file.close()
+
+class VersionedDocStore:
+    """
+    Almacén versionado: sigue el puntero <raíz>/CURRENT que el indexer
+    reemplaza al publicar una reindexación, y abre la versión nueva sin
+    reiniciar la API. Si no hay CURRENT se usa la raíz (formato sin versiones).
+    Los índices guardan la versión de cada documento: get(doc_id, versión)
+    lee de esa versión aunque no sea la de CURRENT (Solr, Milvus y CURRENT
+    no cambian en el mismo instante al publicar).
+    """
+
+    def __init__(self, root: str, check_interval_sec: float = 2.0):
+        self.root = root
+        self.check_interval_sec = check_interval_sec
+        self.version = None
+        self._store = None
+        self._pointer_mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._versions = OrderedDict() # versión -> DocStore (o None si no existe)
+        self._refresh(force=True)
+        if self._store is None:
+            raise FileNotFoundError(f"No hay almacén de documentos en {root}")
+
+    def _refresh(self, force: bool = False):
+        pointer = os.path.join(self.root, CURRENT_FILE_NAME)
+        try:
+            mtime = os.stat(pointer).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime == self._pointer_mtime:
+            return
+
+        if mtime is None:
+            version, directory = None, self.root
+        else:
+            with open(pointer, 'r', encoding='utf-8') as f:
+                version = f.read().strip()
+            directory = os.path.join(self.root, version)
+
+        try:
+            store = DocStore(directory)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: no se pudo abrir el almacén '{directory}': {e}")
+            return
+        # La versión anterior no se cierra aquí: puede haber lecturas en curso
+        # en otros hilos; el mmap se libera cuando deja de referenciarse.
+        self._store = store
+        self.version = version
+        self._pointer_mtime = mtime
+        print(f"Almacén de documentos en servicio: {version or directory} ({len(store)} chunks).")
+
+    def current(self) -> DocStore:
+        """Devuelve la versión en servicio, comprobando el puntero como mucho cada pocos segundos."""
+        now = time.monotonic()
+        if now >= self._next_check:
+            with self._lock:
+                if now >= self._next_check:
+                    self._next_check = now + self.check_interval_sec
+                    self._refresh()
+        return self._store
+
+    def at(self, version: Optional[str]) -> DocStore:
+        """
+        Versión concreta del almacén (None = la que está en servicio). Si esa
+        versión ya no está en disco se usa la que está en servicio.
+        """
+        current = self.current()
+        if version is None or version == self.version:
+            return current
+        with self._lock:
+            if version in self._versions:
+                self._versions.move_to_end(version)
+            else:
+                store = None
+                if os.path.basename(version) == version and not version.startswith("."):
+                    try:
+                        store = DocStore(os.path.join(self.root, version))
+                    except (OSError, ValueError) as e:
+                        print(f"Advertencia: no se pudo abrir la versión '{version}' del almacén: {e}")
+                self._versions[version] = store
+                if len(self._versions) > MAX_OPEN_VERSIONS:
+                    self._versions.popitem(last=False)
+            store = self._versions[version]
+        return store if store is not None else current
+
+    def __len__(self):
+        return len(self.current())
+
+    @property
+    def source_names(self):
+        return self.current().source_names
+
+    def get(self, doc_id: str, version: Optional[str] = None) -> Optional[Tuple[str, str]]:
+        """(texto, archivo fuente) en la versión 'version' (por defecto, la que está en servicio)."""
+        return self.at(version).get(doc_id)
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
@@ -0,0 +1,48 @@
+# Archivo: /services/api/filters.py
+# Filtros de metadatos para /ask: documentos fuente y rangos de capítulos
+# (derivados del prefijo numérico del archivo, ej. "14-Las FARC.txt" -> 14).
+
+import re
+from typing import Iterable, List, Optional
+
+_CHAPTER_RE = re.compile(r"^(\d+)-")
+
+def chapter_of(file_name: str) -> Optional[int]:
+    """Número de capítulo según el prefijo del archivo, o None si no tiene."""
+    match = _CHAPTER_RE.match(file_name)
+    return int(match.group(1)) if match else None
+
+def chapter_partition(file_name: str) -> str:
+    """
+    Partición de Milvus de un archivo (debe coincidir con index_milvus.py).
+    Los nombres de partición sólo admiten [A-Za-z0-9_], por eso se usa el
+    número de capítulo y no el nombre del archivo.
+    """
+    chapter = chapter_of(file_name)
+    return f"cap_{chapter:03d}" if chapter is not None else "_default"
+
+def resolve_sources(all_sources: Iterable[str], source_documents: Optional[List[str]],
+                    chapter_from: Optional[int], chapter_to: Optional[int]) -> Optional[List[str]]:
+    """
+    Traduce los filtros de la petición a la lista de archivos permitidos.
+    None significa "sin filtro" (todo el corpus).
+    """
+    if not source_documents and chapter_from is None and chapter_to is None:
+        return None
+
+    candidates = list(source_documents) if source_documents else list(all_sources)
+    if chapter_from is not None or chapter_to is not None:
+        low = chapter_from if chapter_from is not None else float("-inf")
+        high = chapter_to if chapter_to is not None else float("inf")
+        candidates = [
+            name for name in candidates
+            if chapter_of(name) is not None and low <= chapter_of(name) <= high
+        ]
+    return sorted(set(candidates))
+
+def solr_source_fq(sources: List[str]) -> str:
+    """
+    Filter query de Solr sobre source_document_s. Va en 'fq' (no en 'q'),
+    así que no afecta al ranking y Solr la guarda en su filterCache.
+    """
+    return f'{{!terms f=source_document_s separator="|"}}{"|".join(sources)}'
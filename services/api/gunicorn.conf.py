@@ -0,0 +1,32 @@
+# Archivo: /services/api/gunicorn.conf.py
+# Modo producción: varios workers de uvicorn bajo gunicorn.
+#   gunicorn -c gunicorn.conf.py main:app
+# (Para desarrollo sigue sirviendo: uvicorn main:app --reload)
+
+import multiprocessing
+import os
+import uuid
+
+bind = f"0.0.0.0:{os.getenv('API_PORT', '8000')}"
+
+# Un worker por núcleo por defecto; WEB_CONCURRENCY lo fija a mano
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Importar main.py una vez en el master y heredarlo en los workers (fork).
+# Es seguro porque al importar no se abre ninguna conexión: Gemini, Milvus,
+# el docstore y la caché compartida se inicializan en el lifespan de cada worker.
+preload_app = True
+
+# Las respuestas de Gemini pueden tardar; el deadline de /ask ya las acota
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+def on_starting(server):
+    # Id de este arranque para el warm-up (ver warmup.warmup_key): se fija en
+    # el master antes de crear los workers, así que todos lo heredan, y cambia
+    # en cada reinicio (gunicorn es el PID 1 del contenedor: el PID no sirve)
+    os.environ["API_BOOT_ID"] = uuid.uuid4().hex
@@ -1,13 +1,16 @@
 import os
 import time
+import asyncio
+import hashlib
+import secrets
 from fastapi import FastAPI, Request, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import List, Dict, Literal, Optional, Tuple
+from contextlib import asynccontextmanager, nullcontext
 
 # --- NUEVAS IMPORTACIONES ---
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 # --- FIN NUEVAS IMPORTACIONES ---
 
 # --- Conectores de Bases de Datos ---
@@ -16,11 +19,29 @@ from pymilvus import connections, Collection
 from dotenv import load_dotenv
 
 # --- Stack de IA (Embeddings y Generador) ---
-from sentence_transformers import SentenceTransformer
-#from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
-import torch
+# (Los embeddings y la generación usan la API de Google; ya no se importan
+#  sentence_transformers ni torch, que sólo alargaban el arranque.)
 import google.generativeai as genai
 
+# --- Tesauro (expansión de consultas para Milvus) ---
+from tesauro import load_synonym_matcher
+from solr_query import build_solr_query, SOLR_FL_IDS, SOLR_FL_FULL
+from snippets import solr_highlight_params, solr_highlight_text, make_snippet
+from batching import MicroBatcher
+from coalescing import SingleFlight, normalize_query
+from admission import ConcurrencyLimiter, CircuitBreaker, Overloaded
+from docstore import VersionedDocStore
+from filters import resolve_sources, chapter_partition, solr_source_fq
+from startup import StartupReport
+from shared_cache import open_shared_cache, pack_vector, unpack_vector
+from record_replay import open_cassette, cassette_key, ReplayMiss
+from token_budget import TokenMeter
+from adaptive_k import select, load_thresholds
+from compression import CompressionMiddleware, compression_stats
+from warmup import QueryLog, Warmer, warmup_key, load_gold_standard_queries
+from profiling import (Profiler, profile_stage, run_in_thread, folded_text, PROFILE_DIR, PROFILE_KEEP,
+                       PROFILE_SAMPLE_INTERVAL_MS, PROFILE_SLOW_THRESHOLD_SEC)
+
 # --- Variables de Entorno (leídas desde docker-compose.yml) ---
 SOLR_HOST = os.getenv("SOLR_HOST", "localhost")
 SOLR_PORT = os.getenv("SOLR_PORT", "8983")
@@ -37,201 +58,760 @@ EMBEDDING_MODEL_NAME = 'models/text-embedding-004' # Modelo de Google
 LLM_NAME = 'gemini-flash-latest'
 MODEL_DIMENSION = 768 # ¡Importante!
 
+# Configuración de generación y de seguridad (ajusta según necesidad)
+GENERATION_CONFIG = {
+    "temperature": 0.5,
+    "top_p": 1,
+    "top_k": 1,
+    "max_output_tokens": 8192
+}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+# Presupuestos de tokens por defecto (cada petición puede reducirlos)
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "16000"))
+MAX_OUTPUT_TOKENS = int(os.getenv("MAX_OUTPUT_TOKENS", str(GENERATION_CONFIG["max_output_tokens"])))
+
+# k adaptativo: 'k' pasa a ser un máximo y la lista se corta por relevancia
+# con los umbrales calibrados por calibrate_adaptive_k.py (evaluador)
+ADAPTIVE_K = os.getenv("ADAPTIVE_K", "false").lower() == "true"
+ADAPTIVE_MIN_K = int(os.getenv("ADAPTIVE_MIN_K", "1"))
+ADAPTIVE_K_CALIBRATION_PATH = os.getenv("ADAPTIVE_K_CALIBRATION_PATH", "/reports/adaptive_k_calibration.json")
+
+# Compresión de respuestas (gzip/brotli negociado) y caché del front estático
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+STATIC_MAX_AGE_SEC = int(os.getenv("STATIC_MAX_AGE_SEC", "3600"))
+
+# Registro de consultas populares (acotado; ver warmup.QueryLog)
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "/cache/query_log.sqlite3")
+QUERY_LOG_MAX_ENTRIES = int(os.getenv("QUERY_LOG_MAX_ENTRIES", "5000"))
+QUERY_LOG_MAX_CHARS = int(os.getenv("QUERY_LOG_MAX_CHARS", "300"))
+QUERY_LOG_TTL_DAYS = float(os.getenv("QUERY_LOG_TTL_DAYS", "30"))
+QUERY_LOG_FLUSH_SEC = float(os.getenv("QUERY_LOG_FLUSH_SEC", "10"))
+
+# Warm-up al arrancar y tras cada reindexación (consultas populares y, opcionalmente, el Gold Standard)
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "200"))
+WARMUP_MIN_COUNT = int(os.getenv("WARMUP_MIN_COUNT", "2"))
+WARMUP_GOLD_STANDARD = os.getenv("WARMUP_GOLD_STANDARD", "false").lower() == "true"
+WARMUP_GOLD_STANDARD_PATH = os.getenv("WARMUP_GOLD_STANDARD_PATH", "/reports/gold_standard.json")
+WARMUP_K = int(os.getenv("WARMUP_K", "5"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_STATE_DIR = os.getenv("WARMUP_STATE_DIR", "/cache")
+# /ready espera a que el warm-up inicial cubra esta fracción (0 = no espera),
+# como mucho WARMUP_MAX_WAIT_SEC
+WARMUP_READY_COVERAGE = float(os.getenv("WARMUP_READY_COVERAGE", "0"))
+WARMUP_MAX_WAIT_SEC = float(os.getenv("WARMUP_MAX_WAIT_SEC", "120"))
+
+# Token de los endpoints /admin y del perfilado a petición (vacío = desactivados)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Grabación/reproducción de las llamadas a Gemini (generación y embeddings):
+# "off" | "record" | "replay" (sin red, determinista) | "auto"
+RECORD_REPLAY_MODE = os.getenv("RECORD_REPLAY_MODE", "off").lower()
+RECORD_REPLAY_PATH = os.getenv("RECORD_REPLAY_PATH", "/cache/record_replay.sqlite3")
+
 # Constantes de la colección de Milvus (deben coincidir con index_milvus.py)
 COLLECTION_NAME = "taller_rag_corpus"
-TEXT_FIELD_NAME = "text_content"
 VECTOR_FIELD_NAME = "vector_embedding"
+VERSION_FIELD_NAME = "index_version" # Versión de la reindexación (colecciones nuevas)
+
+# Almacén local de chunks escrito por el indexer (docstore.py). Milvus sólo
+# guarda ids + vectores; el texto y la fuente se hidratan desde aquí.
+DOCSTORE_PATH = os.getenv("DOCSTORE_PATH", "/data/docstore")
+# Si no existía al arrancar (la API suele arrancar antes que el indexer), se
+# reintenta abrirlo como mucho cada DOCSTORE_RETRY_SEC
+DOCSTORE_RETRY_SEC = float(os.getenv("DOCSTORE_RETRY_SEC", "5"))
+
+# Tesauro compilado por el indexer (parse_tesauro.py)
+TESAURO_CACHE_PATH = os.getenv("TESAURO_CACHE_PATH", "/data/tesauro_compilado.json")
+# Expansión por defecto de las consultas a Milvus: "none" | "append" | "multi"
+TESAURO_EXPANSION_MODE = os.getenv("TESAURO_EXPANSION_MODE", "none")
+TESAURO_MAX_VARIANTS = int(os.getenv("TESAURO_MAX_VARIANTS", "3"))
+RRF_K = 60 # Constante de Reciprocal Rank Fusion
+
+# Micro-batching de embeddings + búsquedas en Milvus bajo carga concurrente
+MILVUS_BATCH_WINDOW_MS = float(os.getenv("MILVUS_BATCH_WINDOW_MS", "5"))
+MILVUS_BATCH_MAX_SIZE = int(os.getenv("MILVUS_BATCH_MAX_SIZE", "32"))
+MILVUS_MAX_CONCURRENT_BATCHES = int(os.getenv("MILVUS_MAX_CONCURRENT_BATCHES", "4"))
+# Si la colección no tiene particiones por capítulo (índice antiguo), se
+# busca en toda la colección pidiendo este múltiplo de k y se post-filtra
+MILVUS_FILTER_OVERFETCH = int(os.getenv("MILVUS_FILTER_OVERFETCH", "4"))
+MILVUS_SEARCH_PARAMS = {
+    "metric_type": "L2",
+    "params": {"nprobe": 10}
+}
+
+# --- Control de admisión y protección de Gemini ---
+RETRIEVAL_MAX_CONCURRENCY = int(os.getenv("RETRIEVAL_MAX_CONCURRENCY", "16"))
+RETRIEVAL_MAX_QUEUE = int(os.getenv("RETRIEVAL_MAX_QUEUE", "64"))
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "4"))
+GENERATION_MAX_QUEUE = int(os.getenv("GENERATION_MAX_QUEUE", "16"))
+ADMISSION_MAX_WAIT_SEC = float(os.getenv("ADMISSION_MAX_WAIT_SEC", "10"))
+REQUEST_DEADLINE_SEC = float(os.getenv("REQUEST_DEADLINE_SEC", "60"))
+MAX_REQUEST_DEADLINE_SEC = float(os.getenv("MAX_REQUEST_DEADLINE_SEC", "300")) # Máximo que puede pedir un cliente
+GENERATION_TIMEOUT_SEC = float(os.getenv("GENERATION_TIMEOUT_SEC", "45"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SEC = float(os.getenv("CIRCUIT_RESET_SEC", "30"))
+# Modo degradado: si la generación no está disponible, devolver sólo los documentos
+DEGRADED_MODE = os.getenv("DEGRADED_MODE", "false").lower() == "true"
 
 # Diccionario global para almacenar los modelos cargados
 models = {}
 
-# --- Context Manager "Lifespan" ---
-# Carga los modelos pesados (IA) una sola vez al iniciar la API 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("Iniciando API...")
-    
-    load_dotenv()
-    # 2. Configurar y cargar el LLM de Google
+def open_milvus_collection():
+    """
+    Abre la colección por su alias (COLLECTION_NAME). Las búsquedas se
+    resuelven contra el alias en cada llamada, así que cuando el indexer lo
+    mueve a una versión nueva la API la usa sin reiniciar.
+    """
+    try:
+        collection = Collection(COLLECTION_NAME)
+        collection.load()
+        # Las colecciones anteriores a este campo no guardan la versión
+        models["milvus_versioned"] = VERSION_FIELD_NAME in {field.name for field in collection.schema.fields}
+        models["milvus_collection"] = collection
+        print(f"Colección de Milvus '{COLLECTION_NAME}' cargada.")
+    except Exception as e:
+        print(f"Error al cargar la colección de Milvus: {e}")
+        models["milvus_collection"] = None
+    return models["milvus_collection"]
+
+def open_docstore():
+    """Abre el almacén de documentos versionado (None si aún no hay ninguno)."""
+    try:
+        models["docstore"] = VersionedDocStore(DOCSTORE_PATH)
+        print(f"Almacén de documentos cargado: {len(models['docstore'])} chunks.")
+    except Exception as e:
+        print(f"Error al abrir el almacén de documentos en {DOCSTORE_PATH}: {e}")
+        models["docstore"] = None
+    return models["docstore"]
+
+def get_docstore():
+    """
+    Almacén en servicio. Si no se pudo abrir al arrancar se reintenta aquí
+    (como open_milvus_collection), así que la API lo usa en cuanto el indexer
+    publica la primera versión, sin reiniciar.
+    """
+    docstore = models.get("docstore")
+    if docstore is None and time.monotonic() >= models.get("docstore_retry_at", 0.0):
+        models["docstore_retry_at"] = time.monotonic() + DOCSTORE_RETRY_SEC
+        docstore = open_docstore()
+    return docstore
+
+# Peticiones /ask en curso, para que las duplicadas concurrentes compartan cómputo
+inflight_requests = SingleFlight()
+
+# Perfilado de /ask: a petición (cabecera X-Profile) o de las peticiones lentas
+request_profiler = Profiler(PROFILE_DIR, PROFILE_KEEP, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_SLOW_THRESHOLD_SEC)
+
+# Conteo de tokens (estimación local calibrada con Gemini) y totales
+token_meter = TokenMeter()
+
+# Límites por etapa y circuit breaker alrededor de Gemini
+retrieval_limiter = ConcurrencyLimiter("recuperación", RETRIEVAL_MAX_CONCURRENCY, RETRIEVAL_MAX_QUEUE, ADMISSION_MAX_WAIT_SEC)
+generation_limiter = ConcurrencyLimiter("generación", GENERATION_MAX_CONCURRENCY, GENERATION_MAX_QUEUE, ADMISSION_MAX_WAIT_SEC)
+gemini_breaker = CircuitBreaker("gemini", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SEC)
+
+class GenerationError(Exception):
+    """Fallo de la llamada a Gemini (cuota, red, timeout...), no un bloqueo de contenido."""
+
+class GenerationUnavailable(Exception):
+    """La generación se rechazó o falló; conserva los documentos para el modo degradado."""
+
+    def __init__(self, cause: Exception, source_documents: list, retrieval_latency: float):
+        super().__init__(str(cause))
+        self.detail = getattr(cause, "detail", f"Error al generar la respuesta: {cause}")
+        self.status_code = getattr(cause, "status_code", 503)
+        self.retry_after = getattr(cause, "retry_after", 5)
+        self.source_documents = source_documents
+        self.retrieval_latency = retrieval_latency
+
+# --- Fases de arranque (independientes; se ejecutan en paralelo) ---
+def setup_gemini():
+    # Configurar y cargar el LLM de Google
     print(f"Configurando modelo generador (LLM) de Google: {LLM_NAME}")
     try:
+        # Configurar el modelo de Embeddings de Google
+        print(f"Configurando modelo de embeddings de Google: {EMBEDDING_MODEL_NAME}")
+        models["embedding_model"] = EMBEDDING_MODEL_NAME # Solo guardamos el nombre
+        
         api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key and RECORD_REPLAY_MODE == "replay":
+            # En replay todo sale del cassette: no hace falta la API de Google
+            print("Modo replay: Gemini no se configura.")
+            models["llm_model"] = None
+            return
         if not api_key:
             raise ValueError("GOOGLE_API_KEY no encontrada. Asegúrate de definirla en el .env")
         
         genai.configure(api_key=api_key)
         
-        # Configuración de seguridad (ajusta según necesidad)
-        generation_config = {
-            "temperature": 0.5,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 8192
-        }
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        
-        print("Características de seguridad actuales:",safety_settings)
+        print("Características de seguridad actuales:",SAFETY_SETTINGS)
         
         models["llm_model"] = genai.GenerativeModel(
             model_name=LLM_NAME,
-            generation_config=generation_config,
-            safety_settings=safety_settings
+            generation_config=GENERATION_CONFIG,
+            safety_settings=SAFETY_SETTINGS
         )
         print("Modelo Generador de Google cargado.")
         
-        # 2. Configurar el modelo de Embeddings de Google
-        #    (Ya no cargamos SentenceTransformer)
-        print(f"Configurando modelo de embeddings de Google: {EMBEDDING_MODEL_NAME}")
-        models["embedding_model"] = EMBEDDING_MODEL_NAME # Solo guardamos el nombre
-        
     except Exception as e:
         print(f"Error fatal al cargar el modelo de Google: {e}")
         models["llm_model"] = None 
         models["embedding_model"] = None
-        
+        raise
+
+def setup_tesauro():
+    # Cargar el tesauro compilado para la expansión de consultas
+    try:
+        models["synonym_matcher"] = load_synonym_matcher(TESAURO_CACHE_PATH)
+        print(f"Tesauro cargado: {len(models['synonym_matcher'])} grupos de sinónimos.")
+    except Exception as e:
+        print(f"Tesauro no disponible ({e}). Las consultas a Milvus no se expandirán.")
+        models["synonym_matcher"] = None
+        raise
+
+def setup_docstore():
+    # Abrir el almacén local de documentos (texto de los chunks por id)
+    models["docstore_retry_at"] = time.monotonic() + DOCSTORE_RETRY_SEC
+    if open_docstore() is None:
+        raise Exception(f"Almacén de documentos no disponible en {DOCSTORE_PATH}.")
+
+def setup_milvus():
     print("Conectando a Milvus...")
     connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
-    
     # Cargar la colección de Milvus en memoria para búsquedas rápidas
+    if open_milvus_collection() is None:
+        raise Exception(f"Colección '{COLLECTION_NAME}' no disponible.")
+
+def setup_shared_cache():
+    # Caché compartida entre workers (cada worker abre su propia conexión)
     try:
-        collection = Collection(COLLECTION_NAME)
-        collection.load()
-        models["milvus_collection"] = collection
-        print(f"Colección de Milvus '{COLLECTION_NAME}' cargada.")
+        models["shared_cache"] = open_shared_cache()
+        if models["shared_cache"] is not None:
+            print(f"Caché compartida: {models['shared_cache'].describe()}")
     except Exception as e:
-        print(f"Error al cargar la colección de Milvus: {e}")
-        models["milvus_collection"] = None
+        print(f"Caché compartida no disponible ({e}). Se continúa sin caché.")
+        models["shared_cache"] = None
+        raise
+
+def setup_record_replay():
+    # Cassette de grabación/reproducción de llamadas a Gemini (opcional)
+    models["cassette"] = open_cassette(RECORD_REPLAY_PATH, RECORD_REPLAY_MODE)
+    if models["cassette"] is not None:
+        print(f"Record/replay en modo '{RECORD_REPLAY_MODE}': {RECORD_REPLAY_PATH}")
+
+def setup_adaptive_k():
+    # Umbrales del k adaptativo (calibrados si existe el archivo)
+    models["adaptive_thresholds"] = load_thresholds(ADAPTIVE_K_CALIBRATION_PATH)
+    print(f"Umbrales de k adaptativo: {models['adaptive_thresholds']}")
+
+def setup_query_log():
+    # Registro de consultas y estado del warm-up (compartidos por los workers)
+    models["query_log"] = None
+    if QUERY_LOG_ENABLED:
+        models["query_log"] = QueryLog(QUERY_LOG_PATH, QUERY_LOG_MAX_ENTRIES, QUERY_LOG_MAX_CHARS, QUERY_LOG_TTL_DAYS)
+    models["warmer"] = Warmer(warm_query, WARMUP_CONCURRENCY, WARMUP_STATE_DIR)
 
+def check_solr():
+    models["solr_ok"] = False
+    pysolr.Solr(SOLR_URL, timeout=10).ping()
+    models["solr_ok"] = True
+
+# Informe de arranque (tiempos por fase); /ready lo expone
+startup_report = StartupReport()
+
+async def run_startup():
+    await startup_report.run_concurrently({
+        "gemini": setup_gemini,
+        "tesauro": setup_tesauro,
+        "docstore": setup_docstore,
+        "milvus": setup_milvus,
+        "shared_cache": setup_shared_cache,
+        "record_replay": setup_record_replay,
+        "adaptive_k": setup_adaptive_k,
+        "query_log": setup_query_log,
+        "solr": check_solr
+    })
+    startup_report.print_report()
     print("--- API Lista y Modelos Cargados ---")
+    start_warmup()
+    models["maintenance_task"] = asyncio.create_task(maintenance_loop())
+
+# --- Warm-up de cachés y registro de consultas ---
+# Primera vez que el warm-up inicial cubrió WARMUP_READY_COVERAGE (después ya no bloquea /ready)
+initial_warmup_ready = False
+
+async def warm_query(query: str):
+    """Pasa una consulta por la recuperación (sin generación) para cebar las cachés."""
+    await run_in_thread(rag_with_solr, query, WARMUP_K)     # Cachés de Solr
+    await rag_with_milvus(query, WARMUP_K)                  # Embeddings (caché compartida) + Milvus
+
+def index_version() -> str:
+    """Versión del índice en servicio (la del almacén de documentos publicado)."""
+    docstore = get_docstore()
+    if docstore is None:
+        return "sin-docstore"
+    docstore.current() # Relee el puntero CURRENT si cambió
+    return docstore.version or "sin-versiones"
+
+def warmup_queries() -> List[str]:
+    queries = []
+    if models.get("query_log") is not None:
+        queries += models["query_log"].top(WARMUP_TOP_N, WARMUP_MIN_COUNT)
+    if WARMUP_GOLD_STANDARD:
+        queries += load_gold_standard_queries(WARMUP_GOLD_STANDARD_PATH)
+    return list(dict.fromkeys(queries))
+
+def start_warmup():
+    """Lanza el warm-up de la versión actual del índice en segundo plano."""
+    warmer = models.get("warmer")
+    if warmer is None or warmer.running:
+        return
+    models["warmup_index_version"] = index_version()
+    key = warmup_key(models["warmup_index_version"])
+
+    async def run():
+        queries = await asyncio.to_thread(warmup_queries)
+        await warmer.run(queries, key)
+    models["warmup_task"] = asyncio.create_task(run())
+
+async def maintenance_loop():
+    """
+    Vuelca el registro de consultas, re-calienta cuando cambia la versión del
+    índice y reintenta los backends de recuperación que fallaron al arrancar.
+    """
+    while True:
+        await asyncio.sleep(QUERY_LOG_FLUSH_SEC)
+        try:
+            if not models.get("solr_ok"):
+                try:
+                    await asyncio.to_thread(check_solr)
+                    print("Solr disponible.")
+                except Exception as e:
+                    print(f"Solr sigue sin responder: {e}")
+            if models.get("milvus_collection") is None:
+                await asyncio.to_thread(open_milvus_collection)
+            if models.get("query_log") is not None:
+                await asyncio.to_thread(models["query_log"].flush)
+            if await asyncio.to_thread(index_version) != models.get("warmup_index_version"):
+                print("Nueva versión del índice: warm-up de cachés.")
+                # Releer el esquema de la colección a la que apunta ahora el
+                # alias (la primera reindexación con versiones añade el campo)
+                await asyncio.to_thread(open_milvus_collection)
+                start_warmup()
+        except Exception as e:
+            print(f"Error en el mantenimiento periódico: {e}")
+
+def warmup_ready() -> bool:
+    """El warm-up inicial alcanzó la cobertura pedida (o terminó, o se agotó la espera)."""
+    global initial_warmup_ready
+    if initial_warmup_ready or WARMUP_READY_COVERAGE <= 0:
+        return True
+    warmer = models.get("warmer")
+    if warmer is None:
+        return True
+    if warmer.version is None:
+        return False # Aún no ha empezado
+    if (not warmer.running or warmer.coverage >= WARMUP_READY_COVERAGE
+            or time.monotonic() - warmer.started_at > WARMUP_MAX_WAIT_SEC):
+        initial_warmup_ready = True
+    return initial_warmup_ready
+
+def llm_state() -> str:
+    """Estado de la generación: "ok", "replay" (sale del cassette) o "unavailable"."""
+    if models.get("llm_model") is not None:
+        return "ok"
+    if models.get("cassette") is not None and RECORD_REPLAY_MODE == "replay":
+        return "replay"
+    return "unavailable"
+
+def retrieval_available() -> bool:
+    """Algún backend de recuperación responde (Solr o la colección de Milvus)."""
+    return bool(models.get("solr_ok")) or models.get("milvus_collection") is not None
+
+def is_ready() -> bool:
+    """
+    Lista para atender /ask: arranque terminado y recuperación disponible.
+    Sin LLM sigue lista: /ask responde en modo degradado (sólo documentos)
+    o 503 según allow_degraded; /ready lo indica en 'llm'.
+    """
+    return startup_report.done and retrieval_available() and warmup_ready()
+
+# --- Context Manager "Lifespan" ---
+# Arranca las fases pesadas en segundo plano: el proceso responde /health
+# (liveness) de inmediato y /ready (readiness) cuando todo está cargado.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Iniciando API...")
+    
+    load_dotenv()
+
+    # Micro-batcher para las consultas concurrentes a Milvus
+    models["milvus_batcher"] = MicroBatcher(
+        embed_and_search_batch,
+        max_batch_size=MILVUS_BATCH_MAX_SIZE,
+        window_ms=MILVUS_BATCH_WINDOW_MS,
+        max_concurrent_batches=MILVUS_MAX_CONCURRENT_BATCHES,
+        name="milvus_batcher"
+    )
+    models["milvus_batcher"].start()
+
+    startup_task = asyncio.create_task(run_startup())
     
     yield
     
     # Código de limpieza al apagar la API
     print("Apagando API...")
+    await startup_task
+    for task_name in ("maintenance_task", "warmup_task"):
+        if models.get(task_name) is not None:
+            models[task_name].cancel()
+    await models["milvus_batcher"].stop()
     connections.disconnect(MILVUS_ALIAS)
+    if models.get("docstore") is not None:
+        models["docstore"].close()
+    if models.get("shared_cache") is not None:
+        models["shared_cache"].close()
+    if models.get("cassette") is not None:
+        models["cassette"].close()
+    if models.get("query_log") is not None:
+        models["query_log"].close() # Vuelca lo pendiente
     models.clear()
     print("Recursos liberados.")
 
 # --- Inicialización de FastAPI ---
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
 
 # --- Modelos Pydantic (Request/Response) --- [cite: 168, 169]
 class AskRequest(BaseModel):
     query: str
     backend: str # "solr" | "milvus" [cite: 50]
     k: int = 3   # Número de documentos a recuperar [cite: 51]
+    # Expansión con el tesauro (sólo Milvus); se valida aunque el tesauro no esté cargado
+    expansion: Optional[Literal["none", "append", "multi"]] = None
+    content_mode: str = "full" # Contenido de source_documents: "full" | "highlight" | "snippet"
+    # Presupuesto de tiempo de la petición (por defecto REQUEST_DEADLINE_SEC)
+    deadline_sec: Optional[float] = Field(default=None, gt=0, le=MAX_REQUEST_DEADLINE_SEC)
+    allow_degraded: Optional[bool] = None # Devolver sólo documentos si no se puede generar (por defecto DEGRADED_MODE)
+    # Filtros opcionales (restringen la búsqueda a una parte del corpus)
+    source_documents: Optional[List[str]] = None # Archivos fuente, ej. ["14-Las FARC.txt"]
+    chapter_from: Optional[int] = None # Capítulo inicial (prefijo numérico del archivo), inclusive
+    chapter_to: Optional[int] = None   # Capítulo final, inclusive
+    # Presupuestos de generación (acotan la latencia y el coste de la petición)
+    max_input_tokens: Optional[int] = None  # Tokens del prompt; el contexto se recorta (por defecto MAX_INPUT_TOKENS)
+    max_output_tokens: Optional[int] = None # Tokens de la respuesta (por defecto MAX_OUTPUT_TOKENS)
+    latency_budget_sec: Optional[float] = None # Reduce max_output_tokens según la velocidad medida de Gemini
+    adaptive_k: Optional[bool] = None # Cortar por relevancia; 'k' pasa a ser un máximo (por defecto ADAPTIVE_K)
+    generate: bool = True # False: sólo recuperación (sin llamar a Gemini)
 
 class SourceDocument(BaseModel):
     id: str
     content: str
     source_file: str
+    score: Optional[float] = None # Solr: score BM25 (mayor es mejor). Milvus: distancia L2 (menor es mejor)
+    # Pasajes resaltados por Solr (no se serializan; ver to_response_documents)
+    _highlight: Optional[str] = PrivateAttr(default=None)
+
+class TokenUsage(BaseModel):
+    prompt_tokens: int
+    output_tokens: int
+    estimated: bool          # True si los conteos son la aproximación local (sin datos de Gemini)
+    max_output_tokens: int   # Límite aplicado a esta generación
+    context_documents: int   # Documentos (o fragmentos) que entraron en el prompt
+    context_truncated: bool  # True si el contexto se recortó para caber en max_input_tokens
 
 class AskResponse(BaseModel):
     answer: str
     source_documents: List[SourceDocument] # Para trazabilidad [cite: 57, 169, 193]
     retrieval_latency_sec: float
+    degraded: bool = False # True si 'answer' está vacío porque no se pudo generar (no disponible o sin sitio para el contexto)
+    token_usage: Optional[TokenUsage] = None # None si no hubo generación
     
+# --- Hidratación de documentos desde el almacén local ---
+def hydrate_document(doc_id: str, content: str = '', source_file: str = 'N/A',
+                     score: Optional[float] = None, version: Optional[str] = None) -> Optional[SourceDocument]:
+    """
+    Construye el SourceDocument de un id con el texto del almacén local, en
+    la versión del índice que lo devolvió ('version'; None = la publicada).
+    'content'/'source_file' se usan si el almacén no está disponible.
+    """
+    docstore = models.get("docstore")
+    if docstore is not None:
+        stored = docstore.get(doc_id, version)
+        if stored is None:
+            print(f"Advertencia: id '{doc_id}' no está en el almacén de documentos.")
+            return None
+        content, source_file = stored
+    return SourceDocument(id=doc_id, content=content, source_file=source_file, score=score)
+
 # --- Lógica RAG: Solr (Léxico) --- 
-def rag_with_solr(query: str, k: int) -> List[SourceDocument]:
+def rag_with_solr(query: str, k: int, highlight: bool = False, sources: Optional[List[str]] = None) -> List[SourceDocument]:
     print(f"Recuperando (Solr) k={k} para: '{query}'")
     try:
         # 1. Conectar a Solr [cite: 178]
         solr = pysolr.Solr(SOLR_URL, always_commit=True, timeout=10)
 
         # 2. Ejecutar consulta BM25 [cite: 179]
-        # (Usamos los campos que definimos en index_solr.py)
-        search_params = {
-            "fl": "id, source_document_s, text_content_txt_es", # Campos a devolver
-            "rows": k
-        }
+        # (edismax sobre los campos que definimos en index_solr.py; el texto
+        #  del usuario se escapa para que no pueda inyectar sintaxis de Lucene)
+        # Con almacén local sólo se piden los ids (respuesta de Solr mínima)
+        fl = SOLR_FL_IDS if get_docstore() is not None else SOLR_FL_FULL
+        solr_q, search_params = build_solr_query(query, k, f"{fl}, score")
+        if not solr_q:
+            return [], 0.0
+        if highlight:
+            search_params.update(solr_highlight_params())
+        if sources:
+            # Filtro por documento fuente en 'fq' (cacheado en el filterCache de Solr)
+            search_params["fq"] = solr_source_fq(sources)
         start_search = time.time()
-        results = solr.search(q=f"text_content_txt_es:({query})", **search_params)
+        with profile_stage("solr_search"):
+            results = solr.search(q=solr_q, **search_params)
         retrieval_time = time.time() - start_search        
         
         # 3. Recolectar contexto y fuentes [cite: 181]
         documents = []
         if results.hits > 0:
+            highlighting = getattr(results, 'highlighting', None) or {}
             for doc in results.docs:
-                documents.append(
-                    SourceDocument(
-                        id=doc.get('id', 'N/A'),
-                        content=doc.get('text_content_txt_es', ''),
-                        source_file=doc.get('source_document_s', 'N/A')
-                    )
+                document = hydrate_document(
+                    doc.get('id', 'N/A'),
+                    content=doc.get('text_content_txt_es', ''),
+                    source_file=doc.get('source_document_s', 'N/A'),
+                    score=doc.get('score'),
+                    version=doc.get('index_version_s')
                 )
+                if document is None:
+                    continue
+                document._highlight = solr_highlight_text(highlighting, document.id)
+                documents.append(document)
         return documents, retrieval_time
         
     except Exception as e:
         print(f"Error en rag_with_solr: {e}")
-        return []
+        return [], 0.0
 
 # --- Lógica RAG: Milvus (Vectorial) --- 
-def rag_with_milvus(query: str, k: int) -> List[SourceDocument]:
-    print(f"Recuperando (Milvus) k={k} para: '{query}'")
+def expand_query(query: str, mode: str) -> List[str]:
+    """
+    Expande la consulta con el tesauro. Devuelve la lista de textos a
+    embeber: uno solo ("none"/"append") o la original más variantes ("multi").
+    """
+    matcher = models.get("synonym_matcher")
+    if matcher is None or mode in (None, "none"):
+        return [query]
+
+    start_match = time.perf_counter()
+    if mode == "append":
+        queries = [matcher.expand_append(query)]
+    elif mode == "multi":
+        queries = matcher.expand_variants(query, TESAURO_MAX_VARIANTS)
+    else:
+        raise HTTPException(status_code=400, detail="Expansión no válida. Use 'none', 'append' o 'multi'.")
+    print(f"Tesauro: {len(queries)} consulta(s) en {(time.perf_counter() - start_match) * 1000:.3f}ms")
+    return queries
+
+def hit_version(hit) -> Optional[str]:
+    """Versión del índice que devolvió el hit (None en colecciones sin ese campo)."""
     try:
-        collection = models.get("milvus_collection")    
-        model_name = models.get("embedding_model")
-        if collection is None or model_name is None:
-            raise Exception("Colección de Milvus o modelo de embedding no cargado.")            
-            
-        # 1. Generar embedding del query (USANDO LA API DE GOOGLE)
-        #    Usamos 'retrieval_query' para la tarea de consulta
-        start_embed = time.time()
+        return hit.entity.get(VERSION_FIELD_NAME)
+    except Exception:
+        return None
+
+def fuse_milvus_results(results, k: Optional[int] = None) -> list:
+    """
+    Fusiona las listas de hits de varias consultas con Reciprocal Rank Fusion.
+    Devuelve (id, distancia, versión) en orden; la distancia es la mejor entre
+    variantes (todas salen de la misma búsqueda, así que la versión coincide).
+    """
+    if len(results) == 1:
+        return [(hit.id, hit.distance, hit_version(hit)) for hit in list(results[0])[:k]]
+    scores = {}
+    distances = {}
+    versions = {}
+    for hit_list in results:
+        for rank, hit in enumerate(hit_list):
+            scores[hit.id] = scores.get(hit.id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            distances[hit.id] = min(distances.get(hit.id, hit.distance), hit.distance)
+            versions.setdefault(hit.id, hit_version(hit))
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(hit_id, distances[hit_id], versions[hit_id]) for hit_id in ranked]
+
+def search_milvus(collection, vectors: list, limit: int, partitions: Optional[tuple]):
+    """
+    Búsqueda multi-vector, restringida a las particiones de capítulo si las
+    hay. Con un índice sin particiones se busca en toda la colección con
+    más candidatos (el filtro se aplica después, al hidratar).
+    """
+    search_kwargs = dict(
+        data=vectors,
+        anns_field=VECTOR_FIELD_NAME,
+        param=MILVUS_SEARCH_PARAMS,
+        # Ids, distancias y la versión del índice (el texto sale del almacén local)
+        output_fields=[VERSION_FIELD_NAME] if models.get("milvus_versioned") else None
+    )
+    if partitions:
+        try:
+            return collection.search(limit=limit, partition_names=list(partitions), **search_kwargs)
+        except Exception as e:
+            print(f"Búsqueda por particiones no disponible ({e}). Buscando en toda la colección.")
+            limit *= MILVUS_FILTER_OVERFETCH
+    return collection.search(limit=limit, **search_kwargs)
+
+def embed_queries(model_name: str, queries: List[str], cached: Optional[Dict[str, list]] = None) -> Dict[str, list]:
+    """
+    Embeddings de consultas con la API de Google, pasando por el cassette
+    de record/replay si está activo (clave: modelo, tarea y texto).
+    'cached' son vectores ya conocidos (caché compartida): no se recalculan,
+    pero al grabar también van al cassette, para que el replay los tenga.
+    En modo replay sólo se usa el cassette y las consultas no grabadas no
+    aparecen en el resultado.
+    """
+    cassette = models.get("cassette")
+    replaying = cassette is not None and cassette.mode == "replay"
+    vectors = {} if replaying or not cached else {q: cached[q] for q in queries if q in cached}
+    keys = {q: cassette_key(model_name, "retrieval_query", q) for q in queries}
+
+    from_cassette = set()
+    if cassette is not None:
+        # También las que vienen de la caché: así sólo se graban las que faltan
+        recorded = cassette.get_many("embedding", keys.values())
+        for q, key in keys.items():
+            if key in recorded:
+                vectors[q] = unpack_vector(recorded[key])
+                from_cassette.add(q)
+
+    pending = [q for q in queries if q not in vectors]
+    if pending and not replaying:
         result = genai.embed_content(
             model=model_name,
-            content=query,
+            content=pending,
             task_type="retrieval_query"
         )
-        query_vector = [result['embedding']] # La API devuelve un vector, lo ponemos en una lista
-        print(f"Embedding de consulta generado en {time.time() - start_embed:.4f}s")
-        
-        # 2. Ejecutar búsqueda de similitud [cite: 186]
-        search_params = {
-            "metric_type": "L2",
-            "params": {"nprobe": 10}
-        }
-        
-        start_search = time.time()
-        results = collection.search(
-            data=query_vector,
-            anns_field=VECTOR_FIELD_NAME,
-            param=search_params,
-            limit=k,
-            output_fields=[TEXT_FIELD_NAME, "source_document"]
-        )
-        retrieval_time = time.time() - start_search        
-        
+        vectors.update(zip(pending, result['embedding']))
+    if cassette is not None:
+        # Se graba todo vector usado que no saliera ya del cassette
+        cassette.put_many("embedding", {keys[q]: pack_vector(v) for q, v in vectors.items() if q not in from_cassette})
+    return vectors
+
+def embed_and_search_batch(items: list) -> list:
+    """
+    Procesa un lote de consultas a Milvus (lo invoca el MicroBatcher en un hilo).
+    Cada elemento es (textos_a_embeber, k, particiones). Todas las consultas
+    del lote se embeben en UNA llamada a la API de Google y se buscan con
+    UNA búsqueda multi-vector por cada conjunto distinto de particiones.
+    Devuelve, por elemento, (listas_de_hits, retrieval_time), o ReplayMiss
+    si alguno de sus embeddings no está grabado (sólo falla ese elemento).
+    """
+    collection = models.get("milvus_collection")
+    if collection is None:
+        # Aún no había índice al arrancar la API: reintentar
+        collection = open_milvus_collection()
+    model_name = models.get("embedding_model")
+    if collection is None or model_name is None:
+        raise Exception("Colección de Milvus o modelo de embedding no cargado.")
+    if get_docstore() is None:
+        raise Exception("Almacén de documentos no cargado (Milvus sólo guarda ids y vectores).")
+
+    unique_queries = list(dict.fromkeys(q for queries, _, _ in items for q in queries))
+
+    # 1. Generar embeddings (USANDO LA API DE GOOGLE)
+    #    Usamos 'retrieval_query' para la tarea de consulta. Los ya calculados
+    #    (por este worker o por otro) salen de la caché compartida, salvo en
+    #    replay, donde todo sale del cassette.
+    start_embed = time.time()
+    cache = models.get("shared_cache")
+    cache_namespace = f"emb:{model_name}:retrieval_query"
+    replaying = models.get("cassette") is not None and RECORD_REPLAY_MODE == "replay"
+    cached = {}
+    if cache is not None and not replaying:
+        cached = {q: unpack_vector(data) for q, data in cache.get_many(cache_namespace, unique_queries).items()}
+    known = embed_queries(model_name, unique_queries, cached)
+    computed = {q: v for q, v in known.items() if q not in cached}
+    if cache is not None and computed:
+        cache.set_many(cache_namespace, {q: pack_vector(v) for q, v in computed.items()})
+    print(f"Lote Milvus: {len(unique_queries)} embeddings ({len(computed)} fuera de la caché, "
+          f"{len(items)} peticiones) en {time.time() - start_embed:.4f}s")
+
+    # Vectores de cada petición (las que tienen alguno sin grabar fallan solas)
+    results = [None] * len(items)
+    item_vectors = {}
+    for i, (queries, _, _) in enumerate(items):
+        missing = [q for q in queries if q not in known]
+        if missing:
+            results[i] = ReplayMiss(f"{len(missing)} embeddings no grabados en el cassette.")
+        else:
+            item_vectors[i] = [known[q] for q in queries]
+
+    # 2. Ejecutar búsqueda de similitud [cite: 186], agrupando por particiones
+    groups = {}
+    for i in item_vectors:
+        groups.setdefault(items[i][2], []).append(i)
+
+    start_search = time.time()
+    item_hits = {}
+    for partitions, indices in groups.items():
+        vectors = [v for i in indices for v in item_vectors[i]]
+        search_results = search_milvus(collection, vectors, max(items[i][1] for i in indices), partitions)
+
+        # 3. Repartir los resultados entre las peticiones del grupo
+        position = 0
+        for i in indices:
+            n_queries = len(item_vectors[i])
+            item_hits[i] = [list(search_results[position + j]) for j in range(n_queries)]
+            position += n_queries
+    retrieval_time = time.time() - start_search
+
+    for i, hit_lists in item_hits.items():
+        results[i] = (hit_lists, retrieval_time)
+    return results
+
+async def rag_with_milvus(query: str, k: int, expansion: Optional[str] = None,
+                          sources: Optional[List[str]] = None) -> List[SourceDocument]:
+    print(f"Recuperando (Milvus) k={k} para: '{query}'")
+    try:
+        batcher = models.get("milvus_batcher")
+        if batcher is None:
+            raise Exception("Micro-batcher de Milvus no iniciado.")
+
+        # 0. Expandir la consulta con el tesauro (opcional)
+        queries = expand_query(query, expansion or TESAURO_EXPANSION_MODE)
+        # Particiones de capítulo que cubren los documentos filtrados
+        partitions = tuple(sorted({chapter_partition(s) for s in sources})) if sources else None
+
+        # 1-2. Embedding + búsqueda, agrupados con otras peticiones concurrentes
+        with profile_stage("milvus_batch"):
+            hit_lists, retrieval_time = await batcher.submit((queries, k, partitions))
+
         # 3. Recolectar contexto y fuentes [cite: 187]
+        allowed = set(sources) if sources else None
         documents = []
-        if results and results[0]:
-            for hit in results[0]:
-                entity = hit.entity
-                documents.append(
-                    SourceDocument(
-                        id=hit.id,
-                        content=entity.get(TEXT_FIELD_NAME, ''),
-                        source_file=entity.get('source_document', 'N/A')
-                    )
-                )
+        for hit_id, distance, version in fuse_milvus_results(hit_lists):
+            document = hydrate_document(str(hit_id), score=distance, version=version)
+            if document is None or (allowed is not None and document.source_file not in allowed):
+                continue
+            documents.append(document)
+            if len(documents) == k:
+                break
         return documents, retrieval_time
 
+    except (HTTPException, ReplayMiss):
+        raise
     except Exception as e:
         print(f"Error en rag_with_milvus: {e}")
-        return []
+        return [], 0.0
 
 # --- Lógica RAG: Generación (LLM) --- 
-def generate_answer(query: str, context_docs: List[SourceDocument]) -> str:
-    print(f"Generando respuesta con {LLM_NAME}...")
-    
+def build_prompt(query: str, context: str) -> str:
     # 1. Formatear el Prompt [cite: 191]
-    context = "\n\n".join([doc.content for doc in context_docs])
-    
-    prompt = f"""
+    return f"""
 Usando SÓLO el siguiente contexto, responde la pregunta.
 Si la respuesta no está en el contexto, di "No tengo información suficiente".
 
@@ -242,21 +822,86 @@ Pregunta:
 {query}
 
 Respuesta (en español):
-"""    
+"""
+
+def generate_answer(query: str, context_docs: List[SourceDocument], max_input_tokens: Optional[int] = None,
+                    max_output_tokens: Optional[int] = None,
+                    latency_budget_sec: Optional[float] = None) -> Tuple[str, TokenUsage]:
+    print(f"Generando respuesta con {LLM_NAME}...")
+    
+    # Recortar el contexto para que el prompt completo quepa en max_input_tokens
+    input_limit = min(max_input_tokens or MAX_INPUT_TOKENS, MAX_INPUT_TOKENS)
+    overhead = token_meter.estimate(build_prompt(query, ""))
+    contents, truncated = token_meter.fit_context([doc.content for doc in context_docs], max(0, input_limit - overhead))
+    prompt = build_prompt(query, "\n\n".join(contents))
+    
+    # max_output_tokens adaptado al presupuesto de latencia
+    output_limit = token_meter.output_budget(min(max_output_tokens or MAX_OUTPUT_TOKENS, MAX_OUTPUT_TOKENS), latency_budget_sec)
+    generation_config = {**GENERATION_CONFIG, "max_output_tokens": output_limit}
+    
+    if not contents:
+        # max_input_tokens no deja sitio para el contexto: sin contexto Gemini
+        # sólo podría inventar, así que no se llama (post_ask lo marca degradado)
+        print("El presupuesto de entrada no deja sitio para el contexto; no se genera respuesta.")
+        usage = TokenUsage(prompt_tokens=overhead, output_tokens=0, estimated=True, max_output_tokens=output_limit,
+                           context_documents=0, context_truncated=True)
+        return "", usage
+    
+    cassette = models.get("cassette")
+    if cassette is None:
+        with profile_stage("gemini"):
+            result = call_gemini(prompt, generation_config)
+    else:
+        # Clave: modelo, hash del prompt y configuración de generación
+        key = cassette_key(LLM_NAME, hashlib.sha256(prompt.encode("utf-8")).hexdigest(), generation_config, SAFETY_SETTINGS)
+        with profile_stage("gemini"):
+            result = cassette.call("generate", key, lambda: call_gemini(prompt, generation_config))
+        if isinstance(result, str):
+            # Grabación anterior al conteo de tokens (sólo el texto)
+            result = {"text": result, "prompt_tokens": None, "output_tokens": None}
+    
+    answer = result["text"]
+    usage = TokenUsage(
+        prompt_tokens=result["prompt_tokens"] or token_meter.estimate(prompt),
+        output_tokens=result["output_tokens"] or token_meter.estimate(answer),
+        estimated=not result["prompt_tokens"],
+        max_output_tokens=output_limit,
+        context_documents=len(contents),
+        context_truncated=truncated
+    )
+    token_meter.record(usage.prompt_tokens, usage.output_tokens, truncated)
+    print(f"Tokens: prompt={usage.prompt_tokens}, respuesta={usage.output_tokens}, límite={output_limit}"
+          f"{' (contexto recortado)' if truncated else ''}")
+    return answer, usage
+
+def call_gemini(prompt: str, generation_config: dict) -> dict:
+    """
+    Llamada a Gemini. Devuelve {"text", "prompt_tokens", "output_tokens"}
+    (conteos de 'usage_metadata', None si no vienen). Los bloqueos de
+    contenido devuelven un texto de error.
+    """
     try:
         model = models.get("llm_model")
         if model is None:
             raise Exception("El modelo LLM de Google no está cargado.")
         
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        
         # Llamada a la API de Gemini
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+        start = time.time()
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            safety_settings=SAFETY_SETTINGS,
+            request_options={"timeout": GENERATION_TIMEOUT_SEC}
+        )
+        elapsed = time.time() - start
+        
+        usage = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(usage, "prompt_token_count", None) or None
+        output_tokens = getattr(usage, "candidates_token_count", None) or None
+        token_meter.observe(prompt, prompt_tokens, output_tokens, elapsed)
+        
+        def result(text: str) -> dict:
+            return {"text": text, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
         
         # --- VERIFICACIÓN DE RESPUESTA (CORREGIDA) ---
         
@@ -265,16 +910,16 @@ Respuesta (en español):
             if response.prompt_feedback:
                 error_detail = f"BLOQUEO DE PROMPT. Razón: {response.prompt_feedback.block_reason}. Ratings: {response.prompt_feedback.safety_ratings}"
                 print(f"Error en generate_answer (Gemini): {error_detail}")
-                return f"Error al generar la respuesta: {error_detail}"
+                return result(f"Error al generar la respuesta: {error_detail}")
             else:
-                return "Error al generar la respuesta: Respuesta vacía sin feedback."
+                return result("Error al generar la respuesta: Respuesta vacía sin feedback.")
 
         candidate = response.candidates[0]
         
         # --- CORRECCIÓN CLAVE AQUÍ ---
         # Aceptamos la respuesta si se detuvo (1) O si alcanzó el límite de tokens (2)
         if candidate.finish_reason.value in [1, 2]: # 1 = STOP, 2 = MAX_TOKENS
-            return response.text # Éxito, devuelve el texto (incluso si está truncado)
+            return result(response.text) # Éxito, devuelve el texto (incluso si está truncado)
         # --- FIN DE LA CORRECCIÓN CLAVE ---
 
         # Si no es 1 ni 2, ES un error (SAFETY, RECITATION, OTHER)
@@ -285,67 +930,342 @@ Respuesta (en español):
             error_detail += f"Ratings: [{', '.join(ratings)}]"
         
         print(f"Error en generate_answer (Gemini): {error_detail}")
-        return f"Error al generar la respuesta: {error_detail}"
+        return result(f"Error al generar la respuesta: {error_detail}")
         
     except Exception as e:
+        # Fallo de la llamada (no del contenido): se propaga para el circuit breaker
         print(f"Error en generate_answer (Gemini): {e}")
-        return f"Error al generar larespuesta: {e}"
+        raise GenerationError(str(e)) from e # GenerationUnavailable añade el prefijo
 # --- FIN DE LA MODIFICACIÓN ---
 
-# --- Endpoint Principal de la API ---
-@app.post("/ask", response_model=AskResponse)
-async def post_ask(request: AskRequest):
+# --- Recorte de los documentos devueltos al cliente ---
+def to_response_documents(query: str, documents: List[SourceDocument], content_mode: str) -> List[SourceDocument]:
     """
-    Recibe una consulta y la enruta al backend RAG especificado (Solr o Milvus).
+    El contenido completo sólo hace falta para el prompt. En la respuesta,
+    "highlight" devuelve los pasajes resaltados por Solr (o un fragmento en
+    Milvus) y "snippet" un fragmento acotado alrededor de la consulta.
     """
-    print(f"Petición recibida: backend={request.backend}, k={request.k}")
-    start_time = time.time()
-    
+    if content_mode == "full":
+        return documents
+    response_docs = []
+    for doc in documents:
+        content = doc._highlight if content_mode == "highlight" else None
+        response_docs.append(
+            SourceDocument(
+                id=doc.id,
+                content=content or make_snippet(doc.content, query),
+                source_file=doc.source_file,
+                score=doc.score
+            )
+        )
+    return response_docs
+
+# --- Recuperación + Generación (compartida entre peticiones duplicadas) ---
+async def generate_answer_guarded(query: str, source_documents: List[SourceDocument], deadline: float,
+                                  **budget) -> Tuple[str, TokenUsage]:
+    """
+    Llama a generate_answer respetando el circuit breaker y el límite de concurrencia.
+    'budget' son los presupuestos de tokens/latencia de la petición.
+    Si la petición se cancela o vence su plazo, la llamada a Gemini sigue en su
+    hilo: el hueco de generación y el veredicto del breaker esperan a que acabe.
+    """
+    gemini_breaker.before_call()
+    started = False
+
+    async def call():
+        try:
+            answer = await run_in_thread(generate_answer, query, source_documents, **budget)
+        except GenerationError:
+            gemini_breaker.record_failure()
+            raise
+        except BaseException:
+            gemini_breaker.release()
+            raise
+        gemini_breaker.record_success()
+        return answer
+
+    def start():
+        # Desde aquí la tarea se ejecutará y registrará ella el veredicto
+        nonlocal started
+        started = True
+        return call()
+
+    try:
+        with profile_stage("generation"): # Incluye la espera en la cola de generación
+            return await generation_limiter.run(start, deadline)
+    except BaseException:
+        if not started:
+            # Rechazo o cancelación en la cola: no dice nada sobre la salud de Gemini
+            gemini_breaker.release()
+        raise
+
+def select_adaptive(backend: str, documents: List[SourceDocument], max_input_tokens: Optional[int]) -> List[SourceDocument]:
+    """
+    k adaptativo: ordena por score y corta por relevancia (umbral o salto de
+    score) y, además, deja de añadir documentos cuando el contexto llenaría
+    el presupuesto de tokens de entrada. Conserva al menos ADAPTIVE_MIN_K.
+    """
+    thresholds = (models.get("adaptive_thresholds") or {}).get(backend, {})
+    scores = [doc.score if doc.score is not None else 0.0 for doc in documents]
+    selected = [documents[i] for i in select(backend, scores, thresholds, ADAPTIVE_MIN_K)]
+
+    budget = min(max_input_tokens or MAX_INPUT_TOKENS, MAX_INPUT_TOKENS)
+    used = 0
+    for n, doc in enumerate(selected):
+        used += token_meter.estimate(doc.content)
+        if used > budget and n >= ADAPTIVE_MIN_K:
+            selected = selected[:n]
+            break
+    if len(selected) < len(documents):
+        print(f"k adaptativo ({backend}): {len(selected)} de {len(documents)} documentos.")
+    return selected
+
+def resolve_request_sources(request: AskRequest) -> Optional[List[str]]:
+    """Archivos fuente permitidos por los filtros de la petición (None = sin filtro)."""
+    if request.chapter_from is None and request.chapter_to is None:
+        return resolve_sources([], request.source_documents, None, None)
+    docstore = get_docstore()
+    if docstore is None and not request.source_documents:
+        raise HTTPException(status_code=503, detail="El filtro por capítulos requiere el almacén de documentos.")
+    all_sources = docstore.source_names if docstore is not None else []
+    return resolve_sources(all_sources, request.source_documents, request.chapter_from, request.chapter_to)
+
+async def run_rag(request: AskRequest, deadline: float, sources: Optional[List[str]] = None):
+    """Ejecuta la recuperación y la generación. Devuelve (answer, documentos, latencia, uso de tokens)."""
     source_documents = []
     retrieval_latency = 0.0
     
     # 1. Lógica de Enrutamiento (Dispatch) 
-    if request.backend == "solr":
-        source_documents, retrieval_latency = rag_with_solr(request.query, request.k)
-    elif request.backend == "milvus":
-        source_documents, retrieval_latency = rag_with_milvus(request.query, request.k)
+    if sources is not None and not sources:
+        pass # Los filtros no dejan ningún documento
     else:
-        raise HTTPException(status_code=400, detail="Backend no válido. Use 'solr' o 'milvus'.")
+        with profile_stage("retrieval"): # Incluye la espera en la cola de recuperación
+            async with retrieval_limiter.slot(deadline):
+                if request.backend == "solr":
+                    # Las llamadas bloqueantes van a un hilo para no frenar el event loop
+                    source_documents, retrieval_latency = await run_in_thread(
+                        rag_with_solr, request.query, request.k, request.content_mode == "highlight", sources
+                    )
+                else:
+                    source_documents, retrieval_latency = await rag_with_milvus(
+                        request.query, request.k, request.expansion, sources
+                    )
+        
+    adaptive = ADAPTIVE_K if request.adaptive_k is None else request.adaptive_k
+    if adaptive and source_documents:
+        source_documents = select_adaptive(request.backend, source_documents, request.max_input_tokens)
         
     # 2. Generar Respuesta (si hay contexto)
+    token_usage = None
     if not source_documents:
         answer = "No se encontraron documentos relevantes para la consulta."
+    elif not request.generate:
+        answer = "" # Sólo recuperación
+    elif llm_state() == "unavailable":
+        # Gemini no se pudo configurar al arrancar: no cuenta como fallo para el breaker
+        cause = GenerationError("el modelo LLM de Google no está cargado.")
+        raise GenerationUnavailable(cause, source_documents, retrieval_latency)
     else:
         # Llamamos al generador (el mismo para ambos backends) [cite: 54, 182, 188]
-        answer = generate_answer(request.query, source_documents)
+        try:
+            answer, token_usage = await generate_answer_guarded(
+                request.query, source_documents, deadline,
+                max_input_tokens=request.max_input_tokens,
+                max_output_tokens=request.max_output_tokens,
+                latency_budget_sec=request.latency_budget_sec
+            )
+        except (Overloaded, GenerationError) as e:
+            raise GenerationUnavailable(e, source_documents, retrieval_latency) from e
+    return answer, source_documents, retrieval_latency, token_usage
+
+def coalescing_key(request: AskRequest, sources: Optional[List[str]]) -> tuple:
+    """Clave de coalescencia: sólo los parámetros que cambian el resultado del backend."""
+    if request.backend == "solr":
+        variant = request.content_mode == "highlight"
+    else:
+        variant = request.expansion or TESAURO_EXPANSION_MODE
+    scope = tuple(sources) if sources is not None else None
+    budget = (request.max_input_tokens, request.max_output_tokens, request.latency_budget_sec)
+    adaptive = ADAPTIVE_K if request.adaptive_k is None else request.adaptive_k
+    return (normalize_query(request.query), request.backend, request.k, variant, scope, budget,
+            adaptive, request.generate)
+
+# --- Perfilado de /ask ---
+def is_admin(http_request: Request) -> bool:
+    token = http_request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+@app.middleware("http")
+async def profile_ask_requests(http_request: Request, call_next):
+    """
+    Perfila /ask si se pide (cabecera 'X-Profile: 1' o '?profile=1', con
+    X-Admin-Token) o, si el muestreo de lentas está activo, la guarda cuando
+    supera PROFILE_SLOW_THRESHOLD_SEC. El id del perfil va en 'X-Profile-Id'.
+    """
+    if http_request.url.path != "/ask":
+        return await call_next(http_request)
+    wants_profile = "1" in (http_request.headers.get("X-Profile"), http_request.query_params.get("profile"))
+    async with request_profiler.track("/ask", wants_profile and is_admin(http_request)) as profile:
+        response = await call_next(http_request)
+    if profile is not None and profile.saved:
+        response.headers["X-Profile-Id"] = profile.id
+    return response
+
+# --- Endpoint Principal de la API ---
+@app.post("/ask", response_model=AskResponse)
+async def post_ask(request: AskRequest):
+    """
+    Recibe una consulta y la enruta al backend RAG especificado (Solr o Milvus).
+    Las peticiones idénticas concurrentes esperan un único cómputo compartido.
+    """
+    print(f"Petición recibida: backend={request.backend}, k={request.k}")
+    start_time = time.time()
+    
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="La API se está iniciando.", headers={"Retry-After": "5"})
+    
+    if request.backend not in ("solr", "milvus"):
+        raise HTTPException(status_code=400, detail="Backend no válido. Use 'solr' o 'milvus'.")
+    if request.content_mode not in ("full", "highlight", "snippet"):
+        raise HTTPException(status_code=400, detail="content_mode no válido. Use 'full', 'highlight' o 'snippet'.")
+    for budget in ("max_input_tokens", "max_output_tokens", "latency_budget_sec"):
+        if getattr(request, budget) is not None and getattr(request, budget) <= 0:
+            raise HTTPException(status_code=400, detail=f"{budget} debe ser positivo.")
+
+    sources = resolve_request_sources(request)
+    deadline = time.monotonic() + (request.deadline_sec or REQUEST_DEADLINE_SEC)
+    degraded = False
+    key = coalescing_key(request, sources)
+    # Las peticiones que se suman a un cómputo en curso sólo esperan: en su
+    # perfil ese tiempo aparece como etapa "coalesced"
+    waiting = profile_stage("coalesced") if key in inflight_requests else nullcontext()
+    try:
+        with waiting:
+            answer, source_documents, retrieval_latency, token_usage = await inflight_requests.do(
+                key, lambda: run_rag(request, deadline, sources)
+            )
+    except Overloaded as e:
+        # Recuperación saturada: rechazar rápido en lugar de encolar sin límite
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    except ReplayMiss as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except GenerationUnavailable as e:
+        allow_degraded = DEGRADED_MODE if request.allow_degraded is None else request.allow_degraded
+        if not allow_degraded:
+            raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+        # Modo degradado: sólo recuperación, sin respuesta generada
+        print(f"Modo degradado: {e.detail}")
+        answer, source_documents, retrieval_latency = "", e.source_documents, e.retrieval_latency
+        token_usage = None
+        degraded = True
+    if token_usage is not None and token_usage.context_documents == 0:
+        degraded = True # Sin sitio para el contexto: sólo documentos
 
     end_time = time.time()
     print(f"Respuesta generada en {end_time - start_time:.2f} segundos.")
+    if models.get("query_log") is not None:
+        models["query_log"].record(request.query) # Sólo en memoria; se vuelca periódicamente
 
     # 3. Devolver respuesta con trazabilidad [cite: 57, 193]
-    return AskResponse(
+    response = AskResponse(
         answer=answer,
-        source_documents=source_documents,
-        retrieval_latency_sec=retrieval_latency
+        source_documents=to_response_documents(request.query, source_documents, request.content_mode),
+        retrieval_latency_sec=retrieval_latency,
+        degraded=degraded,
+        token_usage=token_usage
     )
+    # Serialización directa con pydantic-core: al devolver un Response, FastAPI
+    # no vuelve a validar el modelo contra response_model ni pasa por jsonable_encoder
+    return Response(content=response.model_dump_json(), media_type="application/json")
 
-# Endpoint de salud para verificar que la API esté viva
+# --- Endpoints de administración (requieren X-Admin-Token) ---
+def require_admin(http_request: Request):
+    if not is_admin(http_request):
+        # Sin ADMIN_TOKEN configurado los endpoints no existen
+        raise HTTPException(status_code=404 if not ADMIN_TOKEN else 403, detail="No autorizado.")
+
+@app.get("/admin/profiles")
+async def list_profiles(http_request: Request):
+    """Últimos perfiles guardados (sin las muestras)."""
+    require_admin(http_request)
+    return await asyncio.to_thread(request_profiler.list_profiles)
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, http_request: Request, format: str = "json"):
+    """Un perfil completo; con ?format=folded, las pilas para flamegraph/speedscope."""
+    require_admin(http_request)
+    profile = await asyncio.to_thread(request_profiler.load, profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado.")
+    if format == "folded":
+        return PlainTextResponse(folded_text(profile))
+    return profile
+
+# Endpoint de disponibilidad (readiness): 200 sólo cuando puede atender /ask
+@app.get("/ready")
+async def ready_check():
+    warmer = models.get("warmer")
+    body = {
+        "ready": is_ready(),
+        "startup": startup_report.summary(),
+        "retrieval": {"solr": bool(models.get("solr_ok")), "milvus": models.get("milvus_collection") is not None},
+        "llm": llm_state(), # "unavailable": /ask sólo en modo degradado
+        "warmup": warmer.summary() if warmer is not None else None
+    }
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+# Endpoint de salud para verificar que la API esté viva (liveness)
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "models_loaded": list(models.keys())}
+    return {
+        "status": "ok",
+        "worker_pid": os.getpid(), # Con varios workers, cada uno responde por sí mismo
+        "models_loaded": list(models.keys()),
+        "inflight_requests": len(inflight_requests),
+        "coalesced_requests": inflight_requests.coalesced,
+        "admission": {
+            "retrieval": retrieval_limiter.stats(),
+            "generation": generation_limiter.stats(),
+            "gemini_breaker": gemini_breaker.stats()
+        },
+        "shared_cache": models["shared_cache"].stats.as_dict() if models.get("shared_cache") else None,
+        "record_replay": models["cassette"].stats() if models.get("cassette") else None,
+        "tokens": token_meter.stats(),
+        "compression": compression_stats.as_dict()
+    }
 
 
 # --- NUEVOS ENDPOINTS PARA SERVIR LA DEMO ---
 
 # 1. Sirve la página principal de la demo
+#    'no-cache': el navegador la guarda pero revalida con el ETag (304 si no cambió)
 @app.get("/", response_class=FileResponse)
-async def read_index():
+async def read_index(http_request: Request):
     # Apunta al archivo HTML que crearemos dentro de la carpeta 'static'
-    return "static/index.html"
+    path = "static/index.html"
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # Comparación débil: la respuesta comprimida lleva el ETag como W/"..."
+    if_none_match = http_request.headers.get("if-none-match", "")
+    if etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers)
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles (ya responde 304 con ETag) más Cache-Control con max-age."""
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers.setdefault("Cache-Control", f"public, max-age={STATIC_MAX_AGE_SEC}")
+        return response
 
 # 2. Monta el directorio 'static' para servir cualquier otro archivo (CSS, JS, imágenes, etc.)
 #    Lo montamos en una ruta como "/static" aunque para este ejemplo simple no es
 #    estrictamente necesario, es una buena práctica.
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 # --- FIN DE NUEVOS ENDPOINTS ---
\ No newline at end of file
@@ -0,0 +1,246 @@
+# Archivo: /services/api/profiling.py
+# Perfilado por petición: tiempos por etapa y muestreo de pilas (stack
+# sampling) de los hilos que trabajan para la petición. Se guarda el perfil
+# cuando se pide explícitamente o cuando la petición supera un umbral de
+# latencia; en este caso las pilas sólo se muestrean desde que se cruza el
+# umbral, así que las peticiones normales sólo pagan los tiempos por etapa.
+# Los perfiles se escriben en disco (compartido por los workers), fuera del
+# event loop, y se conservan los últimos N.
+
+import asyncio
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, List, Optional
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/cache/profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "10"))
+# Las peticiones más lentas que esto se guardan solas (0 = desactivado); el
+# muestreo de pilas empieza al cruzar el umbral
+PROFILE_SLOW_THRESHOLD_SEC = float(os.getenv("PROFILE_SLOW_THRESHOLD_SEC", "15"))
+# Profundidad máxima de las pilas muestreadas
+MAX_STACK_DEPTH = 64
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    def __init__(self, path: str, requested: bool):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.path = path
+        self.requested = requested
+        self.started_at = time.time()
+        self.elapsed_sec = None
+        self.sampling_from_sec = None # Segundos desde el inicio en que empezó el muestreo
+        self.stages: Dict[str, float] = {}
+        self.samples: Counter = Counter()
+        self.threads = set() # Hilos trabajando ahora mismo para esta petición
+        self.saved = False
+
+    def add_stage(self, name: str, seconds: float):
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds, 6)
+
+    def to_dict(self, with_samples: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "path": self.path,
+            "trigger": "requested" if self.requested else "slow",
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "elapsed_sec": self.elapsed_sec,
+            "stages_sec": self.stages,
+            "sample_interval_ms": PROFILE_SAMPLE_INTERVAL_MS,
+            "sampling_from_sec": self.sampling_from_sec,
+            "sample_count": sum(self.samples.values()),
+            "worker_pid": os.getpid()
+        }
+        if with_samples:
+            # Formato "folded" (pila;separada;por;puntos count): flamegraph.pl / speedscope
+            data["samples"] = dict(self.samples.most_common())
+        return data
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+def _fold_stack(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+class Profiler:
+    """
+    Un único hilo muestreador para todo el proceso: cada intervalo toma las
+    pilas de los hilos registrados por las peticiones muestreadas (los de
+    asyncio.to_thread, vía run_in_thread) y del hilo del event loop. Este
+    último lo comparten las peticiones concurrentes, así que sus muestras
+    se atribuyen a todas las muestreadas (prefijo "event_loop"). Sin
+    peticiones muestreadas el hilo duerme.
+    """
+
+    def __init__(self, directory: str, keep: int, interval_ms: float, slow_threshold_sec: float):
+        self.directory = directory
+        self.keep = keep
+        self.interval = interval_ms / 1000.0
+        self.slow_threshold_sec = slow_threshold_sec
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Condition()
+        self._loop_thread_id = None
+        self._sampler = None
+
+    @property
+    def always_on(self) -> bool:
+        return self.slow_threshold_sec > 0
+
+    def _ensure_sampler(self):
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._lock.wait()
+            time.sleep(self.interval)
+            # Bajo el lock: un perfil que sale de _active ya no recibe muestras
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                loop_stack = None
+                if self._loop_thread_id in frames:
+                    loop_stack = "event_loop;" + _fold_stack(frames[self._loop_thread_id])
+                for profile in self._active:
+                    for thread_id in list(profile.threads):
+                        if thread_id in frames:
+                            profile.samples[_fold_stack(frames[thread_id])] += 1
+                    if loop_stack is not None:
+                        profile.samples[loop_stack] += 1
+
+    def _start_sampling(self, profile: RequestProfile):
+        profile.sampling_from_sec = round(time.time() - profile.started_at, 6)
+        with self._lock:
+            self._active.append(profile)
+            self._lock.notify()
+        self._ensure_sampler()
+
+    def _stop_sampling(self, profile: RequestProfile):
+        with self._lock:
+            if profile in self._active:
+                self._active.remove(profile)
+
+    @asynccontextmanager
+    async def track(self, path: str, requested: bool):
+        """
+        Perfila el bloque si se pidió o si el muestreo de lentas está activo.
+        Las pilas se muestrean desde el principio si se pidió y, si no, sólo
+        a partir de slow_threshold_sec. Al salir se guarda (en un hilo) si
+        se pidió o si superó el umbral.
+        """
+        if not requested and not self.always_on:
+            yield None
+            return
+        profile = RequestProfile(path, requested)
+        self._loop_thread_id = threading.get_ident()
+        token = _current_profile.set(profile)
+        loop = asyncio.get_running_loop()
+        timer = None
+        if requested:
+            self._start_sampling(profile)
+        else:
+            timer = loop.call_later(self.slow_threshold_sec, self._start_sampling, profile)
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profile.elapsed_sec = round(time.perf_counter() - start, 6)
+            if timer is not None:
+                timer.cancel()
+            self._stop_sampling(profile)
+            _current_profile.reset(token)
+            if requested or profile.elapsed_sec >= self.slow_threshold_sec:
+                await loop.run_in_executor(None, self._save, profile)
+
+    def _save(self, profile: RequestProfile):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = os.path.join(self.directory, f".{profile.id}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(profile.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(self.directory, f"{profile.id}.json"))
+            profile.saved = True
+            print(f"Perfil guardado: {profile.id} ({profile.elapsed_sec:.2f}s, etapas={profile.stages})")
+            self._prune()
+        except OSError as e:
+            print(f"No se pudo guardar el perfil {profile.id}: {e}")
+
+    def _prune(self):
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        for name in files[:-self.keep] if self.keep > 0 else files:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass # Otro worker lo borró antes
+
+    def list_profiles(self) -> List[dict]:
+        """Resumen de los perfiles guardados (más recientes primero)."""
+        if not os.path.isdir(self.directory):
+            return []
+        summaries = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            profile = self.load(name[:-len(".json")])
+            if profile is not None:
+                profile.pop("samples", None)
+                summaries.append(profile)
+        return summaries
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        if os.path.basename(profile_id) != profile_id or profile_id.startswith("."):
+            return None
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+@contextmanager
+def profile_stage(name: str):
+    """Suma la duración del bloque a la etapa 'name' del perfil en curso (si lo hay)."""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - start)
+
+def _call_registered(profile: RequestProfile, fn: Callable, args: tuple, kwargs: dict):
+    thread_id = threading.get_ident()
+    profile.threads.add(thread_id)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.threads.discard(thread_id)
+
+async def run_in_thread(fn: Callable, *args, **kwargs):
+    """asyncio.to_thread que, si la petición se está perfilando, muestrea ese hilo."""
+    profile = _current_profile.get()
+    if profile is None:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return await asyncio.to_thread(_call_registered, profile, fn, args, kwargs)
+
+def folded_text(profile: dict) -> str:
+    """Muestras en formato "folded" (una pila por línea) para flamegraph/speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.get("samples", {}).items())
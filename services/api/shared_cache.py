@@ -0,0 +1,192 @@
+# Archivo: /services/api/shared_cache.py
+# Caché compartida entre los workers de la API. Por defecto es un SQLite
+# local (en WAL, seguro entre procesos de la misma máquina); con
+# SHARED_CACHE_URL=redis://... se usa Redis para compartirla entre réplicas.
+# Los fallos de la caché nunca hacen fallar una petición: cuentan como miss.
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "/cache/shared_cache.sqlite3")
+SHARED_CACHE_TTL_SEC = float(os.getenv("SHARED_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "200000"))
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def pack_vector(vector: List[float]) -> bytes:
+    """Serializa un embedding como float32 (3 KB para 768 dimensiones)."""
+    return array("f", vector).tobytes()
+
+def unpack_vector(data: bytes) -> List[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+class _CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+class SQLiteCache:
+    """
+    Caché clave/valor en un fichero SQLite compartido por todos los workers.
+    Cada hilo usa su propia conexión; WAL permite lecturas concurrentes
+    mientras otro proceso escribe.
+    """
+
+    # Cada cuántas escrituras se purgan caducados y se recorta el tamaño
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: str, ttl_sec: float, max_entries: int):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.stats = _CacheStats()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " stored_at REAL NOT NULL, expires_at REAL NOT NULL,"
+            " UNIQUE(ns, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache(stored_at)")
+        conn.commit()
+
+    def describe(self) -> str:
+        return f"sqlite:{self.path}"
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # check_same_thread=False sólo para poder cerrarla desde close()
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        digests = {_digest(key): key for key in keys}
+        try:
+            placeholders = ",".join("?" * len(digests))
+            rows = self._conn().execute(
+                f"SELECT key, value FROM cache WHERE ns = ? AND key IN ({placeholders}) AND expires_at > ?",
+                [namespace, *digests, time.time()]
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Caché compartida no disponible (lectura): {e}")
+            self.stats.errors += 1
+            return {}
+        found = {digests[digest]: value for digest, value in rows}
+        self.stats.hits += len(found)
+        self.stats.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, namespace: str, values: Dict[str, bytes]):
+        if not values:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (ns, key, value, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                [(namespace, _digest(key), value, now, now + self.ttl_sec) for key, value in values.items()]
+            )
+            conn.commit()
+            self._writes += len(values)
+            if self._writes >= self.PRUNE_EVERY:
+                self._writes = 0
+                self._prune(conn, now)
+        except sqlite3.Error as e:
+            print(f"Caché compartida no disponible (escritura): {e}")
+            self.stats.errors += 1
+
+    def _prune(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY stored_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        conn.commit()
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+class RedisCache:
+    """Misma interfaz sobre Redis (requiere el paquete 'redis')."""
+
+    def __init__(self, url: str, ttl_sec: float):
+        import redis # Dependencia opcional: sólo si se configura SHARED_CACHE_URL
+        self.url = url
+        self.ttl_sec = ttl_sec
+        self.stats = _CacheStats()
+        self._client = redis.Redis.from_url(url, socket_timeout=1)
+        self._client.ping()
+
+    def describe(self) -> str:
+        return self.url.split("@")[-1] # Sin credenciales
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        try:
+            values = self._client.mget([f"{namespace}:{_digest(key)}" for key in keys])
+        except Exception as e:
+            print(f"Caché compartida no disponible (lectura): {e}")
+            self.stats.errors += 1
+            return {}
+        found = {key: value for key, value in zip(keys, values) if value is not None}
+        self.stats.hits += len(found)
+        self.stats.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, namespace: str, values: Dict[str, bytes]):
+        if not values:
+            return
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.set(f"{namespace}:{_digest(key)}", value, ex=int(self.ttl_sec))
+            pipe.execute()
+        except Exception as e:
+            print(f"Caché compartida no disponible (escritura): {e}")
+            self.stats.errors += 1
+
+    def close(self):
+        self._client.close()
+
+def open_shared_cache() -> Optional[object]:
+    """Abre la caché configurada; SHARED_CACHE_URL=off la desactiva."""
+    if SHARED_CACHE_URL.lower() == "off":
+        return None
+    if SHARED_CACHE_URL.startswith(("redis://", "rediss://")):
+        return RedisCache(SHARED_CACHE_URL, SHARED_CACHE_TTL_SEC)
+    return SQLiteCache(SHARED_CACHE_PATH, SHARED_CACHE_TTL_SEC, SHARED_CACHE_MAX_ENTRIES)
@@ -0,0 +1,65 @@
+# Archivo: /services/api/snippets.py
+# Recorte de los documentos fuente que se devuelven al cliente. El texto
+# completo sólo se usa para el prompt del LLM; la respuesta lleva pasajes.
+
+import os
+import re
+
+SNIPPET_MAX_CHARS = int(os.getenv("SNIPPET_MAX_CHARS", "300"))
+
+# Parámetros del highlighter unificado de Solr
+HIGHLIGHT_FIELD = "text_content_txt_es"
+HIGHLIGHT_PRE = "<em>"
+HIGHLIGHT_POST = "</em>"
+HIGHLIGHT_SEPARATOR = " … "
+
+_WORD_RE = re.compile(r"\w{4,}")
+
+def solr_highlight_params(max_chars: int = SNIPPET_MAX_CHARS) -> dict:
+    """Parámetros para pedir a Solr sólo los pasajes resaltados."""
+    return {
+        "hl": "true",
+        "hl.method": "unified",
+        "hl.fl": HIGHLIGHT_FIELD,
+        "hl.snippets": 2,
+        "hl.fragsize": max(max_chars // 2, 50),
+        "hl.tag.pre": HIGHLIGHT_PRE,
+        "hl.tag.post": HIGHLIGHT_POST,
+        # Si no hay coincidencia léxica, devuelve el inicio del campo
+        "hl.defaultSummary": "true"
+    }
+
+def solr_highlight_text(highlighting: dict, doc_id: str):
+    """Une los pasajes resaltados de un documento, o None si Solr no devolvió ninguno."""
+    passages = highlighting.get(doc_id, {}).get(HIGHLIGHT_FIELD)
+    if not passages:
+        return None
+    return HIGHLIGHT_SEPARATOR.join(passages)
+
+def make_snippet(content: str, query: str, max_chars: int = SNIPPET_MAX_CHARS) -> str:
+    """
+    Recorta 'content' a una ventana de como máximo 'max_chars' caracteres,
+    centrada en la primera palabra de la consulta que aparezca en el texto.
+    """
+    if len(content) <= max_chars:
+        return content
+
+    lowered = content.lower()
+    start = 0
+    for word in _WORD_RE.findall(query.lower()):
+        pos = lowered.find(word)
+        if pos != -1:
+            start = max(pos - max_chars // 3, 0)
+            break
+    start = min(start, len(content) - max_chars)
+
+    # Ajustar a límites de palabra
+    if start > 0:
+        space = content.find(" ", start)
+        if space != -1 and space - start < 20:
+            start = space + 1
+    snippet = content[start:start + max_chars].rsplit(" ", 1)[0] if start + max_chars < len(content) else content[start:]
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + len(snippet) < len(content) else ""
+    return f"{prefix}{snippet}{suffix}"
@@ -0,0 +1,57 @@
+# Archivo: /services/api/solr_query.py
+# Construcción segura de consultas para Solr: el texto del usuario se escapa
+# por completo y se envía como consulta edismax (sin sintaxis de Lucene).
+
+import os
+import re
+from typing import Tuple
+
+# Campos y boosts (text_content_txt_es usa el FieldType 'text_es' con el tesauro)
+SOLR_QF = os.getenv("SOLR_QF", "text_content_txt_es")
+SOLR_PF = os.getenv("SOLR_PF", "text_content_txt_es^3")
+SOLR_PS = os.getenv("SOLR_PS", "3")     # Slop de las frases de 'pf'
+SOLR_MM = os.getenv("SOLR_MM", "2<75%") # minimum-should-match
+
+# Límites para proteger la latencia de Solr frente a consultas patológicas
+MAX_QUERY_CHARS = int(os.getenv("SOLR_MAX_QUERY_CHARS", "500"))
+MAX_QUERY_TERMS = int(os.getenv("SOLR_MAX_QUERY_TERMS", "32"))
+
+# Caracteres especiales del query parser de Lucene
+_LUCENE_SPECIAL_RE = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+# Operadores que edismax interpreta aunque todo lo demás esté escapado
+_OPERATORS = {"AND", "OR", "NOT", "TO"}
+
+def escape_query(text: str) -> str:
+    """
+    Convierte texto libre en una consulta sin sintaxis: escapa los
+    caracteres especiales, neutraliza los operadores booleanos y recorta
+    la longitud y el número de términos.
+    """
+    terms = text[:MAX_QUERY_CHARS].split()[:MAX_QUERY_TERMS]
+    safe_terms = []
+    for term in terms:
+        if term in _OPERATORS:
+            term = term.lower()
+        safe_terms.append(_LUCENE_SPECIAL_RE.sub(r'\\\1', term))
+    return " ".join(safe_terms)
+
+# Campos a devolver: sólo el id (y la versión del índice, que elige la versión
+# del almacén) cuando el texto se hidrata desde el almacén local
+SOLR_FL_IDS = "id, index_version_s"
+SOLR_FL_FULL = "id, source_document_s, text_content_txt_es"
+
+def build_solr_query(text: str, k: int, fl: str = SOLR_FL_FULL) -> Tuple[str, dict]:
+    """Devuelve (q, params) para pysolr.Solr.search con edismax y boost de frase."""
+    q = escape_query(text)
+    params = {
+        "defType": "edismax",
+        "qf": SOLR_QF,
+        "pf": SOLR_PF,
+        "ps": SOLR_PS,
+        "mm": SOLR_MM,
+        "uf": "-*",                   # El usuario no puede consultar campos (campo:valor)
+        "lowercaseOperators": "false",
+        "fl": fl, # Campos a devolver
+        "rows": k
+    }
+    return q, params
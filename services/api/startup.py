@@ -0,0 +1,48 @@
+# Archivo: /services/api/startup.py
+# Arranque de la API: fases independientes en paralelo, informe de tiempos
+# por fase y estado de disponibilidad (readiness).
+
+import asyncio
+import time
+from typing import Callable, Dict
+
+class StartupReport:
+    """Tiempos y errores de cada fase del arranque, y estado de disponibilidad."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.total_sec = None
+        self.done = False
+
+    async def _run_phase(self, name: str, fn: Callable[[], None]):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(fn)
+        except Exception as e:
+            self.errors[name] = str(e)
+            print(f"Fase de arranque '{name}' falló: {e}")
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 4)
+
+    async def run_concurrently(self, phases: Dict[str, Callable[[], None]]):
+        """Ejecuta las fases (funciones bloqueantes) a la vez, cada una en un hilo."""
+        await asyncio.gather(*(self._run_phase(name, fn) for name, fn in phases.items()))
+        self.total_sec = round(time.monotonic() - self.started, 4)
+        self.done = True
+
+    def print_report(self):
+        print("--- Tiempos de arranque ---")
+        for name, seconds in sorted(self.phases.items(), key=lambda item: -item[1]):
+            status = "ERROR" if name in self.errors else "ok"
+            print(f"  {name:<12} {seconds:8.3f}s  {status}")
+        print(f"  {'total':<12} {self.total_sec:8.3f}s")
+
+    def summary(self) -> dict:
+        return {
+            "done": self.done,
+            "elapsed_sec": self.total_sec if self.done else round(time.monotonic() - self.started, 4),
+            "phases_sec": self.phases,
+            "errors": self.errors
+        }
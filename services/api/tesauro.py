@@ -0,0 +1,110 @@
+# Archivo: /services/api/tesauro.py
+# Búsqueda en memoria de términos del Tesauro CEV dentro de las consultas,
+# para expandirlas antes de generar el embedding (ruta de Milvus).
+
+import json
+import re
+import unicodedata
+from typing import List, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+_END = "$"  # Marca de fin de etiqueta dentro del trie
+
+def _fold(text: str) -> str:
+    """
+    Minúsculas y sin tildes, conservando la longitud (1 carácter -> 1 carácter):
+    se pliega carácter a carácter porque lower() puede alargar el texto
+    (ej. "İ" -> "i̇") y las posiciones se usan sobre la consulta original.
+    """
+    return "".join(unicodedata.normalize("NFD", c.lower())[0] for c in text)
+
+class SynonymMatcher:
+    """
+    Trie de palabras construido sobre los prefLabel/altLabel del tesauro.
+    Recorre la consulta una sola vez buscando la coincidencia más larga
+    en cada posición, así que el coste es de microsegundos por consulta.
+    """
+
+    def __init__(self, groups: List[List[str]]):
+        self.groups = groups
+        self.trie = {}
+        for group_idx, group in enumerate(groups):
+            for label in group:
+                tokens = _WORD_RE.findall(_fold(label))
+                if not tokens:
+                    continue
+                node = self.trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                node.setdefault(_END, set()).add(group_idx)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def find(self, query: str) -> List[Tuple[int, int, int]]:
+        """
+        Devuelve las coincidencias como (inicio, fin, grupo), con inicio/fin
+        en caracteres de la consulta original. No se solapan.
+        """
+        words = list(_WORD_RE.finditer(_fold(query)))
+        matches = []
+        i = 0
+        while i < len(words):
+            node = self.trie
+            best = None
+            j = i
+            while j < len(words) and words[j].group() in node:
+                node = node[words[j].group()]
+                j += 1
+                if _END in node:
+                    best = (j, node[_END])
+            if best is None:
+                i += 1
+                continue
+            end_word, group_ids = best
+            for group_idx in sorted(group_ids):
+                matches.append((words[i].start(), words[end_word - 1].end(), group_idx))
+            i = end_word
+        return matches
+
+    def synonyms_for(self, query: str) -> List[Tuple[int, int, List[str]]]:
+        """Para cada término encontrado, los sinónimos que NO aparecen ya en la consulta."""
+        folded_query = _fold(query)
+        result = []
+        for start, end, group_idx in self.find(query):
+            matched = folded_query[start:end]
+            alternatives = [
+                label for label in self.groups[group_idx]
+                if _fold(label) != matched and _fold(label) not in folded_query
+            ]
+            if alternatives:
+                result.append((start, end, alternatives))
+        return result
+
+    def expand_append(self, query: str) -> str:
+        """Añade los sinónimos al final de la consulta (un solo embedding)."""
+        extra = []
+        for _, _, alternatives in self.synonyms_for(query):
+            extra.extend(a for a in alternatives if a not in extra)
+        if not extra:
+            return query
+        return f"{query} ({', '.join(extra)})"
+
+    def expand_variants(self, query: str, max_variants: int = 3) -> List[str]:
+        """
+        Genera la consulta original más variantes en las que cada término
+        encontrado se reemplaza por un sinónimo (una variante por sinónimo).
+        """
+        variants = [query]
+        for start, end, alternatives in self.synonyms_for(query):
+            for alternative in alternatives:
+                if len(variants) > max_variants:
+                    return variants
+                variants.append(query[:start] + alternative + query[end:])
+        return variants
+
+def load_synonym_matcher(path: str) -> SynonymMatcher:
+    """Carga el tesauro compilado por el indexer (parse_tesauro.py)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        groups = json.load(f).get("groups", [])
+    return SynonymMatcher([g for g in groups if len(g) > 1])
@@ -0,0 +1,8 @@
+# Las pruebas importan los módulos como lo hace la imagen de la API:
+# /app (este servicio) y /common (módulos compartidos) en el PYTHONPATH.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (os.path.join(HERE, "..", "..", "common"), os.path.join(HERE, "..")):
+    sys.path.insert(0, os.path.abspath(path))
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+import admission
+from admission import CircuitBreaker, ConcurrencyLimiter, Overloaded
+
+def test_limiter_hands_slots_over_in_fifo_order():
+    order = []
+
+    async def worker(limiter, name, gate):
+        async with limiter.slot():
+            order.append(name)
+            await gate.wait()
+
+    async def scenario():
+        limiter = ConcurrencyLimiter("gen", max_concurrency=1, max_queue=5, max_wait_sec=5)
+        gate = asyncio.Event()
+        tasks = [asyncio.ensure_future(worker(limiter, name, gate)) for name in "abc"]
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["active"] == 1 and limiter.stats()["waiting"] == 2
+        gate.set()
+        await asyncio.gather(*tasks)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert order == ["a", "b", "c"]
+    assert limiter.active == 0
+
+def test_limiter_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = ConcurrencyLimiter("gen", max_concurrency=1, max_queue=0, max_wait_sec=5)
+        async with limiter.slot():
+            with pytest.raises(Overloaded) as exc:
+                async with limiter.slot():
+                    pass
+        return limiter, exc.value
+
+    limiter, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.retry_after >= 1
+    assert limiter.rejected == 1 and limiter.active == 0
+
+def test_limiter_rejects_when_estimated_wait_exceeds_deadline():
+    async def scenario():
+        limiter = ConcurrencyLimiter("gen", max_concurrency=1, max_queue=5, max_wait_sec=5)
+        limiter.avg_service_sec = 2.0
+        async with limiter.slot():
+            with pytest.raises(Overloaded) as exc:
+                async with limiter.slot(deadline=time.monotonic() + 0.5):
+                    pass
+        return exc.value
+
+    assert asyncio.run(scenario()).status_code == 503
+
+def test_limiter_times_out_and_leaves_the_queue():
+    async def scenario():
+        limiter = ConcurrencyLimiter("gen", max_concurrency=1, max_queue=5, max_wait_sec=0.02)
+        async with limiter.slot():
+            with pytest.raises(Overloaded):
+                async with limiter.slot():
+                    pass
+            assert limiter.stats()["waiting"] == 0
+        return limiter
+
+    assert asyncio.run(scenario()).active == 0
+
+def test_limiter_run_keeps_the_slot_until_cancelled_work_finishes():
+    async def scenario():
+        limiter = ConcurrencyLimiter("gen", max_concurrency=1, max_queue=5, max_wait_sec=5)
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "hecho"
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.run(work), 0.02)
+        assert limiter.active == 1 # El trabajo sigue en marcha
+
+        queued = asyncio.ensure_future(limiter.run(lambda: asyncio.sleep(0, "siguiente")))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["waiting"] == 1 and not queued.done()
+
+        gate.set()
+        assert await queued == "siguiente"
+        return limiter
+
+    assert asyncio.run(scenario()).active == 0
+
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("gemini", failure_threshold=2, reset_timeout_sec=10)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(Overloaded) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == 10
+
+    now[0] += 10
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(Overloaded):
+        breaker.before_call()   # Sólo una llamada de prueba a la vez
+
+    breaker.record_success()
+    assert breaker.stats() == {"state": "closed", "failures": 0}
+    breaker.before_call()
+
+def test_breaker_reopens_when_the_probe_fails(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("gemini", failure_threshold=1, reset_timeout_sec=5)
+    breaker.record_failure()
+    now[0] = 5.0
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened_at == 5.0
+
+def test_breaker_release_frees_an_unfinished_probe(monkeypatch):
+    monkeypatch.setattr(admission.time, "monotonic", lambda: 50.0)
+    breaker = CircuitBreaker("gemini", failure_threshold=1, reset_timeout_sec=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == "half_open"
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from batching import MicroBatcher
+
+def test_concurrent_submits_share_one_batch():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(double, max_batch_size=8, window_ms=20)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+def test_batches_respect_max_batch_size():
+    sizes = []
+
+    def identity(items):
+        sizes.append(len(items))
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(identity, max_batch_size=3, window_ms=5)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+        finally:
+            await batcher.stop()
+
+    assert asyncio.run(scenario()) == list(range(7))
+    assert max(sizes) <= 3 and sum(sizes) == 7
+
+def test_exception_result_fails_only_its_item():
+    def check(items):
+        return [ValueError(item) if item < 0 else item for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(check, window_ms=10)
+        batcher.start()
+        try:
+            return await asyncio.gather(batcher.submit(1), batcher.submit(-1), batcher.submit(2),
+                                        return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    ok, failed, other = asyncio.run(scenario())
+    assert (ok, other) == (1, 2)
+    assert isinstance(failed, ValueError)
+
+def test_batch_fn_error_fails_the_whole_batch():
+    def broken(items):
+        raise RuntimeError("milvus caído")
+
+    async def scenario():
+        batcher = MicroBatcher(broken, window_ms=10)
+        batcher.start()
+        try:
+            return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+def test_submit_requires_start():
+    async def scenario():
+        await MicroBatcher(lambda items: items).submit(1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
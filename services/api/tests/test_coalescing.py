@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from coalescing import SingleFlight, normalize_query
+
+def test_normalize_query_collapses_spaces_and_case():
+    assert normalize_query("  ¿Qué   pasó\ten  TUMACO? ") == "¿qué pasó en tumaco?"
+
+def test_identical_calls_share_one_computation():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "respuesta"
+
+    async def scenario():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        assert "k" in flight
+        results = await asyncio.gather(first, *(flight.do("k", compute) for _ in range(3)))
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert results == ["respuesta"] * 4
+    assert calls == 1
+    assert flight.coalesced == 3
+    assert len(flight) == 0 and "k" not in flight
+
+def test_exceptions_reach_every_waiter():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("fallo")
+
+    async def scenario():
+        flight = SingleFlight()
+        return await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+
+def test_cancelling_one_waiter_keeps_the_computation_for_the_rest():
+    async def compute():
+        await asyncio.sleep(0.02)
+        return 42
+
+    async def scenario():
+        flight = SingleFlight()
+        leaving = asyncio.ensure_future(flight.do("k", compute))
+        staying = asyncio.ensure_future(flight.do("k", compute))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        return await staying
+
+    assert asyncio.run(scenario()) == 42
+
+def test_computation_is_cancelled_when_nobody_waits():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        stopped = asyncio.Event()
+
+        async def compute():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+
+        waiter = asyncio.ensure_future(flight.do("k", compute))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.wait_for(stopped.wait(), timeout=1)
+        await asyncio.sleep(0)
+        return flight
+
+    assert len(asyncio.run(scenario())) == 0
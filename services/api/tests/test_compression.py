@@ -0,0 +1,94 @@
+import asyncio
+import gzip
+import json
+
+import compression
+from compression import CompressionMiddleware, choose_encoding, merge_vary
+
+BODY = json.dumps({"answer": "verdad " * 500}).encode("utf-8")
+
+def make_app(body=BODY, content_type=b"application/json", chunk_size=None, extra_headers=()):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode()),
+                        *extra_headers],
+        })
+        size = chunk_size or len(body) or 1
+        parts = [body[i:i + size] for i in range(0, len(body), size)] or [b""]
+        for i, part in enumerate(parts):
+            await send({"type": "http.response.body", "body": part, "more_body": i < len(parts) - 1})
+    return app
+
+def call(app, accept_encoding="gzip", method="POST", minimum_size=1024):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    scope = {"type": "http", "method": method, "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size)(scope, receive, send))
+    headers = dict(messages[0]["headers"])
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return headers, body
+
+def test_choose_encoding_respects_quality(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("br, gzip;q=0.5") == "gzip"
+    assert choose_encoding("") is None
+    monkeypatch.setattr(compression, "brotli", object())
+    assert choose_encoding("br;q=0.1, gzip") == "br"
+    assert choose_encoding("br;q=x, gzip") == "gzip"
+
+def test_json_response_is_gzipped():
+    headers, body = call(make_app(chunk_size=1000))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body) < len(BODY)
+    assert gzip.decompress(body) == BODY
+
+def test_small_responses_are_not_compressed():
+    headers, body = call(make_app(b'{"ok": true}'))
+    assert b"content-encoding" not in headers
+    assert body == b'{"ok": true}'
+    assert headers[b"content-length"] == b"12"
+
+def test_without_accept_encoding_or_for_head_the_response_is_untouched():
+    for kwargs in ({"accept_encoding": "identity"}, {"method": "HEAD"}):
+        headers, body = call(make_app(), **kwargs)
+        assert b"content-encoding" not in headers and b"vary" not in headers
+        assert body == BODY
+
+def test_binary_and_already_encoded_responses_pass_through():
+    headers, body = call(make_app(content_type=b"image/png"))
+    assert b"content-encoding" not in headers and body == BODY
+
+    encoded = gzip.compress(BODY)
+    headers, body = call(make_app(encoded, extra_headers=[(b"content-encoding", b"gzip")]))
+    assert body == encoded
+
+def test_oversized_streams_are_sent_uncompressed(monkeypatch):
+    monkeypatch.setattr(compression, "MAX_BUFFER_BYTES", 2000)
+    headers, body = call(make_app(chunk_size=1500))
+    assert b"content-encoding" not in headers
+    assert body == BODY
+
+def test_vary_is_merged_into_an_existing_header():
+    headers, _ = call(make_app(extra_headers=[(b"vary", b"Origin")]))
+    assert headers[b"vary"] == b"Origin, Accept-Encoding"
+    assert merge_vary([(b"vary", b"accept-encoding")]) == [(b"vary", b"accept-encoding")]
+    assert merge_vary([(b"vary", b"*")]) == [(b"vary", b"*")]
+
+def test_compressed_responses_get_a_weak_etag():
+    headers, _ = call(make_app(extra_headers=[(b"etag", b'"abc"')]))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"etag"] == b'W/"abc"'
+
+    headers, _ = call(make_app(b"{}", extra_headers=[(b"etag", b'"abc"')]))
+    assert headers[b"etag"] == b'"abc"'   # Sin comprimir: sigue siendo fuerte
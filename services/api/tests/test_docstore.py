@@ -0,0 +1,147 @@
+import importlib.util
+import os
+
+import pytest
+
+from docstore import DocStore, VersionedDocStore
+
+# El escritor vive en el indexer con el mismo nombre de módulo; se carga por ruta
+_WRITER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "indexer", "docstore.py")
+_spec = importlib.util.spec_from_file_location("indexer_docstore", _WRITER_PATH)
+writer = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(writer)
+
+class _Column(list):
+    def astype(self, _type):
+        return _Column(str(v) for v in self)
+
+    def tolist(self):
+        return list(self)
+
+class FakeFrame:
+    """Lo mínimo de un DataFrame de pandas que usa write_docstore."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getitem__(self, column):
+        return _Column(row[column] for row in self.rows)
+
+def chunks(*texts, source="01-Cap.txt"):
+    return FakeFrame([
+        {"chunk_id": f"{source}_{i:04d}", "text_content": text, "source_document": source}
+        for i, text in enumerate(texts)
+    ])
+
+def test_written_chunks_are_read_back_by_id(tmp_path):
+    frame = FakeFrame(chunks("Verdad y memoria.", "Niñez y conflicto — Tumaco.").rows
+                      + chunks("", source="02-Otro.txt").rows)
+    writer.write_docstore(frame, "v1", root=str(tmp_path))
+
+    store = DocStore(str(tmp_path / "v1"))
+    try:
+        assert len(store) == 3
+        assert store.source_names == ["01-Cap.txt", "02-Otro.txt"]
+        assert store.get("01-Cap.txt_0001") == ("Niñez y conflicto — Tumaco.", "01-Cap.txt")
+        assert store.get("02-Otro.txt_0000") == ("", "02-Otro.txt")
+        assert "01-Cap.txt_0000" in store
+        assert store.get("no-existe") is None
+    finally:
+        store.close()
+
+def test_empty_docstore_can_be_opened(tmp_path):
+    writer.write_docstore(FakeFrame([]), "v1", root=str(tmp_path))
+    store = DocStore(str(tmp_path / "v1"))
+    assert len(store) == 0
+    store.close()
+
+def test_unknown_format_version_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, "DOCSTORE_FORMAT_VERSION", 99)
+    writer.write_docstore(chunks("texto"), "v1", root=str(tmp_path))
+    with pytest.raises(ValueError):
+        DocStore(str(tmp_path / "v1"))
+
+def publish(version, root):
+    writer.publish_docstore(version, root=str(root))
+    # El lector detecta el cambio por el mtime del puntero; se fuerza uno
+    # distinto por si el sistema de archivos tiene poca resolución
+    publish.mtime_ns += 10 ** 9
+    os.utime(root / writer.CURRENT_FILE_NAME, ns=(publish.mtime_ns, publish.mtime_ns))
+publish.mtime_ns = 10 ** 18
+
+def test_versioned_store_follows_the_published_version(tmp_path):
+    writer.write_docstore(chunks("primera"), "v1", root=str(tmp_path))
+    publish("v1", tmp_path)
+    store = VersionedDocStore(str(tmp_path), check_interval_sec=0)
+    assert store.version == "v1"
+
+    # Una versión escrita pero no publicada no se ve
+    writer.write_docstore(chunks("segunda"), "v2", root=str(tmp_path))
+    assert store.get("01-Cap.txt_0000") == ("primera", "01-Cap.txt")
+
+    publish("v2", tmp_path)
+    assert store.get("01-Cap.txt_0000") == ("segunda", "01-Cap.txt")
+    assert store.version == "v2"
+    store.close()
+
+def test_publish_keeps_only_the_previous_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, "KEEP_PREVIOUS_VERSIONS", 1)
+    for version in ("v1", "v2", "v3"):
+        writer.write_docstore(chunks(version), version, root=str(tmp_path))
+        publish(version, tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["v2", "v3"]
+
+def test_discarded_version_is_removed_and_never_served(tmp_path):
+    writer.write_docstore(chunks("en servicio"), "v1", root=str(tmp_path))
+    publish("v1", tmp_path)
+    writer.write_docstore(chunks("fallida"), "v2", root=str(tmp_path))
+    writer.discard_docstore("v2", root=str(tmp_path))
+
+    assert not (tmp_path / "v2").exists()
+    store = VersionedDocStore(str(tmp_path), check_interval_sec=0)
+    assert store.get("01-Cap.txt_0000") == ("en servicio", "01-Cap.txt")
+    store.close()
+
+def test_broken_pointer_keeps_serving_the_open_version(tmp_path):
+    writer.write_docstore(chunks("buena"), "v1", root=str(tmp_path))
+    publish("v1", tmp_path)
+    store = VersionedDocStore(str(tmp_path), check_interval_sec=0)
+    publish("no-existe", tmp_path)
+    assert store.get("01-Cap.txt_0000") == ("buena", "01-Cap.txt")
+    assert store.version == "v1"
+    store.close()
+
+def test_unversioned_root_is_served_without_pointer(tmp_path):
+    writer.write_docstore(chunks("plano"), ".", root=str(tmp_path))
+    store = VersionedDocStore(str(tmp_path))
+    assert store.version is None and len(store) == 1
+    store.close()
+
+def test_missing_store_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        VersionedDocStore(str(tmp_path))
+
+def test_results_are_read_from_the_version_of_their_index(tmp_path):
+    writer.write_docstore(chunks("antigua"), "v1", root=str(tmp_path))
+    publish("v1", tmp_path)
+    store = VersionedDocStore(str(tmp_path), check_interval_sec=0)
+
+    # Un backend ya sirve v2 antes de que se publique CURRENT
+    writer.write_docstore(chunks("nueva", "añadida"), "v2", root=str(tmp_path))
+    assert store.get("01-Cap.txt_0001", "v2") == ("añadida", "01-Cap.txt")
+    assert store.get("01-Cap.txt_0001") is None
+
+    # Y el otro sigue sirviendo v1 cuando CURRENT ya apunta a v2
+    publish("v2", tmp_path)
+    assert store.get("01-Cap.txt_0000", "v1") == ("antigua", "01-Cap.txt")
+    assert store.get("01-Cap.txt_0000", "v2") == ("nueva", "01-Cap.txt")
+    assert store.get("01-Cap.txt_0000") == ("nueva", "01-Cap.txt")
+    store.close()
+
+def test_unknown_versions_fall_back_to_the_published_one(tmp_path):
+    writer.write_docstore(chunks("en servicio"), "v1", root=str(tmp_path))
+    publish("v1", tmp_path)
+    store = VersionedDocStore(str(tmp_path), check_interval_sec=0)
+    for version in ("v0-borrada", "../v1", ".oculta"):
+        assert store.get("01-Cap.txt_0000", version) == ("en servicio", "01-Cap.txt")
+    store.close()
@@ -0,0 +1,29 @@
+from filters import chapter_of, chapter_partition, resolve_sources, solr_source_fq
+
+SOURCES = ["01-Introducción.txt", "07-Niñez.txt", "14-Las FARC.txt", "anexo.txt"]
+
+def test_chapter_comes_from_the_numeric_prefix():
+    assert chapter_of("14-Las FARC.txt") == 14
+    assert chapter_of("anexo.txt") is None
+    assert chapter_partition("7-Niñez.txt") == "cap_007"
+    assert chapter_partition("anexo.txt") == "_default"
+
+def test_no_filters_means_the_whole_corpus():
+    assert resolve_sources(SOURCES, None, None, None) is None
+    assert resolve_sources(SOURCES, [], None, None) is None
+
+def test_chapter_range_is_inclusive_and_skips_unnumbered_files():
+    assert resolve_sources(SOURCES, None, 7, 14) == ["07-Niñez.txt", "14-Las FARC.txt"]
+    assert resolve_sources(SOURCES, None, None, 1) == ["01-Introducción.txt"]
+    assert resolve_sources(SOURCES, None, 8, None) == ["14-Las FARC.txt"]
+
+def test_source_documents_are_intersected_with_the_chapter_range():
+    requested = ["14-Las FARC.txt", "01-Introducción.txt", "14-Las FARC.txt"]
+    assert resolve_sources(SOURCES, requested, None, None) == ["01-Introducción.txt", "14-Las FARC.txt"]
+    assert resolve_sources(SOURCES, requested, 10, None) == ["14-Las FARC.txt"]
+    assert resolve_sources(SOURCES, requested, 20, 30) == []
+
+def test_solr_source_fq_uses_the_terms_parser():
+    assert solr_source_fq(["07-Niñez.txt", "14-Las FARC.txt"]) == (
+        '{!terms f=source_document_s separator="|"}07-Niñez.txt|14-Las FARC.txt'
+    )
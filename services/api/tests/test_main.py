@@ -0,0 +1,252 @@
+import pytest
+
+for module in ("fastapi", "pysolr", "pymilvus", "dotenv", "google.generativeai"):
+    pytest.importorskip(module)
+
+import asyncio
+import os
+import threading
+
+from pydantic import ValidationError
+
+# main.py monta 'static' relativo al directorio de trabajo (/app en la imagen)
+_cwd = os.getcwd()
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+try:
+    import main
+finally:
+    os.chdir(_cwd)
+from startup import StartupReport
+
+@pytest.fixture
+def models(monkeypatch):
+    """Estado global de la API vacío, con el arranque ya terminado."""
+    state = {}
+    report = StartupReport()
+    report.done = True
+    monkeypatch.setattr(main, "models", state)
+    monkeypatch.setattr(main, "startup_report", report)
+    return state
+
+@pytest.mark.parametrize("deadline_sec", [0, -1, main.MAX_REQUEST_DEADLINE_SEC + 1])
+def test_ask_request_rejects_out_of_range_deadlines(deadline_sec):
+    with pytest.raises(ValidationError):
+        main.AskRequest(query="paz", backend="solr", deadline_sec=deadline_sec)
+
+def test_ask_request_accepts_a_deadline_within_range():
+    assert main.AskRequest(query="paz", backend="solr", deadline_sec=5).deadline_sec == 5
+
+@pytest.mark.parametrize("matcher", [None, object()])
+def test_invalid_expansion_is_rejected_with_or_without_thesaurus(models, matcher):
+    from fastapi.testclient import TestClient
+
+    models["synonym_matcher"] = matcher
+    response = TestClient(main.app).post("/ask", json={"query": "q", "backend": "milvus", "expansion": "todo"})
+    assert response.status_code == 422
+    assert main.AskRequest(query="q", backend="milvus", expansion="multi").expansion == "multi"
+
+def test_ready_without_llm_when_retrieval_is_available(models):
+    models["solr_ok"] = True
+    assert main.llm_state() == "unavailable"
+    assert main.is_ready()
+
+def test_not_ready_without_any_retrieval_backend(models):
+    models["llm_model"] = object()
+    assert main.llm_state() == "ok"
+    assert not main.is_ready()
+    models["milvus_collection"] = object()
+    assert main.is_ready()
+
+def test_llm_state_replay_comes_from_the_cassette(models, monkeypatch):
+    monkeypatch.setattr(main, "RECORD_REPLAY_MODE", "replay")
+    models["cassette"] = object()
+    assert main.llm_state() == "replay"
+
+def test_docstore_is_opened_lazily_once_the_indexer_publishes(models, monkeypatch):
+    published = []
+
+    class FakeDocStore:
+        def __init__(self, root):
+            if not published:
+                raise FileNotFoundError(root)
+
+        def __len__(self):
+            return 1
+
+    monkeypatch.setattr(main, "VersionedDocStore", FakeDocStore)
+    assert main.get_docstore() is None
+
+    # Dentro de la ventana de reintento no se vuelve a intentar
+    published.append("v1")
+    assert main.get_docstore() is None
+
+    models["docstore_retry_at"] = 0.0
+    store = main.get_docstore()
+    assert isinstance(store, FakeDocStore)
+    assert main.get_docstore() is store
+
+class FakeEmbeddings:
+    """Sustituye a genai.embed_content y registra qué textos se embebieron."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_content(self, model, content, task_type):
+        self.calls.append(list(content))
+        return {"embedding": [[float(len(text)), 0.0] for text in content]}
+
+@pytest.fixture
+def cassette(models, tmp_path, monkeypatch):
+    def open_mode(mode):
+        from record_replay import open_cassette
+        monkeypatch.setattr(main, "RECORD_REPLAY_MODE", mode)
+        models["cassette"] = open_cassette(str(tmp_path / "cassette.sqlite3"), mode)
+        return models["cassette"]
+    return open_mode
+
+def test_embed_queries_records_vectors_that_came_from_the_shared_cache(cassette, monkeypatch):
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(main, "genai", fake)
+
+    cassette("record")
+    vectors = main.embed_queries("m", ["paz", "verdad"], cached={"paz": [9.0, 9.0]})
+    assert vectors == {"paz": [9.0, 9.0], "verdad": [6.0, 0.0]}
+    assert fake.calls == [["verdad"]]
+
+    cassette("replay")
+    assert main.embed_queries("m", ["paz", "verdad"]) == vectors
+    assert len(fake.calls) == 1
+
+def test_replay_returns_only_recorded_embeddings(cassette, monkeypatch):
+    monkeypatch.setattr(main, "genai", FakeEmbeddings())
+    cassette("record")
+    main.embed_queries("m", ["grabada"])
+    cassette("replay")
+    assert main.embed_queries("m", ["grabada", "nueva"]) == {"grabada": [7.0, 0.0]}
+
+def test_generate_answer_without_room_for_context_does_not_call_gemini(models, monkeypatch):
+    def fail(prompt, generation_config):
+        raise AssertionError("no debe llamarse a Gemini sin contexto")
+    monkeypatch.setattr(main, "call_gemini", fail)
+
+    documents = [main.SourceDocument(id="1", content="La Comisión de la Verdad.", source_file="01.txt")]
+    answer, usage = main.generate_answer("¿Qué es la CEV?", documents, max_input_tokens=1)
+    assert answer == ""
+    assert usage.context_documents == 0 and usage.context_truncated
+    assert usage.output_tokens == 0
+
+def test_generate_answer_truncates_context_to_the_input_budget(models, monkeypatch):
+    prompts = []
+
+    def fake_gemini(prompt, generation_config):
+        prompts.append(prompt)
+        return {"text": "respuesta", "prompt_tokens": 120, "output_tokens": 3}
+    monkeypatch.setattr(main, "call_gemini", fake_gemini)
+
+    documents = [main.SourceDocument(id=str(i), content="palabra " * 400, source_file="01.txt") for i in range(3)]
+    overhead = main.token_meter.estimate(main.build_prompt("¿Qué?", ""))
+    answer, usage = main.generate_answer("¿Qué?", documents, max_input_tokens=overhead + 150)
+    assert answer == "respuesta"
+    assert usage.context_documents == 1 and usage.context_truncated
+    assert usage.prompt_tokens == 120 and not usage.estimated
+    assert len(prompts) == 1
+
+def test_select_adaptive_sorts_by_score_before_cutting(models, monkeypatch):
+    monkeypatch.setattr(main, "ADAPTIVE_MIN_K", 1)
+    models["adaptive_thresholds"] = {"milvus": {"max_distance": 0.45, "max_gap": None}}
+    documents = [
+        main.SourceDocument(id=doc_id, content="texto", source_file="01.txt", score=score)
+        for doc_id, score in (("a", 0.4), ("b", 0.2), ("c", 1.4), ("d", 0.5))
+    ]
+    assert [doc.id for doc in main.select_adaptive("milvus", documents, None)] == ["b", "a"]
+
+def test_select_adaptive_stops_at_the_input_token_budget(models, monkeypatch):
+    monkeypatch.setattr(main, "ADAPTIVE_MIN_K", 1)
+    documents = [
+        main.SourceDocument(id=str(i), content="x" * 400, source_file="01.txt", score=10.0 - i)
+        for i in range(4)
+    ]
+    tokens = main.token_meter.estimate("x" * 400)
+    selected = main.select_adaptive("solr", documents, 2 * tokens)
+    assert [doc.id for doc in selected] == ["0", "1"]
+
+def test_generate_answer_keeps_a_small_explicit_output_cap(models, monkeypatch):
+    configs = []
+
+    def fake_gemini(prompt, generation_config):
+        configs.append(generation_config)
+        return {"text": "r", "prompt_tokens": 10, "output_tokens": 1}
+    monkeypatch.setattr(main, "call_gemini", fake_gemini)
+
+    documents = [main.SourceDocument(id="1", content="La Comisión de la Verdad.", source_file="01.txt")]
+    _, usage = main.generate_answer("¿Qué?", documents, max_output_tokens=10, latency_budget_sec=0.01)
+    assert usage.max_output_tokens == 10
+    assert configs[0]["max_output_tokens"] == 10
+
+class FakeHit:
+    def __init__(self, hit_id, distance, version=None):
+        self.id = hit_id
+        self.distance = distance
+        self.entity = {main.VERSION_FIELD_NAME: version} if version else {}
+
+def test_milvus_hits_keep_the_version_of_their_index():
+    single = main.fuse_milvus_results([[FakeHit("a", 0.1, "v2"), FakeHit("b", 0.3, "v2")]])
+    assert single == [("a", 0.1, "v2"), ("b", 0.3, "v2")]
+
+    fused = main.fuse_milvus_results([[FakeHit("a", 0.4, "v2")], [FakeHit("b", 0.2, "v2"), FakeHit("a", 0.3, "v2")]])
+    assert fused == [("a", 0.3, "v2"), ("b", 0.2, "v2")]
+    assert main.fuse_milvus_results([[FakeHit("a", 0.1)]]) == [("a", 0.1, None)]
+
+def test_hydrate_document_reads_the_docstore_version_of_the_hit(models):
+    class FakeDocStore:
+        def get(self, doc_id, version=None):
+            return {"v1": ("antiguo", "01.txt"), None: ("publicado", "01.txt")}.get(version)
+
+    models["docstore"] = FakeDocStore()
+    assert main.hydrate_document("a", score=0.1, version="v1").content == "antiguo"
+    assert main.hydrate_document("a").content == "publicado"
+    assert main.hydrate_document("a", version="v9") is None
+
+def test_index_revalidates_with_the_weak_etag_of_the_compressed_page(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    client = TestClient(main.app)  # Sin 'with': no se ejecuta el lifespan
+    first = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200
+    assert first.headers["content-encoding"] == "gzip"
+    etag = first.headers["etag"]
+    assert etag.startswith('W/"')
+    assert first.headers["vary"].lower().count("accept-encoding") == 1
+
+    again = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304
+
+def test_cancelled_generation_holds_its_slot_while_gemini_runs(models, monkeypatch):
+    release = threading.Event()
+
+    def slow_generate(query, documents, **budget):
+        release.wait(5)
+        return "r", None
+    monkeypatch.setattr(main, "generate_answer", slow_generate)
+    limiter = main.ConcurrencyLimiter("gen", max_concurrency=1, max_queue=5, max_wait_sec=5)
+    breaker = main.CircuitBreaker("gemini", failure_threshold=1, reset_timeout_sec=30)
+    monkeypatch.setattr(main, "generation_limiter", limiter)
+    monkeypatch.setattr(main, "gemini_breaker", breaker)
+
+    async def scenario():
+        deadline = main.time.monotonic() + 5
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(main.generate_answer_guarded("¿Qué?", [], deadline), 0.05)
+        assert limiter.active == 1 # El hilo de Gemini sigue ocupando el hueco
+
+        release.set()
+        while limiter.active:
+            await asyncio.sleep(0.01)
+        assert await main.generate_answer_guarded("¿Qué?", [], deadline) == ("r", None)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release.set()
+    assert limiter.active == 0 and breaker.state == "closed"
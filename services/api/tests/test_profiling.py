@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from profiling import Profiler, folded_text, profile_stage, run_in_thread
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def make_profiler(tmp_path, slow_threshold_sec, keep=10):
+    return Profiler(str(tmp_path / "profiles"), keep, interval_ms=2, slow_threshold_sec=slow_threshold_sec)
+
+def track(profiler, work, requested=False):
+    async def scenario():
+        async with profiler.track("/ask", requested) as profile:
+            with profile_stage("retrieval"):
+                await run_in_thread(busy, work)
+            with profile_stage("retrieval"):
+                await asyncio.sleep(0)
+        return profile
+    return asyncio.run(scenario())
+
+def test_fast_request_is_neither_sampled_nor_saved(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0.2)
+    profile = track(profiler, 0.02)
+    assert profile.sampling_from_sec is None
+    assert not profile.samples and not profile.saved
+    assert set(profile.stages) == {"retrieval"}
+    assert profiler.list_profiles() == []
+
+def test_slow_request_is_sampled_after_the_threshold_and_saved(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0.05)
+    profile = track(profiler, 0.2)
+    assert profile.saved
+    assert profile.sampling_from_sec >= 0.05
+    assert any("busy (test_profiling.py" in stack for stack in profile.samples)
+
+    (summary,) = profiler.list_profiles()
+    assert summary["trigger"] == "slow" and "samples" not in summary
+    saved = profiler.load(profile.id)
+    assert folded_text(saved).count("\n") == len(saved["samples"])
+
+def test_requested_profile_is_sampled_from_the_start(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0)
+    profile = track(profiler, 0.05, requested=True)
+    assert profile.saved and profile.sampling_from_sec < 0.05
+    assert profile.samples
+    assert profiler.load(profile.id)["trigger"] == "requested"
+
+def test_disabled_profiler_does_not_track(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0)
+    assert track(profiler, 0.01) is None
+
+def test_only_the_last_profiles_are_kept(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0, keep=2)
+    ids = [track(profiler, 0, requested=True).id for _ in range(3)]
+    assert {p["id"] for p in profiler.list_profiles()} == set(sorted(ids)[1:])
+
+def test_load_rejects_paths_outside_the_profile_directory(tmp_path):
+    profiler = make_profiler(tmp_path, slow_threshold_sec=0)
+    assert profiler.load("../secreto") is None
+    assert profiler.load(".oculto") is None
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+import shared_cache
+from shared_cache import SQLiteCache, open_shared_cache, pack_vector, unpack_vector
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache" / "shared.sqlite3"), ttl_sec=60, max_entries=100)
+    yield cache
+    cache.close()
+
+def test_vectors_round_trip_as_float32():
+    vector = [0.5, -1.25, 3.0]
+    assert unpack_vector(pack_vector(vector)) == vector
+    assert len(pack_vector([0.0] * 768)) == 768 * 4
+
+def test_get_many_returns_hits_and_counts_misses(cache):
+    cache.set_many("emb", {"a": b"1", "b": b"2"})
+    assert cache.get_many("emb", ["a", "b", "c", "a"]) == {"a": b"1", "b": b"2"}
+    assert cache.get_many("otro", ["a"]) == {}
+    assert cache.stats.as_dict() == {"hits": 2, "misses": 2, "errors": 0}
+
+def test_entries_expire(cache, monkeypatch):
+    cache.set_many("emb", {"a": b"1"})
+    real_time = shared_cache.time.time
+    monkeypatch.setattr(shared_cache.time, "time", lambda: real_time() + 61)
+    assert cache.get_many("emb", ["a"]) == {}
+
+def test_prune_keeps_the_newest_entries(cache, monkeypatch):
+    monkeypatch.setattr(SQLiteCache, "PRUNE_EVERY", 1)
+    cache.max_entries = 2
+    for i, key in enumerate("abc"):
+        monkeypatch.setattr(shared_cache.time, "time", lambda i=i: 1000.0 + i)
+        cache.set_many("emb", {key: b"x"})
+    assert set(cache.get_many("emb", "abc")) == {"b", "c"}
+
+def test_cache_is_shared_between_connections(cache):
+    other = SQLiteCache(cache.path, ttl_sec=60, max_entries=100)
+    try:
+        # Otro hilo usa su propia conexión
+        thread = threading.Thread(target=cache.set_many, args=("emb", {"k": b"v"}))
+        thread.start()
+        thread.join()
+        assert other.get_many("emb", ["k"]) == {"k": b"v"}
+    finally:
+        other.close()
+
+def test_errors_count_as_misses(cache):
+    cache.close()
+    cache._conn().execute("DROP TABLE cache")
+    assert cache.get_many("emb", ["a"]) == {}
+    cache.set_many("emb", {"a": b"1"})
+    assert cache.stats.errors == 2
+
+def test_open_shared_cache_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(shared_cache, "SHARED_CACHE_URL", "off")
+    assert open_shared_cache() is None
@@ -0,0 +1,30 @@
+from snippets import HIGHLIGHT_FIELD, make_snippet, solr_highlight_params, solr_highlight_text
+
+def test_make_snippet_keeps_short_content():
+    assert make_snippet("Texto corto.", "consulta", max_chars=50) == "Texto corto."
+
+def test_make_snippet_centres_on_the_first_query_word():
+    content = " ".join(f"palabra{i}" for i in range(50)) + " desaparición forzada " + " ".join(f"relleno{i}" for i in range(50))
+    snippet = make_snippet(content, "¿Qué pasó con la desaparición?", max_chars=120)
+    assert "desaparición" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert len(snippet) <= 120 + 2
+    # Los cortes caen en límites de palabra
+    assert snippet[1:].split()[0] in content.split()
+    assert snippet[:-1].split()[-1] in content.split()
+
+def test_make_snippet_without_match_starts_at_the_beginning():
+    content = "inicio " + "x " * 200
+    snippet = make_snippet(content, "nada", max_chars=40)
+    assert snippet.startswith("inicio")
+    assert snippet.endswith("…")
+
+def test_solr_highlight_text_joins_passages():
+    highlighting = {"doc1": {HIGHLIGHT_FIELD: ["la <em>paz</em>", "otra <em>paz</em>"]}, "doc2": {}}
+    assert solr_highlight_text(highlighting, "doc1") == "la <em>paz</em> … otra <em>paz</em>"
+    assert solr_highlight_text(highlighting, "doc2") is None
+    assert solr_highlight_text(highlighting, "doc3") is None
+
+def test_solr_highlight_params_bound_fragment_size():
+    assert solr_highlight_params(300)["hl.fragsize"] == 150
+    assert solr_highlight_params(40)["hl.fragsize"] == 50
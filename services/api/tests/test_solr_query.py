@@ -0,0 +1,27 @@
+import solr_query
+from solr_query import build_solr_query, escape_query, SOLR_FL_IDS
+
+def test_escape_query_escapes_lucene_syntax():
+    assert escape_query('text_content:"paz" +(víctimas)~2 a/b') == (
+        'text_content\\:\\"paz\\" \\+\\(víctimas\\)\\~2 a\\/b'
+    )
+
+def test_escape_query_neutralizes_operators():
+    assert escape_query("paz AND NOT guerra OR TO") == "paz and not guerra or to"
+    # Sólo los operadores exactos: el resto de palabras en mayúsculas no cambia
+    assert escape_query("ANDES NOTA") == "ANDES NOTA"
+
+def test_escape_query_bounds_length_and_terms(monkeypatch):
+    monkeypatch.setattr(solr_query, "MAX_QUERY_TERMS", 3)
+    assert escape_query("uno dos tres cuatro cinco") == "uno dos tres"
+    monkeypatch.setattr(solr_query, "MAX_QUERY_CHARS", 6)
+    assert escape_query("abcdefghij") == "abcdef"
+
+def test_build_solr_query_uses_edismax_without_field_queries():
+    q, params = build_solr_query("¿víctimas:?", 7, fl=SOLR_FL_IDS)
+    assert q == "¿víctimas\\:\\?"
+    assert params["defType"] == "edismax"
+    assert params["uf"] == "-*"
+    assert params["lowercaseOperators"] == "false"
+    assert params["fl"] == "id, index_version_s"
+    assert params["rows"] == 7
@@ -0,0 +1,26 @@
+import asyncio
+import time
+
+from startup import StartupReport
+
+def test_phases_run_concurrently_and_errors_are_recorded():
+    def slow():
+        time.sleep(0.1)
+
+    def broken():
+        raise RuntimeError("sin conexión")
+
+    report = StartupReport()
+    assert not report.done and not report.summary()["done"]
+
+    start = time.perf_counter()
+    asyncio.run(report.run_concurrently({"a": slow, "b": slow, "roto": broken}))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.19   # En paralelo, no 0.2 s
+    assert report.done
+    assert set(report.phases) == {"a", "b", "roto"}
+    assert report.errors == {"roto": "sin conexión"}
+    summary = report.summary()
+    assert summary["done"] and summary["elapsed_sec"] == report.total_sec
+    report.print_report()
@@ -0,0 +1,47 @@
+import json
+
+from tesauro import SynonymMatcher, load_synonym_matcher
+
+GROUPS = [
+    ["FARC-EP", "FARC", "Fuerzas Armadas Revolucionarias de Colombia"],
+    ["Comisión de la Verdad", "CEV"],
+]
+
+def test_find_returns_longest_match_with_original_offsets():
+    matcher = SynonymMatcher(GROUPS)
+    query = "¿Qué dijo la COMISION de la verdad sobre las Fuerzas Armadas Revolucionarias de Colombia?"
+    matches = matcher.find(query)
+    assert [(query[start:end], group) for start, end, group in matches] == [
+        ("COMISION de la verdad", 1),
+        ("Fuerzas Armadas Revolucionarias de Colombia", 0),
+    ]
+
+def test_find_offsets_survive_characters_that_lengthen_when_lowercased():
+    matcher = SynonymMatcher(GROUPS)
+    query = "İstanbul FARC"
+    (start, end, group), = matcher.find(query)
+    assert query[start:end] == "FARC"
+    assert matcher.expand_variants(query, max_variants=1) == ["İstanbul FARC", "İstanbul FARC-EP"]
+
+def test_expand_append_skips_terms_already_in_the_query():
+    matcher = SynonymMatcher(GROUPS)
+    assert matcher.expand_append("CEV y FARC") == (
+        "CEV y FARC (Comisión de la Verdad, FARC-EP, Fuerzas Armadas Revolucionarias de Colombia)"
+    )
+    assert matcher.expand_append("sin términos del tesauro") == "sin términos del tesauro"
+
+def test_expand_variants_is_bounded():
+    matcher = SynonymMatcher(GROUPS)
+    variants = matcher.expand_variants("la CEV y las FARC", max_variants=2)
+    assert variants == [
+        "la CEV y las FARC",
+        "la Comisión de la Verdad y las FARC",
+        "la CEV y las FARC-EP",
+    ]
+
+def test_load_synonym_matcher_ignores_groups_without_synonyms(tmp_path):
+    path = tmp_path / "tesauro_compilado.json"
+    path.write_text(json.dumps({"groups": GROUPS + [["Solo"]]}), encoding="utf-8")
+    matcher = load_synonym_matcher(str(path))
+    assert len(matcher) == 2
+    assert matcher.find("Solo") == []
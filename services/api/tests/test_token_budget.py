@@ -0,0 +1,58 @@
+import pytest
+
+from token_budget import MIN_OUTPUT_TOKENS, TokenMeter
+
+@pytest.fixture
+def meter():
+    meter = TokenMeter()
+    meter.chars_per_token = 4.0
+    return meter
+
+def test_estimate_uses_chars_per_token(meter):
+    assert meter.estimate("") == 0
+    assert meter.estimate("ab") == 1
+    assert meter.estimate("x" * 40) == 10
+
+def test_fit_context_keeps_documents_that_fit(meter):
+    assert meter.fit_context(["a" * 40, "b" * 40], 20) == (["a" * 40, "b" * 40], False)
+    assert meter.fit_context(["a" * 40], None) == (["a" * 40], False)
+
+def test_fit_context_cuts_the_next_document_at_a_word_boundary(meter):
+    first = "uno dos tres cuatro."          # 5 tokens
+    second = "alfa beta gama delta epsilon" # 7 tokens
+    contents, truncated = meter.fit_context([first, second, "descartado"], 9)
+    assert truncated
+    assert contents == [first, "alfa beta gama"]
+
+def test_fit_context_never_drops_the_first_document_entirely(meter):
+    contents, truncated = meter.fit_context(["Comisiónparalaverdad " + "x" * 100], 2)
+    assert truncated
+    assert contents == ["Comisión"]   # Media palabra antes que un prompt sin contexto
+
+def test_fit_context_without_room_for_a_token_returns_nothing(meter):
+    assert meter.fit_context(["texto"], 0) == ([], True)
+
+def test_observe_calibrates_estimates(meter):
+    meter.observe("x" * 300, prompt_tokens=100, output_tokens=None, elapsed_sec=None)
+    assert meter.chars_per_token == pytest.approx(0.9 * 4.0 + 0.1 * 3.0)
+    meter.observe("", prompt_tokens=None, output_tokens=None, elapsed_sec=1.0)
+    assert meter.chars_per_token == pytest.approx(3.9)
+
+def test_output_budget_fits_the_latency_budget(meter):
+    meter.sec_per_output_token = 0.01
+    assert meter.output_budget(1000, None) == 1000
+    assert meter.output_budget(1000, 2.0) == 200
+    assert meter.output_budget(1000, 0.01) == MIN_OUTPUT_TOKENS
+    assert meter.output_budget(100, 60) == 100
+
+def test_output_budget_never_raises_an_explicit_cap(meter):
+    meter.sec_per_output_token = 0.01
+    assert meter.output_budget(10, 0.01) == 10
+    assert meter.output_budget(MIN_OUTPUT_TOKENS - 1, None) == MIN_OUTPUT_TOKENS - 1
+
+def test_record_accumulates_totals(meter):
+    meter.record(100, 20, truncated=True)
+    meter.record(50, 10, truncated=False)
+    stats = meter.stats()
+    assert (stats["requests"], stats["prompt_tokens"], stats["truncated_contexts"]) == (2, 150, 1)
+    assert stats["avg_output_tokens"] == 15.0
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+import warmup
+from warmup import BOOT_ID_ENV, QueryLog, Warmer, load_gold_standard_queries, warmup_key
+
+@pytest.fixture
+def query_log(tmp_path):
+    log = QueryLog(str(tmp_path / "cache" / "query_log.sqlite3"), max_entries=100, max_chars=50, ttl_days=30)
+    yield log
+    log.close()
+
+def test_popular_queries_are_counted_by_normalized_form(query_log):
+    for query in ("¿Qué es la JEP?", "  ¿qué es   la JEP? ", "¿Qué es la CEV?"):
+        query_log.record(query)
+    query_log.flush()
+    query_log.record("¿Qué es la JEP?")
+    query_log.flush()
+    assert query_log.top(10, min_count=2) == ["¿Qué es la JEP?"]
+    assert query_log.top(10, min_count=1) == ["¿Qué es la JEP?", "¿Qué es la CEV?"]
+    assert query_log.top(1, min_count=1) == ["¿Qué es la JEP?"]
+
+def test_personal_data_and_long_queries_are_not_logged(query_log):
+    for query in ("escribir a ana@example.org", "cédula 12345678", "x" * 51, "   "):
+        query_log.record(query)
+    query_log.flush()
+    assert query_log.skipped == 4
+    assert query_log.top(10, min_count=1) == []
+
+def test_log_is_bounded_to_the_most_frequent(tmp_path):
+    log = QueryLog(str(tmp_path / "q.sqlite3"), max_entries=2, max_chars=50, ttl_days=30)
+    for query, times in (("a", 3), ("b", 1), ("c", 2)):
+        for _ in range(times):
+            log.record(query)
+    log.flush()
+    assert log.top(10, min_count=1) == ["a", "c"]
+    log.close()
+
+def test_warmer_runs_each_index_version_once(tmp_path):
+    warmed = []
+
+    async def warm_query(query):
+        if query == "falla":
+            raise RuntimeError("solr caído")
+        warmed.append(query)
+
+    async def scenario():
+        first = Warmer(warm_query, concurrency=2, state_dir=str(tmp_path))
+        await first.run(["a", "b", "falla"], "v1")
+        # Otro worker (misma carpeta de estado) no repite la misma versión
+        second = Warmer(warm_query, concurrency=2, state_dir=str(tmp_path))
+        await second.run(["a", "b", "falla"], "v1")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert sorted(warmed) == ["a", "b"]
+    assert first.summary()["done"] == 3 and first.coverage == 1.0 and first.leader
+    assert not second.leader and second.coverage == 1.0
+
+def test_a_new_boot_warms_the_same_index_version_again(tmp_path, monkeypatch):
+    warmed = []
+
+    async def warm_query(query):
+        warmed.append(query)
+
+    async def boot(boot_id):
+        # Cada arranque: el master de gunicorn fija un id nuevo; el estado
+        # del warm-up persiste en el volumen compartido (state_dir)
+        monkeypatch.setenv(BOOT_ID_ENV, boot_id)
+        for _ in range(2):  # Dos workers del mismo arranque
+            await Warmer(warm_query, concurrency=2, state_dir=str(tmp_path)).run(["a"], warmup_key("v1"))
+
+    asyncio.run(boot("arranque-1"))
+    asyncio.run(boot("arranque-2"))
+    assert warmed == ["a", "a"]
+
+def test_warmup_key_without_gunicorn_is_per_process(monkeypatch):
+    monkeypatch.delenv(BOOT_ID_ENV, raising=False)
+    assert warmup_key("v1") == f"v1@{warmup._PROCESS_BOOT_ID}"
+
+def test_warmer_reports_the_leaders_progress_to_other_workers(tmp_path):
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def warm_query(query):
+            await gate.wait()
+
+        leader = Warmer(warm_query, concurrency=1, state_dir=str(tmp_path))
+        follower = Warmer(warm_query, concurrency=1, state_dir=str(tmp_path))
+        task = asyncio.ensure_future(leader.run(["a", "b"], "v2"))
+        await asyncio.sleep(0.01)
+        follower.version, follower.running = "v2", True
+        during = follower.coverage
+        gate.set()
+        await task
+        return during, follower.coverage
+
+    assert asyncio.run(scenario()) == (0.0, 1.0)
+
+def test_load_gold_standard_queries(tmp_path):
+    path = tmp_path / "gold_standard.json"
+    path.write_text(json.dumps([{"query": "¿Qué es la JEP?"}]), encoding="utf-8")
+    assert load_gold_standard_queries(str(path)) == ["¿Qué es la JEP?"]
+    assert load_gold_standard_queries(str(tmp_path / "no-existe.json")) == []
@@ -0,0 +1,99 @@
+# Archivo: /services/api/token_budget.py
+# Conteo de tokens del prompt y presupuestos de generación por petición:
+# recorte del contexto a un máximo de tokens de entrada y max_output_tokens
+# adaptado a un presupuesto de latencia.
+
+import os
+from typing import List, Optional, Tuple
+
+# Aproximación local antes de tener datos reales de Gemini (texto en español)
+DEFAULT_CHARS_PER_TOKEN = float(os.getenv("TOKEN_CHARS_PER_TOKEN", "4.0"))
+# Velocidad de generación supuesta hasta medir la real
+DEFAULT_OUTPUT_TOKENS_PER_SEC = float(os.getenv("OUTPUT_TOKENS_PER_SEC", "80"))
+# Nunca se pide menos que esto (una respuesta útil mínima)
+MIN_OUTPUT_TOKENS = int(os.getenv("MIN_OUTPUT_TOKENS", "64"))
+
+class TokenMeter:
+    """
+    Estima tokens sin llamar a la API y se calibra con el 'usage_metadata'
+    de cada respuesta real de Gemini (caracteres por token del prompt y
+    segundos por token generado, como medias móviles). También acumula
+    los totales para /health.
+    """
+
+    def __init__(self):
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self.sec_per_output_token = 1.0 / DEFAULT_OUTPUT_TOKENS_PER_SEC
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.truncated_contexts = 0
+
+    def estimate(self, text: str) -> int:
+        return max(1, round(len(text) / self.chars_per_token)) if text else 0
+
+    def observe(self, prompt: str, prompt_tokens: Optional[int], output_tokens: Optional[int],
+                elapsed_sec: Optional[float]):
+        """Calibra con una llamada real (los None se ignoran)."""
+        if prompt_tokens:
+            self.chars_per_token = 0.9 * self.chars_per_token + 0.1 * (len(prompt) / prompt_tokens)
+        if output_tokens and elapsed_sec:
+            self.sec_per_output_token = 0.9 * self.sec_per_output_token + 0.1 * (elapsed_sec / output_tokens)
+
+    def record(self, prompt_tokens: int, output_tokens: int, truncated: bool):
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self.truncated_contexts += int(truncated)
+
+    def output_budget(self, max_output_tokens: int, latency_budget_sec: Optional[float]) -> int:
+        """
+        max_output_tokens para la llamada: el límite pedido, reducido para que
+        la generación quepa en 'latency_budget_sec' al ritmo medido. El
+        presupuesto de latencia no baja de MIN_OUTPUT_TOKENS, pero el límite
+        pedido nunca se supera.
+        """
+        if latency_budget_sec is None:
+            return max_output_tokens
+        affordable = int(latency_budget_sec / self.sec_per_output_token)
+        return min(max_output_tokens, max(MIN_OUTPUT_TOKENS, affordable))
+
+    def fit_context(self, contents: List[str], max_tokens: Optional[int]) -> Tuple[List[str], bool]:
+        """
+        Recorta los documentos (en orden de relevancia) para que quepan en
+        'max_tokens': se conservan enteros mientras caben, el siguiente se
+        corta y el resto se descarta. El primero nunca se descarta entero: si
+        no cabe se corta (sin respetar palabras si hace falta); sólo queda
+        vacío si no hay sitio ni para un token. Devuelve (contenidos, hubo_recorte).
+        """
+        if max_tokens is None:
+            return contents, False
+        fitted = []
+        remaining = max_tokens
+        for content in contents:
+            tokens = self.estimate(content)
+            if tokens <= remaining:
+                fitted.append(content)
+                remaining -= tokens
+                continue
+            # Corte en el último espacio antes del límite
+            limit = content[:int(remaining * self.chars_per_token)]
+            cut = limit[:limit.rfind(" ")].rstrip() if " " in limit else limit
+            if not cut and not fitted:
+                cut = limit # Mejor media palabra que un prompt sin contexto
+            if cut:
+                fitted.append(cut)
+            return fitted, True
+        return fitted, False
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0,
+            "avg_output_tokens": round(self.output_tokens / self.requests, 1) if self.requests else 0,
+            "truncated_contexts": self.truncated_contexts,
+            "chars_per_token": round(self.chars_per_token, 3),
+            "output_tokens_per_sec": round(1.0 / self.sec_per_output_token, 1)
+        }
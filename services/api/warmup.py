@@ -0,0 +1,228 @@
+# Archivo: /services/api/warmup.py
+# Registro de consultas populares y calentamiento (warm-up) de cachés: al
+# arrancar o tras una reindexación se repiten en segundo plano las consultas
+# más frecuentes (y opcionalmente las del Gold Standard) por la recuperación,
+# para que los primeros usuarios no paguen las cachés frías de Solr, Milvus
+# y los embeddings.
+
+import asyncio
+import fcntl
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable, List
+
+from coalescing import normalize_query
+
+# Identificador del arranque de la API: el master de gunicorn lo fija en
+# on_starting (gunicorn.conf.py) y lo heredan todos sus workers. Sin gunicorn
+# (uvicorn) se usa uno por proceso.
+BOOT_ID_ENV = "API_BOOT_ID"
+_PROCESS_BOOT_ID = uuid.uuid4().hex
+
+# Consultas que parecen contener datos personales: no se registran
+_PII_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+|\d{6,}")
+
+class QueryLog:
+    """
+    Contador de consultas normalizadas en SQLite (compartido por los workers).
+    - Acotado: como mucho 'max_entries' consultas; se descartan las menos
+      frecuentes y las no vistas en 'ttl_days'.
+    - Privacidad: sólo texto normalizado, sin ids de usuario ni IPs; se
+      descartan las consultas largas o con correos/números largos, y al
+      calentar sólo se usan las vistas al menos 'min_count' veces.
+    - record() sólo suma en memoria; flush() escribe (llamarlo fuera del event loop).
+    """
+
+    def __init__(self, path: str, max_entries: int, max_chars: int, ttl_days: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl_sec = ttl_days * 24 * 3600
+        self.skipped = 0
+        self._pending = Counter()
+        self._texts = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_log ("
+            " query TEXT PRIMARY KEY, text TEXT NOT NULL, count INTEGER NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def record(self, query: str):
+        # Se cuenta por la forma normalizada, pero se guarda el texto tal como
+        # se escribió (sin espacios sobrantes): es el que llega a los embeddings
+        normalized = normalize_query(query)
+        if not normalized or len(normalized) > self.max_chars or _PII_RE.search(normalized):
+            self.skipped += 1
+            return
+        self._pending[normalized] += 1
+        self._texts[normalized] = " ".join(query.split())
+
+    def flush(self):
+        pending, self._pending = self._pending, Counter()
+        texts, self._texts = self._texts, {}
+        if not pending:
+            return
+        now = time.time()
+        try:
+            self._conn.executemany(
+                "INSERT INTO query_log (query, text, count, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(query) DO UPDATE SET text = excluded.text, count = count + excluded.count,"
+                " last_seen = excluded.last_seen",
+                [(query, texts[query], count, now) for query, count in pending.items()]
+            )
+            self._conn.execute("DELETE FROM query_log WHERE last_seen < ?", (now - self.ttl_sec,))
+            self._conn.execute(
+                "DELETE FROM query_log WHERE query NOT IN "
+                "(SELECT query FROM query_log ORDER BY count DESC, last_seen DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"No se pudo escribir el registro de consultas: {e}")
+
+    def top(self, n: int, min_count: int) -> List[str]:
+        """Las 'n' consultas más frecuentes vistas al menos 'min_count' veces."""
+        rows = self._conn.execute(
+            "SELECT text FROM query_log WHERE count >= ? ORDER BY count DESC, last_seen DESC LIMIT ?",
+            (min_count, n)
+        ).fetchall()
+        return [text for (text,) in rows]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+class Warmer:
+    """
+    Ejecuta el calentamiento de una versión del índice con concurrencia
+    acotada. Con varios workers sólo uno lo hace (lock de fichero); los
+    demás leen su progreso del fichero de estado compartido.
+    """
+
+    def __init__(self, warm_query: Callable[[str], Awaitable[None]], concurrency: int, state_dir: str):
+        self.warm_query = warm_query
+        self.concurrency = max(1, concurrency)
+        self.lock_path = os.path.join(state_dir, "warmup.lock")
+        self.state_path = os.path.join(state_dir, "warmup_state.json")
+        os.makedirs(state_dir, exist_ok=True)
+        self.version = None
+        self.total = 0
+        self.done = 0
+        self.running = False
+        self.leader = False
+        self.started_at = None
+        self.elapsed_sec = None
+
+    def _shared_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_state(self):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.version, "total": self.total, "done": self.done,
+                       "running": self.running}, f)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def coverage(self) -> float:
+        if not self.leader:
+            # Progreso del worker que calienta esta misma versión
+            state = self._shared_state()
+            if state.get("version") != self.version:
+                return 0.0 if self.running else 1.0
+            return state["done"] / state["total"] if state.get("total") else 1.0
+        return self.done / self.total if self.total else 1.0
+
+    async def run(self, queries: List[str], version: str):
+        """
+        Calienta 'queries' para 'version' (clave de la pasada: versión del
+        índice y arranque). Si otro worker ya la hizo o la está haciendo,
+        se limita a esperar su resultado.
+        """
+        self.version = version
+        self.total = len(queries)
+        self.done = 0
+        self.leader = False
+        self.started_at = time.monotonic()
+        self.running = True
+        lock_file = open(self.lock_path, 'w')
+        try:
+            waiting = False
+            while True:
+                state = self._shared_state()
+                if state.get("version") == version and not state.get("running"):
+                    if not waiting:
+                        print(f"Warm-up de {version} ya hecho por otro worker.")
+                    return
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # Otro worker está calentando; si muere, el lock queda libre
+                    if not waiting:
+                        print("Warm-up en curso en otro worker; esperando.")
+                        waiting = True
+                    await asyncio.sleep(1)
+
+            self.leader = True
+            self._write_state()
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def warm(query: str):
+                async with semaphore:
+                    try:
+                        await self.warm_query(query)
+                    except Exception as e:
+                        print(f"Warm-up: fallo en una consulta ({e}).")
+                    self.done += 1
+                    if self.done % 10 == 0:
+                        self._write_state()
+
+            print(f"Warm-up: {self.total} consultas ({version}).")
+            await asyncio.gather(*(warm(query) for query in queries))
+        finally:
+            self.running = False
+            self.elapsed_sec = round(time.monotonic() - self.started_at, 3)
+            if self.leader:
+                self._write_state()
+                print(f"Warm-up terminado: {self.done}/{self.total} consultas en {self.elapsed_sec}s.")
+            lock_file.close() # Libera el lock
+
+    def summary(self) -> dict:
+        return {
+            "version": self.version,
+            "running": self.running,
+            "leader": self.leader,
+            "total": self.total,
+            "done": self.done,
+            "coverage": round(self.coverage, 3),
+            "elapsed_sec": self.elapsed_sec
+        }
+
+def warmup_key(index_version: str) -> str:
+    """
+    Clave de una pasada de warm-up: versión del índice y arranque. Los workers
+    de un mismo arranque la comparten (sólo uno calienta); tras un reinicio, o
+    en otra réplica con el mismo volumen, la clave cambia y se calienta de nuevo.
+    """
+    return f"{index_version}@{os.getenv(BOOT_ID_ENV) or _PROCESS_BOOT_ID}"
+
+def load_gold_standard_queries(path: str) -> List[str]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [item['query'] for item in json.load(f)]
+    except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
+        print(f"Warm-up: no se pudo leer el Gold Standard ({e}).")
+        return []
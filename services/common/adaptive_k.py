@@ -0,0 +1,79 @@
+# Archivo: /services/common/adaptive_k.py
+# k adaptativo: en lugar de devolver siempre k documentos, la lista se corta
+# cuando la relevancia cae por debajo de un umbral o da un salto brusco.
+# Los umbrales por backend se calibran con el Gold Standard
+# (services/evaluator/calibrate_adaptive_k.py). Módulo compartido por la API
+# y el evaluador, para que la calibración corte exactamente igual que la API.
+#
+# Puntuaciones:
+#   solr    score BM25 (mayor es mejor); los umbrales son relativos al primero,
+#           porque el valor absoluto depende de la consulta
+#   milvus  distancia L2 (menor es mejor); los umbrales son absolutos
+
+import json
+import os
+from typing import Dict, List, Optional
+
+DEFAULT_THRESHOLDS = {
+    # Se conserva mientras score >= min_relative_score * score_del_primero y
+    # la caída respecto al anterior (relativa al primero) no supera max_gap
+    "solr": {"min_relative_score": 0.0, "max_gap": None},
+    # Se conserva mientras distancia <= max_distance y el aumento respecto
+    # al anterior no supera max_gap
+    "milvus": {"max_distance": None, "max_gap": None}
+}
+
+def cutoff(backend: str, scores: List[float], thresholds: Dict[str, Optional[float]], min_k: int = 1) -> int:
+    """
+    Cuántos resultados conservar de una lista ordenada por relevancia.
+    Siempre conserva al menos 'min_k' (si los hay).
+    """
+    keep = 0
+    for i, score in enumerate(scores):
+        previous = scores[i - 1] if i > 0 else None
+        if backend == "milvus":
+            max_distance = thresholds.get("max_distance")
+            if max_distance is not None and score > max_distance:
+                break
+            max_gap = thresholds.get("max_gap")
+            if max_gap is not None and previous is not None and score - previous > max_gap:
+                break
+        else:
+            top = scores[0]
+            if top <= 0:
+                break
+            if score / top < (thresholds.get("min_relative_score") or 0.0):
+                break
+            max_gap = thresholds.get("max_gap")
+            if max_gap is not None and previous is not None and (previous - score) / top > max_gap:
+                break
+        keep = i + 1
+    return max(keep, min(min_k, len(scores)))
+
+def rank_by_score(backend: str, scores: List[float]) -> List[int]:
+    """
+    Posiciones de la lista ordenadas por el score que se umbraliza (orden
+    estable). Con la expansión "multi" de Milvus la lista llega en orden RRF
+    y su score es la mejor distancia entre variantes, que no es monótona;
+    cutoff() necesita la lista ordenada por ese mismo score.
+    """
+    if backend == "milvus":
+        return sorted(range(len(scores)), key=lambda i: scores[i])
+    return sorted(range(len(scores)), key=lambda i: -scores[i])
+
+def select(backend: str, scores: List[float], thresholds: Dict[str, Optional[float]], min_k: int = 1) -> List[int]:
+    """Posiciones que conserva el k adaptativo, de la más a la menos relevante por score."""
+    order = rank_by_score(backend, scores)
+    return order[:cutoff(backend, [scores[i] for i in order], thresholds, min_k)]
+
+def load_thresholds(path: str) -> Dict[str, Dict[str, Optional[float]]]:
+    """Umbrales calibrados (si existe el archivo) sobre los valores por defecto."""
+    thresholds = {backend: dict(values) for backend, values in DEFAULT_THRESHOLDS.items()}
+    if not os.path.exists(path):
+        return thresholds
+    with open(path, 'r', encoding='utf-8') as f:
+        calibrated = json.load(f)
+    for backend, values in calibrated.get("thresholds", {}).items():
+        if backend in thresholds:
+            thresholds[backend].update({name: values[name] for name in thresholds[backend] if name in values})
+    return thresholds
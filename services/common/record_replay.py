@@ -0,0 +1,132 @@
+# Archivo: /services/common/record_replay.py
+# Grabación y reproducción ("cassette") de llamadas externas deterministas por
+# clave: generaciones de Gemini y embeddings en la API, respuestas de /ask en
+# el evaluador. Módulo compartido: las imágenes de ambos servicios lo copian
+# en /common (PYTHONPATH).
+#
+# Modos (RECORD_REPLAY_MODE en la API, EVAL_RECORD_REPLAY_MODE en el evaluador):
+#   off     sin cassette
+#   record  llama siempre al servicio y guarda la respuesta
+#   replay  sólo responde desde el cassette; si falta la clave, ReplayMiss
+#   auto    responde desde el cassette y graba lo que falte
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterable, Optional
+
+RECORD_REPLAY_MODES = ("off", "record", "replay", "auto")
+
+class ReplayMiss(Exception):
+    """En modo replay se pidió una llamada que no está grabada."""
+
+def cassette_key(*parts: Any) -> str:
+    """Clave estable de una llamada: hash del JSON canónico de sus parámetros."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    Respuestas grabadas en un fichero SQLite (seguro entre procesos), cada una
+    comprimida con zlib. Los valores son JSON o bytes (ej. embeddings float32).
+    """
+
+    def __init__(self, path: str, mode: str):
+        if mode not in RECORD_REPLAY_MODES or mode == "off":
+            raise ValueError(f"Modo de record/replay no válido: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.recorded = 0
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cassette ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, is_bytes INTEGER NOT NULL, value BLOB NOT NULL,"
+            " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+        )
+        conn.commit()
+
+    @property
+    def reads(self) -> bool:
+        return self.mode in ("replay", "auto")
+
+    @property
+    def writes(self) -> bool:
+        return self.mode in ("record", "auto")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """Valores grabados de las claves pedidas (vacío si el modo no lee)."""
+        keys = list(dict.fromkeys(keys))
+        if not self.reads or not keys:
+            return {}
+        found = {}
+        # SQLite limita el número de parámetros por consulta
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT key, is_bytes, value FROM cassette WHERE ns = ? AND key IN ({','.join('?' * len(chunk))})",
+                [namespace, *chunk]
+            ).fetchall()
+            for key, is_bytes, value in rows:
+                raw = zlib.decompress(value)
+                found[key] = raw if is_bytes else json.loads(raw)
+        self.hits += len(found)
+        return found
+
+    def put_many(self, namespace: str, values: Dict[str, Any]):
+        if not self.writes or not values:
+            return
+        rows = []
+        for key, value in values.items():
+            is_bytes = isinstance(value, bytes)
+            raw = value if is_bytes else json.dumps(value, ensure_ascii=False).encode("utf-8")
+            rows.append((namespace, key, int(is_bytes), zlib.compress(raw, 6)))
+        conn = self._conn()
+        conn.executemany("INSERT OR REPLACE INTO cassette (ns, key, is_bytes, value) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        self.recorded += len(rows)
+
+    def call(self, namespace: str, key: str, fn: Callable[[], Any]) -> Any:
+        """Devuelve la respuesta grabada o llama a 'fn' (y la graba según el modo)."""
+        found = self.get_many(namespace, [key])
+        if key in found:
+            return found[key]
+        if self.mode == "replay":
+            raise ReplayMiss(f"Llamada no grabada en el cassette ({namespace}:{key[:12]}).")
+        value = fn()
+        self.put_many(namespace, {key: value})
+        return value
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "hits": self.hits, "recorded": self.recorded}
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+def open_cassette(path: str, mode: str) -> Optional[Cassette]:
+    """Cassette para el modo configurado, o None si está desactivado."""
+    mode = (mode or "off").lower()
+    if mode == "off":
+        return None
+    return Cassette(path, mode)
@@ -0,0 +1,6 @@
+# Los módulos compartidos se importan desde /common en las imágenes.
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))
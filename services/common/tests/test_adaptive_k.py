@@ -0,0 +1,44 @@
+import json
+
+from adaptive_k import DEFAULT_THRESHOLDS, cutoff, load_thresholds, rank_by_score, select
+
+def test_defaults_keep_everything():
+    assert cutoff("solr", [10.0, 5.0, 1.0], DEFAULT_THRESHOLDS["solr"]) == 3
+    assert cutoff("milvus", [0.2, 0.9, 1.5], DEFAULT_THRESHOLDS["milvus"]) == 3
+
+def test_solr_cuts_on_relative_score_and_gap():
+    assert cutoff("solr", [10.0, 8.0, 4.0, 3.5], {"min_relative_score": 0.5}) == 2
+    assert cutoff("solr", [10.0, 9.0, 4.0, 3.5], {"max_gap": 0.3}) == 2
+
+def test_milvus_cuts_on_distance_and_gap():
+    assert cutoff("milvus", [0.3, 0.5, 0.9], {"max_distance": 0.6}) == 2
+    assert cutoff("milvus", [0.3, 0.4, 0.9], {"max_gap": 0.2}) == 2
+
+def test_min_k_is_always_kept():
+    assert cutoff("milvus", [2.0, 3.0, 4.0], {"max_distance": 1.0}, min_k=2) == 2
+    assert cutoff("solr", [0.0, 0.0], {}, min_k=1) == 1
+    assert cutoff("solr", [], {}, min_k=3) == 0
+
+def test_rank_by_score_is_stable_per_backend():
+    assert rank_by_score("milvus", [0.5, 0.2, 0.5, 0.1]) == [3, 1, 0, 2]
+    assert rank_by_score("solr", [1.0, 3.0, 1.0, 2.0]) == [1, 3, 0, 2]
+
+def test_select_thresholds_the_list_sorted_by_score():
+    # Orden RRF (expansión "multi"): las distancias no son monótonas
+    scores = [0.4, 0.2, 1.4, 0.5]
+    assert select("milvus", scores, {"max_distance": 0.45}) == [1, 0]
+    # Sin ordenar, el salto 0.2 -> 1.4 dejaría fuera al de 0.5
+    assert select("milvus", scores, {"max_gap": 0.5}) == [1, 0, 3]
+
+def test_load_thresholds_overrides_only_known_values(tmp_path):
+    assert load_thresholds(str(tmp_path / "no-existe.json")) == DEFAULT_THRESHOLDS
+
+    path = tmp_path / "adaptive_k_calibration.json"
+    path.write_text(json.dumps({"thresholds": {
+        "milvus": {"max_distance": 0.8, "otro": 1},
+        "desconocido": {"max_gap": 1},
+    }}), encoding="utf-8")
+    thresholds = load_thresholds(str(path))
+    assert thresholds["milvus"] == {"max_distance": 0.8, "max_gap": None}
+    assert set(thresholds) == {"solr", "milvus"}
+    assert DEFAULT_THRESHOLDS["milvus"]["max_distance"] is None
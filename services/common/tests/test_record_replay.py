@@ -0,0 +1,53 @@
+import pytest
+
+from record_replay import Cassette, ReplayMiss, cassette_key, open_cassette
+
+def test_cassette_key_is_stable_and_order_insensitive_for_dicts():
+    assert cassette_key("gemini", {"a": 1, "b": 2}) == cassette_key("gemini", {"b": 2, "a": 1})
+    assert cassette_key("gemini", "paz") != cassette_key("gemini", "guerra")
+
+def test_off_mode_has_no_cassette(tmp_path):
+    assert open_cassette(str(tmp_path / "c.sqlite3"), "off") is None
+    assert open_cassette(str(tmp_path / "c.sqlite3"), None) is None
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "c.sqlite3"), "otro")
+
+def test_record_then_replay_without_calling_the_service(tmp_path):
+    path = str(tmp_path / "cassettes" / "c.sqlite3")
+    recorder = open_cassette(path, "RECORD")
+    assert recorder.call("gen", "k1", lambda: {"text": "respuesta"}) == {"text": "respuesta"}
+    recorder.put_many("emb", {"k2": b"\x00\x01"})
+    recorder.close()
+
+    player = open_cassette(path, "replay")
+    assert player.call("gen", "k1", lambda: pytest.fail("no debe llamar al servicio")) == {"text": "respuesta"}
+    assert player.get_many("emb", ["k2", "k3"]) == {"k2": b"\x00\x01"}
+    with pytest.raises(ReplayMiss):
+        player.call("gen", "no-grabada", lambda: "x")
+    # El replay nunca graba
+    player.put_many("gen", {"k4": "x"})
+    assert player.stats() == {"mode": "replay", "hits": 2, "recorded": 0}
+    player.close()
+
+def test_record_mode_always_calls_the_service(tmp_path):
+    cassette = Cassette(str(tmp_path / "c.sqlite3"), "record")
+    cassette.call("gen", "k", lambda: "primera")
+    assert cassette.call("gen", "k", lambda: "segunda") == "segunda"
+    assert cassette.hits == 0 and cassette.recorded == 2
+    cassette.close()
+
+def test_auto_mode_records_only_what_is_missing(tmp_path):
+    cassette = Cassette(str(tmp_path / "c.sqlite3"), "auto")
+    calls = []
+    for _ in range(2):
+        cassette.call("gen", "k", lambda: calls.append(1) or "valor")
+    assert calls == [1]
+    assert cassette.stats() == {"mode": "auto", "hits": 1, "recorded": 1}
+    cassette.close()
+
+def test_get_many_handles_more_keys_than_sqlite_parameters(tmp_path):
+    cassette = Cassette(str(tmp_path / "c.sqlite3"), "auto")
+    values = {f"k{i}": i for i in range(1200)}
+    cassette.put_many("ns", values)
+    assert cassette.get_many("ns", list(values)) == values
+    cassette.close()
@@ -0,0 +1,123 @@
+# Archivo: /services/evaluator/calibrate_adaptive_k.py
+# Calibra los umbrales del k adaptativo de la API con el Gold Standard:
+# pide a /ask los CALIBRATION_K mejores documentos (sólo recuperación, con
+# sus scores) y busca, por backend, los umbrales que maximizan el F-beta
+# medio entre los documentos conservados y los relevantes.
+#
+#   docker-compose run --rm evaluator python calibrate_adaptive_k.py
+
+import os
+import json
+import time
+from itertools import product
+from tqdm import tqdm
+from adaptive_k import select, DEFAULT_THRESHOLDS
+from evaluate import ask_api, GOLD_STANDARD_PATH, K_METRICS, BACKENDS, EVAL_CASSETTE_PATH, EVAL_RECORD_REPLAY_MODE
+from record_replay import open_cassette
+
+CALIBRATION_K = int(os.getenv("CALIBRATION_K", "10"))
+CALIBRATION_BETA = float(os.getenv("CALIBRATION_BETA", "1.0")) # >1 favorece el recall
+CALIBRATION_PATH = os.getenv("ADAPTIVE_K_CALIBRATION_PATH", "/reports/adaptive_k_calibration.json")
+MIN_K = int(os.getenv("ADAPTIVE_MIN_K", "1"))
+
+def f_beta(kept: list, relevant: list, beta: float) -> float:
+    hits = len(set(kept) & set(relevant))
+    if hits == 0:
+        return 0.0
+    precision = hits / len(kept)
+    recall = hits / len(set(relevant))
+    return (1 + beta ** 2) * precision * recall / (beta ** 2 * precision + recall)
+
+def collect_samples(gold_standard: list, backend: str, cassette=None) -> list:
+    """(scores, ids, relevantes) de cada pregunta, sin generación."""
+    samples = []
+    for item in tqdm(gold_standard, desc=f"Recuperando ({backend})"):
+        payload = {
+            "query": item['query'],
+            "backend": backend,
+            "k": CALIBRATION_K,
+            "adaptive_k": False,
+            "generate": False,
+            "content_mode": "snippet"
+        }
+        try:
+            docs = ask_api(payload, cassette)["response"].get('source_documents', [])
+        except Exception as e:
+            print(f"Error en '{item['query'][:40]}...' ({backend}): {e}")
+            continue
+        docs = [doc for doc in docs if doc.get('score') is not None]
+        samples.append(([doc['score'] for doc in docs], [doc['id'] for doc in docs], item['relevant_chunk_ids']))
+    return samples
+
+def evaluate_thresholds(backend: str, samples: list, thresholds: dict) -> dict:
+    f_scores, kept_counts = [], []
+    for scores, ids, relevant in samples:
+        # Mismo orden y corte que la API (por score, no por el orden RRF)
+        kept = [ids[i] for i in select(backend, scores, thresholds, MIN_K)]
+        f_scores.append(f_beta(kept, relevant, CALIBRATION_BETA))
+        kept_counts.append(len(kept))
+    n = max(1, len(samples))
+    return {"f_beta": sum(f_scores) / n, "avg_docs": sum(kept_counts) / n}
+
+def candidate_grid(backend: str, samples: list) -> list:
+    if backend == "milvus":
+        distances = sorted(score for scores, _, _ in samples for score in scores)
+        quantiles = [distances[int(len(distances) * q / 20)] for q in range(1, 20)] if distances else []
+        max_distances = [None] + sorted(set(quantiles))
+        gaps = [None, 0.01, 0.02, 0.03, 0.05, 0.08, 0.1, 0.15, 0.2]
+        return [{"max_distance": d, "max_gap": g} for d, g in product(max_distances, gaps)]
+    relative = [round(0.05 * i, 2) for i in range(0, 19)]
+    gaps = [None] + [round(0.05 * i, 2) for i in range(1, 13)]
+    return [{"min_relative_score": r, "max_gap": g} for r, g in product(relative, gaps)]
+
+def calibrate_backend(backend: str, samples: list) -> tuple:
+    """Mejor combinación de umbrales (a igual F-beta, la que conserva menos documentos)."""
+    best, best_metrics = dict(DEFAULT_THRESHOLDS[backend]), None
+    for thresholds in candidate_grid(backend, samples):
+        metrics = evaluate_thresholds(backend, samples, thresholds)
+        if best_metrics is None or (round(metrics["f_beta"], 6), -metrics["avg_docs"]) > \
+                (round(best_metrics["f_beta"], 6), -best_metrics["avg_docs"]):
+            best, best_metrics = thresholds, metrics
+    return best, best_metrics
+
+def run_calibration():
+    print("--- Calibración del k adaptativo ---")
+    try:
+        with open(GOLD_STANDARD_PATH, 'r', encoding='utf-8') as f:
+            gold_standard = json.load(f)
+    except Exception as e:
+        print(f"Error al leer el Gold Standard: {e}")
+        return
+
+    cassette = open_cassette(EVAL_CASSETTE_PATH, EVAL_RECORD_REPLAY_MODE)
+    report = {
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "k": CALIBRATION_K,
+        "beta": CALIBRATION_BETA,
+        "thresholds": {},
+        "metrics": {}
+    }
+    for backend in BACKENDS:
+        samples = collect_samples(gold_standard, backend, cassette)
+        if not samples:
+            print(f"Sin muestras para {backend}; se mantienen los umbrales por defecto.")
+            continue
+        thresholds, metrics = calibrate_backend(backend, samples)
+        # Referencia: k fijo (el de la evaluación)
+        fixed = [f_beta(ids[:K_METRICS], relevant, CALIBRATION_BETA) for _, ids, relevant in samples]
+        metrics["fixed_k"] = K_METRICS
+        metrics["fixed_k_f_beta"] = sum(fixed) / len(fixed)
+        metrics["queries"] = len(samples)
+        report["thresholds"][backend] = thresholds
+        report["metrics"][backend] = metrics
+        print(f"{backend}: {thresholds} -> F{CALIBRATION_BETA:g}={metrics['f_beta']:.4f} "
+              f"con {metrics['avg_docs']:.2f} docs (k fijo={K_METRICS}: {metrics['fixed_k_f_beta']:.4f})")
+    if cassette is not None:
+        cassette.close()
+
+    with open(CALIBRATION_PATH, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Umbrales guardados en {CALIBRATION_PATH}. Reinicia la API para cargarlos.")
+
+if __name__ == "__main__":
+    run_calibration()
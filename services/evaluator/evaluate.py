@@ -1,11 +1,15 @@
 import os
+import math
 import time
 import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 import requests
 import pandas as pd
 from tqdm import tqdm
 from rouge_score import rouge_scorer
 import nltk
+from record_replay import open_cassette, cassette_key
 
 # --- Configuración ---
 API_HOST = os.getenv("API_HOST", "localhost")
@@ -15,10 +19,28 @@ API_URL = f"http://{API_HOST}:{API_PORT}/ask"
 # Rutas de los volúmenes (mapeadas en docker-compose.yml)
 GOLD_STANDARD_PATH = "/reports/gold_standard.json"
 RESULTS_PATH = "/reports/evaluation_results.csv"
+# Respuestas crudas de la API, una línea JSON por (pregunta, backend), escritas
+# a medida que llegan: si la ejecución se interrumpe, se reanuda desde aquí.
+# La primera línea guarda el hash del conjunto de evaluación; si el Gold
+# Standard (o BACKENDS/K_METRICS) cambió, el checkpoint se descarta.
+# Se borra al terminar una ejecución completa.
+CHECKPOINT_PATH = os.getenv("EVAL_CHECKPOINT_PATH", "/reports/evaluation_checkpoint.jsonl")
+EVAL_RESUME = os.getenv("EVAL_RESUME", "true").lower() == "true"
+# Procesos para el cálculo de métricas (por defecto, uno por núcleo)
+METRIC_WORKERS = int(os.getenv("EVAL_METRIC_WORKERS", str(os.cpu_count() or 1)))
+# Por debajo de este número de filas no compensa lanzar procesos
+PARALLEL_MIN_ROWS = 64
+
+BACKENDS = ["solr", "milvus"]
 
 # K para las métricas (coincide con el K de la API si se desea)
 K_METRICS = 5 
 
+# Grabación/reproducción de las respuestas de /ask: "off" | "record" | "replay" | "auto".
+# En "replay" la evaluación no necesita la API (ni Gemini): es offline y determinista.
+EVAL_RECORD_REPLAY_MODE = os.getenv("EVAL_RECORD_REPLAY_MODE", "off")
+EVAL_CASSETTE_PATH = os.getenv("EVAL_CASSETTE_PATH", "/reports/ask_cassette.sqlite3")
+
 # --- Funciones de Métricas ---
 
 def setup_nltk():
@@ -50,17 +72,215 @@ def calculate_mrr_at_k(retrieved_ids: list, relevant_ids: list, k: int) -> float
             return 1.0 / (i + 1)
     return 0.0
 
+def calculate_ndcg_at_k(retrieved_ids: list, relevant_ids: list, k: int) -> float:
+    """Calcula nDCG@k con relevancia binaria."""
+    if not relevant_ids:
+        return 0.0
+    relevant_set = set(relevant_ids)
+    dcg = sum(
+        1.0 / math.log2(i + 2)
+        for i, doc_id in enumerate(retrieved_ids[:k])
+        if doc_id in relevant_set
+    )
+    idcg = sum(1.0 / math.log2(i + 2) for i in range(min(len(relevant_set), k)))
+    return dcg / idcg
+
+# Un único RougeScorer por proceso (construirlo es caro: carga el stemmer)
+_rouge_scorer = None
+
 def calculate_rouge_l(generated_answer: str, ideal_answer: str) -> float:
     """Calcula el F-score de ROUGE-L."""
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    scores = scorer.score(ideal_answer, generated_answer)
+    global _rouge_scorer
+    if _rouge_scorer is None:
+        _rouge_scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
+    scores = _rouge_scorer.score(ideal_answer, generated_answer)
     return scores['rougeL'].fmeasure
 
+def compute_metrics_chunk(rows: list) -> list:
+    """Métricas de un bloque de respuestas (se ejecuta en un proceso del pool)."""
+    metrics = []
+    for row in rows:
+        if row["status"] != "ok":
+            metrics.append({"recall_at_k": 0, "mrr_at_k": 0, "ndcg_at_k": 0, "rouge_l_f1": 0})
+            continue
+        retrieved_ids, relevant_ids = row["retrieved_ids"], row["relevant_ids"]
+        metrics.append({
+            "recall_at_k": calculate_recall_at_k(retrieved_ids, relevant_ids, row["k"]),
+            "mrr_at_k": calculate_mrr_at_k(retrieved_ids, relevant_ids, row["k"]),
+            "ndcg_at_k": calculate_ndcg_at_k(retrieved_ids, relevant_ids, row["k"]),
+            "rouge_l_f1": calculate_rouge_l(row["generated_answer"], row["ideal_answer"])
+        })
+    return metrics
+
+def compute_metrics(rows: list) -> list:
+    """
+    Calcula las métricas de todas las respuestas en una pasada aparte de la
+    recolección, repartiendo bloques de filas entre METRIC_WORKERS procesos.
+    """
+    workers = min(METRIC_WORKERS, max(1, len(rows) // PARALLEL_MIN_ROWS))
+    if workers <= 1:
+        return compute_metrics_chunk(rows)
+    chunk_size = math.ceil(len(rows) / (workers * 4))
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [metric for chunk_metrics in pool.map(compute_metrics_chunk, chunks) for metric in chunk_metrics]
+
+# --- Checkpoint (append-only) ---
+
+def content_hash(value) -> str:
+    """Hash estable de un valor JSON (fila del Gold Standard o conjunto completo)."""
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def evaluation_set_hash(gold_standard: list) -> str:
+    return content_hash({"gold_standard": gold_standard, "backends": BACKENDS, "k": K_METRICS})
+
+def row_key(index: int, item: dict, backend: str) -> tuple:
+    """
+    Clave de una respuesta: posición en el Gold Standard más hash de la fila
+    (las preguntas repetidas no se pisan y una fila editada no se reutiliza).
+    """
+    return (index, content_hash(item), backend, K_METRICS)
+
+def load_checkpoint(path: str, eval_set_hash: str) -> dict:
+    """
+    Respuestas ya recolectadas por row_key; la última línea manda. Si el
+    checkpoint es de otro conjunto de evaluación (o anterior a este formato),
+    se borra y se empieza de cero.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    header = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue # Última línea a medio escribir por una interrupción
+            if header is None:
+                header = row
+                if header.get("eval_set_hash") != eval_set_hash:
+                    break
+                continue
+            done[(row["index"], row["gold_hash"], row["backend"], row["k"])] = row
+    if header is None or header.get("eval_set_hash") != eval_set_hash:
+        print(f"El checkpoint {path} es de otro conjunto de evaluación; se descarta.")
+        os.remove(path)
+        return {}
+    return done
+
+def open_checkpoint(path: str, eval_set_hash: str):
+    """
+    Abre el checkpoint para añadir, cerrando una línea truncada si la hay.
+    Si es nuevo, escribe la cabecera con el hash del conjunto de evaluación.
+    """
+    f = open(path, 'a', encoding='utf-8')
+    if f.tell() > 0:
+        with open(path, 'rb') as raw:
+            raw.seek(-1, os.SEEK_END)
+            if raw.read(1) != b"\n":
+                f.write("\n")
+    else:
+        append_checkpoint(f, {"eval_set_hash": eval_set_hash})
+    return f
+
+def append_checkpoint(f, row: dict):
+    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+# --- Llamada a la API ---
+
+def ask_api(payload: dict, cassette=None) -> dict:
+    """
+    POST /ask. Devuelve {"response": json, "latency": seg}. Con cassette, la
+    respuesta (y su latencia original) se graba o se reproduce por payload.
+    """
+    def call():
+        start_time = time.time()
+        response = requests.post(API_URL, json=payload, timeout=180)
+        # 'latency' aquí es la latencia TOTAL (Búsqueda + Generación)
+        latency = time.time() - start_time
+        if response.status_code != 200:
+            raise Exception(f"Error de API: {response.status_code} {response.text}")
+        return {"response": response.json(), "latency": latency}
+
+    if cassette is None:
+        return call()
+    return cassette.call("ask", cassette_key(payload), call)
+
 # --- Función Principal ---
 
+def collect_responses(gold_standard: list, cassette=None) -> list:
+    """
+    Consulta la API por cada pregunta y backend. Cada respuesta se añade al
+    checkpoint en cuanto llega; al reanudar sólo se repiten las que faltan o
+    fallaron. Devuelve las filas en el orden del Gold Standard.
+    """
+    if not EVAL_RESUME and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    eval_set_hash = evaluation_set_hash(gold_standard)
+    done = load_checkpoint(CHECKPOINT_PATH, eval_set_hash)
+    pending = [
+        (index, item, backend) for index, item in enumerate(gold_standard) for backend in BACKENDS
+        if done.get(row_key(index, item, backend), {}).get("status") != "ok"
+    ]
+    if done:
+        print(f"Reanudando desde {CHECKPOINT_PATH}: {len(gold_standard) * len(BACKENDS) - len(pending)} respuestas ya recolectadas.")
+
+    # Envolvemos el bucle principal con tqdm
+    pbar = tqdm(total=len(pending), desc="Evaluando (Solr/Milvus)")
+    with open_checkpoint(CHECKPOINT_PATH, eval_set_hash) as checkpoint:
+        for index, item, backend in pending:
+            query = item['query']
+            key = row_key(index, item, backend)
+            row = {
+                "index": index,
+                "gold_hash": key[1],
+                "query": query,
+                "backend": backend,
+                "k": K_METRICS,
+                "relevant_ids": item['relevant_chunk_ids'],
+                "ideal_answer": item['ideal_answer']
+            }
+            try:
+                # Llamar a la API
+                payload = {
+                    "query": query,
+                    "backend": backend,
+                    "k": K_METRICS 
+                }
+                result = ask_api(payload, cassette)
+                data = result["response"]
+                token_usage = data.get('token_usage') or {}
+                row.update({
+                    "status": "ok",
+                    "total_latency_sec": result["latency"],
+                    "retrieval_latency_sec": data.get('retrieval_latency_sec', -1),
+                    "generated_answer": data.get('answer', ''),
+                    "retrieved_ids": [doc.get('id', '') for doc in data.get('source_documents', [])],
+                    "prompt_tokens": token_usage.get('prompt_tokens', 0),
+                    "output_tokens": token_usage.get('output_tokens', 0)
+                })
+            except Exception as e:
+                row.update({
+                    "status": "error",
+                    "total_latency_sec": -1, "retrieval_latency_sec": -1,
+                    "generated_answer": f"ERROR: {e}",
+                    "retrieved_ids": []
+                })
+            append_checkpoint(checkpoint, row)
+            done[key] = row
+            pbar.update(1) # Actualizar la barra de progreso
+    pbar.close() # Cerrar la barra de progreso
+
+    return [done[row_key(index, item, backend)] for index, item in enumerate(gold_standard) for backend in BACKENDS]
+
 def run_evaluation():
     """
-    Ejecuta el pipeline de evaluación completo.
+    Ejecuta el pipeline de evaluación completo: recolección (reanudable)
+    y, después, cálculo de métricas en paralelo.
     """
     print("--- Iniciando Protocolo de Evaluación (Fase 4) ---")
     
@@ -80,88 +300,53 @@ def run_evaluation():
     # 2. Preparar NLTK (para ROUGE)
     setup_nltk()
 
-    results_list = []
-    
-    # Iterar sobre cada pregunta y cada backend
-    # Envolvemos el bucle principal con tqdm
-    pbar = tqdm(total=len(gold_standard) * 2, desc="Evaluando (Solr/Milvus)")
+    cassette = open_cassette(EVAL_CASSETTE_PATH, EVAL_RECORD_REPLAY_MODE)
+    if cassette is not None:
+        print(f"Record/replay en modo '{cassette.mode}': {EVAL_CASSETTE_PATH}")
 
-    for item in gold_standard:
-        query = item['query']
-        relevant_ids = item['relevant_chunk_ids'] 
-        ideal_answer = item['ideal_answer']
-
-        for backend in ["solr", "milvus"]:
-            try:
-                # 3.1. Llamar a la API
-                payload = {
-                    "query": query,
-                    "backend": backend,
-                    "k": K_METRICS 
-                }
-                start_time = time.time()
-                response = requests.post(API_URL, json=payload, timeout=180)
-                # 'latency' aquí es la latencia TOTAL (Búsqueda + Generación)
-                latency = time.time() - start_time
-                
-                if response.status_code != 200:
-                    raise Exception(f"Error de API: {response.status_code} {response.text}")
-                
-                data = response.json()
-                generated_answer = data.get('answer', '')
-                retrieved_docs = data.get('source_documents', [])
-                retrieved_ids = [doc.get('id', '') for doc in retrieved_docs]
-                retrieval_latency = data.get('retrieval_latency_sec', -1)
-
-                # 3.2. Calcular Métricas
-                recall = calculate_recall_at_k(retrieved_ids, relevant_ids, K_METRICS)
-                mrr = calculate_mrr_at_k(retrieved_ids, relevant_ids, K_METRICS)
-                rouge_l = calculate_rouge_l(generated_answer, ideal_answer)
-
-                # 3.3. Guardar resultados
-                results_list.append({
-                    "query": query,
-                    "backend": backend,
-                    "total_latency_sec": latency,
-                    "retrieval_latency_sec": retrieval_latency,
-                    "recall_at_k": recall,
-                    "mrr_at_k": mrr,
-                    "rouge_l_f1": rouge_l,
-                    "generated_answer": generated_answer,
-                    "retrieved_ids": "|".join(retrieved_ids),
-                    "relevant_ids": "|".join(relevant_ids)
-                })
-
-            except Exception as e:
-                # ... (el manejo de errores no cambia) ...
-                results_list.append({
-                    "query": query, "backend": backend, 
-                    "total_latency_sec": -1, "retrieval_latency_sec": -1,
-                    "recall_at_k": 0, "mrr_at_k": 0, "rouge_l_f1": 0,
-                    "generated_answer": f"ERROR: {e}",
-                })
-            
-            pbar.update(1) # Actualizar la barra de progreso
-            # --- FIN DE LA MODIFICACIÓN ---
-
-    pbar.close() # Cerrar la barra de progreso
-    
-    # ... (El guardado en CSV y el resumen final no cambian) ...
-    if not results_list:
+    # 3. Recolectar las respuestas de la API
+    rows = collect_responses(gold_standard, cassette)
+    if cassette is not None:
+        print(f"Record/replay: {cassette.stats()}")
+        cassette.close()
+    if not rows:
         print("No se generaron resultados.")
         return
 
+    # 4. Calcular métricas (pasada aparte, en paralelo)
+    start_metrics = time.time()
+    metrics = compute_metrics(rows)
+    print(f"Métricas calculadas para {len(rows)} respuestas en {time.time() - start_metrics:.2f}s.")
+
+    results_list = []
+    for row, row_metrics in zip(rows, metrics):
+        results_list.append({
+            "query": row["query"],
+            "backend": row["backend"],
+            "total_latency_sec": row["total_latency_sec"],
+            "retrieval_latency_sec": row["retrieval_latency_sec"],
+            "prompt_tokens": row.get("prompt_tokens", 0),
+            "output_tokens": row.get("output_tokens", 0),
+            **row_metrics,
+            "generated_answer": row["generated_answer"],
+            "retrieved_ids": "|".join(row["retrieved_ids"]),
+            "relevant_ids": "|".join(row["relevant_ids"])
+        })
+
     print("\nEvaluación completada. Guardando resultados...")
     df_results = pd.DataFrame(results_list)
     
     try:
         df_results.to_csv(RESULTS_PATH, index=False, encoding='utf-8')
         print(f"Resultados guardados exitosamente en: {RESULTS_PATH}")
+        # Ejecución completa: la próxima vuelve a consultar la API desde cero
+        os.remove(CHECKPOINT_PATH)
     except Exception as e:
         print(f"Error al guardar el CSV en {RESULTS_PATH}: {e}")
 
     print("\n--- Resumen de Métricas (Promedio) ---")
-    metric_cols = ['total_latency_sec', 'retrieval_latency_sec', 'recall_at_k', 'mrr_at_k', 'rouge_l_f1']
+    metric_cols = ['total_latency_sec', 'retrieval_latency_sec', 'prompt_tokens', 'output_tokens',
+                   'recall_at_k', 'mrr_at_k', 'ndcg_at_k', 'rouge_l_f1']
     df_summary = df_results.groupby('backend')[metric_cols].mean()
     
     print(df_summary.to_markdown(floatfmt=".4f"))
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+for module in ("requests", "pandas", "tqdm", "rouge_score", "nltk"):
+    pytest.importorskip(module)
+
+import evaluate
+
+GOLD = [
+    {"query": "¿Qué es la JEP?", "relevant_chunk_ids": ["a"], "ideal_answer": "Un tribunal."},
+    {"query": "¿Qué es la JEP?", "relevant_chunk_ids": ["b"], "ideal_answer": "Otra respuesta."},
+]
+
+class FakeApi:
+    """Sustituye a ask_api; puede fallar la primera llamada de un backend."""
+
+    def __init__(self, fail_backend=None):
+        self.calls = []
+        self.fail_backend = fail_backend
+
+    def __call__(self, payload, cassette=None):
+        self.calls.append(payload["backend"])
+        if payload["backend"] == self.fail_backend:
+            self.fail_backend = None
+            raise Exception("Error de API: 503")
+        return {"response": {"answer": "r", "source_documents": [{"id": "a"}]}, "latency": 0.1}
+
+@pytest.fixture
+def checkpoint(tmp_path, monkeypatch):
+    path = tmp_path / "evaluation_checkpoint.jsonl"
+    monkeypatch.setattr(evaluate, "CHECKPOINT_PATH", str(path))
+    monkeypatch.setattr(evaluate, "EVAL_RESUME", True)
+    return path
+
+def test_retrieval_metrics():
+    assert evaluate.calculate_recall_at_k(["a", "x", "b"], ["a", "b"], 2) == 0.5
+    assert evaluate.calculate_mrr_at_k(["x", "b"], ["a", "b"], 5) == 0.5
+    assert evaluate.calculate_ndcg_at_k(["a", "b"], ["a", "b"], 2) == pytest.approx(1.0)
+    assert evaluate.calculate_ndcg_at_k(["x", "a"], ["a"], 2) == pytest.approx(1 / 1.584962500721156)
+    assert evaluate.calculate_recall_at_k(["a"], [], 5) == 0.0
+
+def test_failed_rows_get_zero_metrics():
+    rows = [{"status": "error"}]
+    assert evaluate.compute_metrics_chunk(rows) == [{"recall_at_k": 0, "mrr_at_k": 0, "ndcg_at_k": 0, "rouge_l_f1": 0}]
+
+def test_duplicate_queries_are_kept_apart_and_resume_skips_done_rows(checkpoint, monkeypatch):
+    api = FakeApi(fail_backend="milvus")
+    monkeypatch.setattr(evaluate, "ask_api", api)
+
+    rows = evaluate.collect_responses(GOLD)
+    assert [(r["index"], r["backend"], r["status"]) for r in rows] == [
+        (0, "solr", "ok"), (0, "milvus", "error"), (1, "solr", "ok"), (1, "milvus", "ok"),
+    ]
+    assert [r["relevant_ids"] for r in rows] == [["a"], ["a"], ["b"], ["b"]]
+
+    # Al reanudar sólo se repite la que falló
+    rows = evaluate.collect_responses(GOLD)
+    assert api.calls[4:] == ["milvus"]
+    assert all(r["status"] == "ok" for r in rows)
+
+    evaluate.collect_responses(GOLD)
+    assert len(api.calls) == 5
+
+def test_checkpoint_is_discarded_when_the_gold_standard_changes(checkpoint, monkeypatch):
+    api = FakeApi()
+    monkeypatch.setattr(evaluate, "ask_api", api)
+    evaluate.collect_responses(GOLD)
+
+    edited = [dict(GOLD[0], ideal_answer="Editada."), GOLD[1]]
+    rows = evaluate.collect_responses(edited)
+    assert len(api.calls) == 8
+    assert rows[0]["ideal_answer"] == "Editada."
+
+    header = json.loads(checkpoint.read_text(encoding="utf-8").splitlines()[0])
+    assert header == {"eval_set_hash": evaluate.evaluation_set_hash(edited)}
+
+def test_truncated_last_line_is_ignored(checkpoint, monkeypatch):
+    api = FakeApi()
+    monkeypatch.setattr(evaluate, "ask_api", api)
+    evaluate.collect_responses(GOLD)
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        f.write('{"index": 0, "gold_ha')
+
+    evaluate.collect_responses(GOLD)
+    assert len(api.calls) == 4
+    lines = checkpoint.read_text(encoding="utf-8").splitlines()
+    assert lines[-1] == '{"index": 0, "gold_ha'
@@ -0,0 +1,86 @@
+# Archivo: /services/indexer/docstore.py
+# Almacén local de chunks en formato columnar: el texto se guarda una sola
+# vez aquí y Milvus sólo guarda ids + vectores. La API lo abre con mmap
+# (ver services/api/docstore.py; el formato debe coincidir).
+#
+#   <DOCSTORE_PATH>/<versión>/chunks.bin  -> textos UTF-8 concatenados
+#   <DOCSTORE_PATH>/<versión>/index.json  -> columnas: ids, fuente (codificada por diccionario), offsets
+#   <DOCSTORE_PATH>/CURRENT               -> versión en servicio (se cambia al final, junto a Solr/Milvus)
+
+import os
+import json
+import shutil
+
+DOCSTORE_PATH = os.getenv("DOCSTORE_PATH", "/data/docstore")
+DOCSTORE_FORMAT_VERSION = 1
+TEXT_FILE_NAME = "chunks.bin"
+INDEX_FILE_NAME = "index.json"
+CURRENT_FILE_NAME = "CURRENT"
+# Versiones anteriores que se conservan en disco para rollback (la API las
+# usa para hidratar lo que devuelvan los índices anteriores de Solr/Milvus)
+KEEP_PREVIOUS_VERSIONS = int(os.getenv("DOCSTORE_KEEP_PREVIOUS_VERSIONS", "1"))
+
+def write_docstore(data_df, version: str, root: str = DOCSTORE_PATH):
+    """
+    Escribe los chunks del DataFrame (chunk_id, text_content, source_document)
+    en una versión nueva del almacén. No cambia la versión en servicio (ver
+    publish_docstore). El índice se escribe al final para que nunca apunte a
+    un texto incompleto.
+    """
+    directory = os.path.join(root, version)
+    os.makedirs(directory, exist_ok=True)
+
+    ids = data_df['chunk_id'].astype(str).tolist()
+    texts = data_df['text_content'].astype(str).tolist()
+    sources = data_df['source_document'].astype(str).tolist()
+
+    # Columna de fuentes codificada por diccionario (hay pocos archivos distintos)
+    source_names = sorted(set(sources))
+    source_pos = {name: i for i, name in enumerate(source_names)}
+
+    offsets = [0]
+    text_path = os.path.join(directory, TEXT_FILE_NAME)
+    with open(f"{text_path}.tmp", 'wb') as f:
+        for text in texts:
+            encoded = text.encode('utf-8')
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    os.replace(f"{text_path}.tmp", text_path)
+
+    index = {
+        "version": DOCSTORE_FORMAT_VERSION,
+        "count": len(ids),
+        "ids": ids,
+        "source_names": source_names,
+        "source_idx": [source_pos[s] for s in sources],
+        "offsets": offsets
+    }
+    index_path = os.path.join(directory, INDEX_FILE_NAME)
+    with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(f"{index_path}.tmp", index_path)
+
+    print(f"Almacén de documentos escrito en {directory}: {len(ids)} chunks, {offsets[-1] / 1e6:.1f} MB de texto.")
+
+def publish_docstore(version: str, root: str = DOCSTORE_PATH):
+    """
+    Marca 'version' como la versión en servicio (reemplazo atómico de CURRENT;
+    la API lo detecta sin reiniciar) y borra las versiones más antiguas.
+    """
+    current_path = os.path.join(root, CURRENT_FILE_NAME)
+    with open(f"{current_path}.tmp", 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(f"{current_path}.tmp", current_path)
+    print(f"Almacén de documentos: versión en servicio -> {version}")
+
+    versions = sorted(
+        name for name in os.listdir(root)
+        if name != version and os.path.isdir(os.path.join(root, name))
+    )
+    for name in versions[:max(len(versions) - KEEP_PREVIOUS_VERSIONS, 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        print(f"Versión antigua del almacén eliminada: {name}")
+
+def discard_docstore(version: str, root: str = DOCSTORE_PATH):
+    """Elimina una versión que no llegó a publicarse."""
+    shutil.rmtree(os.path.join(root, version), ignore_errors=True)
@@ -1,4 +1,5 @@
 import os
+import re
 from pymilvus import connections, utility, FieldSchema, CollectionSchema, DataType, Collection
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
@@ -22,9 +23,17 @@ MILVUS_ALIAS = "default" # Alias de la conexión
 MODEL_NAME = 'models/text-embedding-004' # Modelo de Google
 MODEL_DIMENSION = 768                    # ¡Nueva dimensión!
 
+# COLLECTION_NAME es un ALIAS: cada reindexación crea una colección versionada
+# (taller_rag_corpus_v<versión>) y, una vez cargada y validada, el alias se
+# mueve a ella de forma atómica. La API siempre consulta el alias.
 COLLECTION_NAME = "taller_rag_corpus"
+# Versiones anteriores que se conservan (liberadas de memoria) para rollback
+KEEP_PREVIOUS_VERSIONS = int(os.getenv("MILVUS_KEEP_PREVIOUS_VERSIONS", "1"))
 ID_FIELD_NAME = "doc_id"
-TEXT_FIELD_NAME = "text_content"
+# El texto y la fuente viven en el almacén local (docstore.py); Milvus
+# sólo guarda ids + vectores y la versión de la reindexación, para que la
+# API hidrate cada hit con la versión del almacén que le corresponde.
+VERSION_FIELD_NAME = "index_version"
 VECTOR_FIELD_NAME = "vector_embedding"
 METRIC_TYPE = "L2" # Métrica de distancia (L2 = Euclidiana)
 
@@ -49,15 +58,27 @@ def wait_for_milvus(timeout=120):
     print(f"Error: Timeout esperando a Milvus en {MILVUS_HOST}:{MILVUS_PORT}")
     return False
 
-def create_milvus_collection():
+# Particiones por capítulo (prefijo numérico del archivo, ej. "14-Las FARC.txt").
+# Permiten a la API restringir la búsqueda a ciertos documentos.
+# Debe coincidir con chapter_partition() en services/api/filters.py.
+CHAPTER_RE = re.compile(r"^(\d+)-")
+
+def chapter_partition(file_name: str) -> str:
+    match = CHAPTER_RE.match(file_name)
+    return f"cap_{int(match.group(1)):03d}" if match else "_default"
+
+def versioned_collection_name(version: str) -> str:
+    return f"{COLLECTION_NAME}_v{version}"
+
+def create_milvus_collection(collection_name: str):
     """
-    Define y crea la colección en Milvus si no existe.
+    Define y crea una colección versionada vacía (la recrea si ya existía).
     """
-    if utility.has_collection(COLLECTION_NAME, using=MILVUS_ALIAS):
-        print(f"Colección '{COLLECTION_NAME}' ya existe.")
-        return Collection(COLLECTION_NAME, using=MILVUS_ALIAS)
+    if utility.has_collection(collection_name, using=MILVUS_ALIAS):
+        print(f"Colección '{collection_name}' ya existe. Recreándola...")
+        utility.drop_collection(collection_name, using=MILVUS_ALIAS)
 
-    print(f"Creando colección '{COLLECTION_NAME}'...")
+    print(f"Creando colección '{collection_name}'...")
     
     # 1. Definir campos
     field_id = FieldSchema(
@@ -67,42 +88,31 @@ def create_milvus_collection():
         auto_id=False,
         max_length=256
     )
-    field_text = FieldSchema(
-        name=TEXT_FIELD_NAME,
+    field_version = FieldSchema(
+        name=VERSION_FIELD_NAME,
         dtype=DataType.VARCHAR,
-        max_length=65535
+        max_length=64
     )
-    
-    # --- CAMBIO AQUÍ: AÑADIDO NUEVO CAMPO ---
-    field_source = FieldSchema(
-        name="source_document", # El campo que faltaba
-        dtype=DataType.VARCHAR,
-        max_length=512 # Suficiente para un nombre de archivo
-    )
-    # --- FIN DEL CAMBIO ---
-
     field_vector = FieldSchema(
         name=VECTOR_FIELD_NAME,
         dtype=DataType.FLOAT_VECTOR,
         dim=MODEL_DIMENSION
     )
 
-    # 2. Crear esquema (¡Añadir el nuevo campo!)
+    # 2. Crear esquema (id, versión y vector; el texto está en el almacén local)
     schema = CollectionSchema(
-        # --- CAMBIO AQUÍ: AÑADIDO field_source ---
-        fields=[field_id, field_text, field_source, field_vector],
+        fields=[field_id, field_version, field_vector],
         description="Colección para Taller RAG"
     )
-    # --- FIN DEL CAMBIO ---
 
     # 3. Crear colección
     collection = Collection(
-        name=COLLECTION_NAME,
+        name=collection_name,
         schema=schema,
         using=MILVUS_ALIAS
     )
     
-    print(f"Colección '{COLLECTION_NAME}' creada.")
+    print(f"Colección '{collection_name}' creada.")
     
     # 4. Crear índice
     print(f"Creando índice HNSW para '{VECTOR_FIELD_NAME}'...")
@@ -135,17 +145,103 @@ def embed_content_batch(model, texts: list) -> list:
         # Devuelve un vector nulo del tamaño correcto si falla
         return [[0.0] * MODEL_DIMENSION] * len(texts)
         
-def index_data_in_milvus(data_df):
+def warm_and_validate_milvus(collection, expected_count: int, sample_vectors: list) -> bool:
+    """
+    Comprueba que la colección nueva tenga todos los vectores y la calienta
+    con búsquedas reales (reutilizando embeddings ya calculados, sin
+    llamadas extra a la API de Google).
+    """
+    num_entities = collection.num_entities
+    if num_entities != expected_count:
+        print(f"Validación fallida: la colección nueva tiene {num_entities} vectores, se esperaban {expected_count}.")
+        return False
+    if sample_vectors:
+        collection.search(
+            data=sample_vectors,
+            anns_field=VECTOR_FIELD_NAME,
+            param={"metric_type": METRIC_TYPE, "params": {"ef": 64}},
+            limit=5
+        )
+    print(f"Colección nueva validada ({num_entities} vectores) y calentada con {len(sample_vectors)} búsquedas.")
+    return True
+
+def switch_milvus_alias(collection_name: str):
+    """
+    Mueve el alias COLLECTION_NAME a la colección nueva (atómico para las
+    búsquedas de la API). Si lanza una excepción, el alias no se ha movido.
+    Después libera la versión anterior y borra las más viejas.
+    """
+    connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        legacy = None
+        if COLLECTION_NAME in utility.list_collections(using=MILVUS_ALIAS):
+            # Migración: antes COLLECTION_NAME era una colección real. Un alias
+            # no puede llamarse como una colección, así que se renombra (pasa a
+            # ser una versión anterior más) justo antes de crear el alias, y
+            # se restaura si no se puede crear.
+            legacy = f"{COLLECTION_NAME}_v0_legacy"
+            print(f"'{COLLECTION_NAME}' es una colección antigua (no un alias). Renombrándola a '{legacy}'...")
+            utility.rename_collection(COLLECTION_NAME, legacy, using=MILVUS_ALIAS)
+
+        previous = None
+        for name in utility.list_collections(using=MILVUS_ALIAS):
+            if name != collection_name and COLLECTION_NAME in utility.list_aliases(name, using=MILVUS_ALIAS):
+                previous = name
+
+        try:
+            if previous is None:
+                utility.create_alias(collection_name, COLLECTION_NAME, using=MILVUS_ALIAS)
+            else:
+                utility.alter_alias(collection_name, COLLECTION_NAME, using=MILVUS_ALIAS)
+        except Exception:
+            if legacy is not None:
+                utility.rename_collection(legacy, COLLECTION_NAME, using=MILVUS_ALIAS)
+                print(f"Colección antigua restaurada como '{COLLECTION_NAME}'.")
+            raise
+        print(f"Alias '{COLLECTION_NAME}' -> '{collection_name}'.")
+
+        # Versiones anteriores: se liberan de memoria y se conservan las más
+        # recientes. El alias ya está movido: un fallo aquí no lo deshace.
+        try:
+            old_versions = sorted(
+                name for name in utility.list_collections(using=MILVUS_ALIAS)
+                if name.startswith(f"{COLLECTION_NAME}_v") and name != collection_name
+            )
+            for position, name in enumerate(reversed(old_versions)):
+                if position < KEEP_PREVIOUS_VERSIONS:
+                    Collection(name, using=MILVUS_ALIAS).release()
+                    print(f"Versión anterior '{name}' liberada (se conserva para rollback).")
+                else:
+                    utility.drop_collection(name, using=MILVUS_ALIAS)
+                    print(f"Versión antigua '{name}' eliminada.")
+        except Exception as e:
+            print(f"Advertencia: no se pudieron limpiar las versiones anteriores de Milvus: {e}")
+    finally:
+        connections.disconnect(MILVUS_ALIAS)
+
+def discard_milvus_collection(collection_name: str):
+    """Elimina una colección versionada que no llegó a publicarse."""
+    connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
+    try:
+        utility.drop_collection(collection_name, using=MILVUS_ALIAS)
+        print(f"Colección no publicada '{collection_name}' eliminada.")
+    finally:
+        connections.disconnect(MILVUS_ALIAS)
+
+def index_data_in_milvus(data_df, version: str):
     """
     Función principal para indexar datos en Milvus.
     Recibe un DataFrame de pandas con los datos del corpus.
+    Construye la colección versionada junto a la que está en servicio, la
+    carga, la calienta y la valida. Devuelve su nombre si está lista para
+    mover el alias (switch_milvus_alias), o None.
     """
     print("\n--- Iniciando Indexación en Milvus ---")
     
     # 1. Conectar a Milvus
     if not wait_for_milvus():
         print("Asegúrese de que el contenedor 'milvus' esté corriendo ('docker-compose ps').")
-        return
+        return None
     load_dotenv()
     
     api_key = os.getenv("GOOGLE_API_KEY")
@@ -160,24 +256,23 @@ def index_data_in_milvus(data_df):
     
     connections.connect(alias=MILVUS_ALIAS, host=MILVUS_HOST, port=MILVUS_PORT)
 
-    # 3. Obtener/Crear Colección
-    collection = create_milvus_collection()
+    # 3. Crear la colección versionada (la que está en servicio no se toca)
+    collection_name = versioned_collection_name(version)
+    collection = create_milvus_collection(collection_name)
 
     # --- Lógica de Fase 2 (Implementación) ---
     print("Preparando documentos para Milvus...")
-    
-    # 4. (Opcional) Limpiar colección existente
-    # print("Limpiando colección anterior...")
-    # if collection.num_entities > 0:
-    #     collection.truncate()
 
     # 5. Preparar y añadir documentos en lotes
     batch_size = 100
+    ready = False
     
     print("Iniciando iteración del corpus...")
     
     if data_df is not None and not data_df.empty:
         try:
+            failed_batches = 0
+            sample_vectors = []
             # Iterar en lotes (más eficiente)
             for i in tqdm(range(0, len(data_df), batch_size), desc="Indexando en Milvus"):
                 batch = data_df.iloc[i:i + batch_size]
@@ -185,21 +280,35 @@ def index_data_in_milvus(data_df):
                 # *** ¡AJUSTE REALIZADO! ***
                 ids_batch = batch['chunk_id'].astype(str).tolist()
                 text_batch = batch['text_content'].astype(str).tolist()
-                source_batch = batch['source_document'].astype(str).tolist() # <-- AÑADIDO
+                source_batch = batch['source_document'].astype(str).tolist()
                 
                 # Generar embeddings
                 embeddings_batch = embed_content_batch(model, text_batch)
+                if not any(embeddings_batch[0]):
+                    failed_batches += 1 # embed_content_batch devolvió vectores nulos
+                elif len(sample_vectors) < 5:
+                    sample_vectors.append(embeddings_batch[0])
                 
-                # Preparar datos para Milvus (de acuerdo al esquema)
-                entities = [
-                    ids_batch,      # Campo ID_FIELD_NAME
-                    text_batch,     # Campo TEXT_FIELD_NAME
-                    source_batch,   # field_source <-- AÑADIDO
-                    embeddings_batch  # Campo VECTOR_FIELD_NAME
-                ]
-                
-                # Insertar en Milvus
-                collection.insert(entities)
+                # Agrupar el lote por partición (capítulo)
+                by_partition = {}
+                for doc_id, source, embedding in zip(ids_batch, source_batch, embeddings_batch):
+                    ids_part, vectors_part = by_partition.setdefault(chapter_partition(source), ([], []))
+                    ids_part.append(doc_id)
+                    vectors_part.append(embedding)
+
+                for partition_name, (ids_part, vectors_part) in by_partition.items():
+                    if not collection.has_partition(partition_name):
+                        collection.create_partition(partition_name)
+
+                    # Preparar datos para Milvus (de acuerdo al esquema)
+                    entities = [
+                        ids_part,                    # Campo ID_FIELD_NAME
+                        [version] * len(ids_part),   # Campo VERSION_FIELD_NAME
+                        vectors_part                 # Campo VECTOR_FIELD_NAME
+                    ]
+                    
+                    # Insertar en Milvus
+                    collection.insert(entities, partition_name=partition_name)
                 
                 # Respetar el límite de 1000 RPM (1000/60 = ~16 solicitudes/seg)
                 # Damos un margen de seguridad. 100 docs / 1 req.
@@ -210,21 +319,27 @@ def index_data_in_milvus(data_df):
             collection.flush()
             print(f"\nIndexación en Milvus completada. Total: {len(data_df)} vectores.")
             
-            # Cargar colección en memoria para búsqueda
+            # Cargar colección en memoria ANTES de exponerla a la API
             print("Cargando colección en memoria...")
             collection.load()
             print("Colección cargada.")
 
+            if failed_batches:
+                print(f"Validación fallida: {failed_batches} lotes sin embeddings válidos.")
+            else:
+                ready = warm_and_validate_milvus(collection, len(data_df), sample_vectors)
+
         except Exception as e:
             print(f"\nError durante la indexación de Milvus: {e}")
             print("Verifica los nombres de las columnas y la conexión.")
     else:
         print("No se proporcionaron datos (DataFrame vacío) para indexar.")
 
-    # Cargar la colección (incluso si está vacía) para que esté lista
-    print("Asegurando que la colección esté cargada (incluso si estaba vacía)...")
-    collection.load()
-    
+    if not ready:
+        # La versión fallida no debe ocupar memoria ni disco
+        print(f"Descartando la colección '{collection_name}'.")
+        utility.drop_collection(collection_name, using=MILVUS_ALIAS)
+
     connections.disconnect(MILVUS_ALIAS)
     print("--- Indexación en Milvus Finalizada ---")    
- 
\ No newline at end of file
+    return collection_name if ready else None
@@ -4,6 +4,7 @@ import time
 import requests
 import json
 import pandas as pd
+from urllib.parse import quote
 from tqdm import tqdm
 from parse_tesauro import parse_rdf_to_synonyms
 
@@ -11,10 +12,20 @@ from parse_tesauro import parse_rdf_to_synonyms
 SOLR_HOST = os.getenv("SOLR_HOST", "localhost")
 SOLR_PORT = os.getenv("SOLR_PORT", "8983")
 SOLR_CORE = os.getenv("SOLR_CORE", "taller_rag_core")
+# Core "verde": se reconstruye aquí y luego se intercambia (SWAP) con el core
+# en servicio, así las consultas nunca ven un índice vacío o parcial.
+SOLR_STAGING_CORE = os.getenv("SOLR_STAGING_CORE", f"{SOLR_CORE}_staging")
 
 # URL de conexión para Solr
-SOLR_URL = f"http://{SOLR_HOST}:{SOLR_PORT}/solr/{SOLR_CORE}"
-SOLR_SCHEMA_API_URL = f"{SOLR_URL}/schema"
+SOLR_BASE_URL = f"http://{SOLR_HOST}:{SOLR_PORT}/solr"
+SOLR_URL = f"{SOLR_BASE_URL}/{SOLR_CORE}"
+SOLR_CORE_ADMIN_URL = f"{SOLR_BASE_URL}/admin/cores"
+
+# Consultas de calentamiento y validación del core nuevo
+WARMUP_QUERIES = 5
+
+def solr_core_url(core: str) -> str:
+    return f"{SOLR_BASE_URL}/{core}"
 
 def wait_for_solr(solr_instance, timeout=120):
     """
@@ -29,131 +40,264 @@ def wait_for_solr(solr_instance, timeout=120):
         except pysolr.SolrError:
             print("Esperando a Solr...")
             time.sleep(5)
-    print(f"Error: Timeout esperando a Solr en {SOLR_URL}")
+    print(f"Error: Timeout esperando a Solr en {solr_instance.url}")
     return False
 
-def configure_solr_with_tesauro(solr: pysolr.Solr):
+# Definición del FieldType 'text_es' con el filtro de sinónimos del tesauro
+TEXT_ES_FIELD_TYPE = {
+    "name": "text_es",
+    "class": "solr.TextField",
+    "positionIncrementGap": "100",
+    "analyzer": {
+        "tokenizer": {
+            "class": "solr.StandardTokenizerFactory"
+        },
+        "filters": [
+            {"class": "solr.LowerCaseFilterFactory"},
+            {"class": "solr.StopFilterFactory", "ignoreCase": True, "words": "lang/stopwords_es.txt", "format": "snowball"},
+            {
+                "class": "solr.ManagedSynonymGraphFilterFactory",
+                "managed": "tesauro_cev"
+            },
+            {"class": "solr.SpanishLightStemFilterFactory"}
+        ]
+    }
+}
+
+def build_synonym_map(synonym_list: list) -> dict:
+    """
+    Convierte las líneas "a, b, c" en el mapa término -> sinónimos que
+    Solr guarda internamente (simétrico, en minúsculas por ignoreCase=true).
+    """
+    target = {}
+    for line in synonym_list:
+        terms = [t.strip().lower() for t in line.split(",") if t.strip()]
+        for term in terms:
+            target.setdefault(term, set()).update(t for t in terms if t != term)
+    return {term: syns for term, syns in target.items() if syns}
+
+def _normalize_schema_value(value):
+    """Normaliza la definición de un FieldType para compararla (Solr devuelve 'true' como texto)."""
+    if isinstance(value, dict):
+        return {k: _normalize_schema_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize_schema_value(v) for v in value]
+    return str(value).lower()
+
+def sync_managed_synonyms(synonym_resource_url: str, synonym_list: list, headers: dict) -> bool:
+    """
+    Sincroniza el recurso de sinónimos gestionado aplicando sólo las
+    diferencias (altas/bajas) respecto a lo que ya tiene Solr.
+    Devuelve True si el recurso cambió (y por tanto hace falta recargar el core).
+    """
+    target = build_synonym_map(synonym_list)
+
+    response_get = requests.get(synonym_resource_url, headers=headers)
+    if response_get.status_code == 404:
+        # El recurso no existe: se crea completo (una sola vez)
+        print("Creando recurso de sinónimos 'tesauro_cev' (PUT)...")
+        payload_create = {
+            "class": "org.apache.solr.rest.schema.analysis.ManagedSynonymGraphFilterFactory$SynonymManager",
+            "initArgs": {"ignoreCase": True},
+            "synonyms": synonym_list
+        }
+        response_put = requests.put(synonym_resource_url, data=json.dumps(payload_create), headers=headers)
+        if response_put.status_code != 200:
+            raise Exception(f"PUT falló inesperadamente: {response_put.text}")
+        print("Recurso de sinónimos 'tesauro_cev' CREADO.")
+        return True
+    if response_get.status_code != 200:
+        raise Exception(f"GET falló inesperadamente: {response_get.text}")
+
+    mappings = response_get.json().get("synonymMappings", {})
+    # Se compara en minúsculas (ignoreCase=true), conservando la clave
+    # original que devuelve Solr para poder borrarla
+    current = {}
+    stored_keys = {}
+    for term, syns in mappings.get("managedMap", {}).items():
+        key = term.lower()
+        current[key] = {s.lower() for s in syns} - {key}
+        stored_keys[key] = term
+
+    # Términos sobrantes o cuyo conjunto de sinónimos cambió -> borrar
+    # (un PUT sólo añade sinónimos, nunca los quita)
+    to_delete = [stored_keys[term] for term, syns in current.items() if target.get(term) != syns]
+    # Términos nuevos o modificados -> añadir
+    to_add = {term: sorted(syns) for term, syns in target.items() if current.get(term) != syns}
+
+    if not to_delete and not to_add:
+        print(f"Sinónimos 'tesauro_cev' al día ({len(current)} términos). Sin cambios.")
+        return False
+
+    print(f"Aplicando diferencias al tesauro: {len(to_delete)} bajas, {len(to_add)} altas.")
+    for term in to_delete:
+        response_delete = requests.delete(f"{synonym_resource_url}/{quote(term, safe='')}", headers=headers)
+        if response_delete.status_code not in (200, 404):
+            raise Exception(f"DELETE de '{term}' falló: {response_delete.text}")
+
+    if to_add:
+        response_put = requests.put(synonym_resource_url, data=json.dumps(to_add), headers=headers)
+        if response_put.status_code != 200:
+            raise Exception(f"PUT falló inesperadamente: {response_put.text}")
+    return True
+
+def text_es_field_type_is_current(headers: dict, core: str) -> bool:
+    """Indica si el FieldType 'text_es' ya tiene el analizador con el tesauro."""
+    try:
+        response = requests.get(f"{solr_core_url(core)}/schema/fieldtypes/text_es", headers=headers)
+        if response.status_code != 200:
+            return False
+        current = response.json().get("fieldType", {})
+    except Exception as e:
+        print(f"Advertencia al leer el FieldType 'text_es': {e}")
+        return False
+
+    expected = _normalize_schema_value(TEXT_ES_FIELD_TYPE)
+    current = _normalize_schema_value({k: current.get(k) for k in expected})
+    return current == expected
+
+def reload_solr_core(headers: dict, core: str):
+    """Recarga el core para que tome los cambios de los recursos gestionados."""
+    response = requests.get(
+        SOLR_CORE_ADMIN_URL,
+        params={"action": "RELOAD", "core": core, "wt": "json"},
+        headers=headers
+    )
+    if response.status_code != 200:
+        raise Exception(f"RELOAD falló: {response.text}")
+    print(f"Core '{core}' recargado.")
+
+def configure_solr_with_tesauro(solr: pysolr.Solr, core: str = SOLR_STAGING_CORE):
     """
     Usa la API de Solr para:
-    1. BORRAR el recurso antiguo (si existe).
-    2. CREAR el nuevo recurso de sinónimos.
-    3. Modificar el fieldType 'text_es' para que USE ese tesauro.
+    1. Sincronizar el recurso de sinónimos aplicando sólo las diferencias.
+    2. Modificar el fieldType 'text_es' para que USE ese tesauro (si aún no lo hace).
+    3. Recargar el core una única vez, y sólo si algo cambió.
     """
     print("\n--- Configurando Solr con Tesauro CEV ---")
     
-    # 1. Parsear el RDF (sin cambios)
+    # 1. Parsear el RDF (usa el tesauro compilado si está vigente)
     synonym_list = parse_rdf_to_synonyms()
     if not synonym_list:
         print("No se encontraron sinónimos. Saltando configuración del tesauro.")
         return
 
-    # 2. Definir URLs y Payloads
-    synonym_resource_url = f"{SOLR_URL}/schema/analysis/synonyms/tesauro_cev"
+    synonym_resource_url = f"{solr_core_url(core)}/schema/analysis/synonyms/tesauro_cev"
     headers = {'Content-type': 'application/json'}
-    
-    # Payload para CREAR (PUT) - Usa el nombre de clase completo y correcto
-    payload_create = {
-        "class": "org.apache.solr.rest.schema.analysis.ManagedSynonymGraphFilterFactory$SynonymManager", # <-- CLASE CORREGIDA
-        "initArgs": {"ignoreCase": True},
-        "synonyms": synonym_list
-    }
 
-    # --- PASO 1 (NUEVO): Borrar el recurso existente ---
+    # --- PASO 1: Sincronizar sinónimos (diferencial) ---
     try:
-        print(f"Intentando borrar el recurso obsoleto en: {synonym_resource_url}")
-        response_delete = requests.delete(synonym_resource_url, headers=headers)
-        if response_delete.status_code == 200 or response_delete.status_code == 404:
-            print(f"Recurso obsoleto borrado (o no existía). Status: {response_delete.status_code}")
-        else:
-            print(f"Advertencia: El borrado del recurso falló (status: {response_delete.status_code}), continuando de todos modos.")
-    except Exception as e:
-        print(f"Advertencia durante el borrado: {e}")
-    # --- FIN DEL PASO 1 ---
-
-    # --- PASO 2: Crear el recurso ---
-    try:
-        print(f"Creando recurso de sinónimos 'tesauro_cev' (PUT)...")
-        
-        # Intentamos CREAR (PUT) con el payload (el dict)
-        response_put = requests.put(synonym_resource_url, data=json.dumps(payload_create), headers=headers)
-        
-        if response_put.status_code == 200:
-            print("Recurso de sinónimos 'tesauro_cev' CREADO.")
-        else:
-            # Si falla, es un error inesperado
-            raise Exception(f"PUT falló inesperadamente: {response_put.text}")
-
+        synonyms_changed = sync_managed_synonyms(synonym_resource_url, synonym_list, headers)
     except Exception as e:
         print(f"Error Crítico al cargar sinónimos en Solr: {e}")
         return
 
-    # --- PASO 3: Modificar el FieldType 'text_es' ---
-    # (Esta parte ya estaba bien)
-    print("Modificando el FieldType 'text_es' para incluir el filtro de sinónimos...")
-    
-    schema_payload = {
-        "replace-field-type": {
-            "name": "text_es",
-            "class": "solr.TextField",
-            "positionIncrementGap": "100",
-            "analyzer": {
-                "tokenizer": {
-                    "class": "solr.StandardTokenizerFactory"
-                },
-                "filters": [
-                    {"class": "solr.LowerCaseFilterFactory"},
-                    {"class": "solr.StopFilterFactory", "ignoreCase": True, "words": "lang/stopwords_es.txt", "format": "snowball"},
-                    {
-                        "class": "solr.ManagedSynonymGraphFilterFactory",
-                        "managed": "tesauro_cev"
-                    },
-                    {"class": "solr.SpanishLightStemFilterFactory"}
-                ]
-            }
-        }
-    }
-    
-    try:
-        response = requests.post(SOLR_SCHEMA_API_URL, data=json.dumps(schema_payload), headers=headers)
-        if response.status_code != 200:
-            raise Exception(f"Error: {response.text}")
-        print("¡Éxito! El FieldType 'text_es' ahora usa el Tesauro CEV.")
-    except Exception as e:
-        print(f"Error Crítico al modificar el esquema de Solr: {e}")
-        print("Es posible que la API de esquema esté deshabilitada o el formato sea incorrecto.")
+    # --- PASO 2: Modificar el FieldType 'text_es' (sólo si difiere) ---
+    schema_replaced = False
+    if text_es_field_type_is_current(headers, core):
+        print("El FieldType 'text_es' ya usa el Tesauro CEV. Sin cambios de esquema.")
+    else:
+        print("Modificando el FieldType 'text_es' para incluir el filtro de sinónimos...")
+        schema_payload = {"replace-field-type": TEXT_ES_FIELD_TYPE}
+        try:
+            response = requests.post(f"{solr_core_url(core)}/schema", data=json.dumps(schema_payload), headers=headers)
+            if response.status_code != 200:
+                raise Exception(f"Error: {response.text}")
+            # La API de esquema recarga el core por sí misma
+            schema_replaced = True
+            print("¡Éxito! El FieldType 'text_es' ahora usa el Tesauro CEV.")
+        except Exception as e:
+            print(f"Error Crítico al modificar el esquema de Solr: {e}")
+            print("Es posible que la API de esquema esté deshabilitada o el formato sea incorrecto.")
+
+    # --- PASO 3: Recargar el core una sola vez ---
+    if synonyms_changed and not schema_replaced:
+        try:
+            reload_solr_core(headers, core)
+        except Exception as e:
+            print(f"Advertencia: no se pudo recargar el core: {e}")
         
-def index_data_in_solr(data_df):
+def solr_core_exists(core: str) -> bool:
+    """Consulta la CoreAdmin API para saber si el core existe."""
+    response = requests.get(SOLR_CORE_ADMIN_URL, params={"action": "STATUS", "core": core, "wt": "json"})
+    response.raise_for_status()
+    return bool(response.json().get("status", {}).get(core))
+
+def warm_and_validate_solr(solr: pysolr.Solr, data_df) -> bool:
+    """
+    Calienta el core nuevo (searcher y cachés) con algunas consultas tomadas
+    del propio corpus y valida que contenga todos los documentos.
+    """
+    num_found = solr.search(q='*:*', rows=0).hits
+    if num_found != len(data_df):
+        print(f"Validación fallida: el core nuevo tiene {num_found} documentos, se esperaban {len(data_df)}.")
+        return False
+
+    sample = data_df['text_content'].astype(str).sample(
+        n=min(WARMUP_QUERIES, len(data_df)), random_state=0
+    )
+    for text in sample:
+        words = [w for w in text.split() if w.isalpha()][:6]
+        if words:
+            solr.search(q=" ".join(words), defType="edismax", qf="text_content_txt_es", rows=5)
+    print(f"Core nuevo validado ({num_found} documentos) y calentado con {len(sample)} consultas.")
+    return True
+
+def swap_solr_cores():
+    """
+    Intercambia de forma atómica el core en servicio y el core reconstruido.
+    La API sigue consultando SOLR_CORE y ve el índice nuevo sin reiniciar;
+    el índice anterior queda en SOLR_STAGING_CORE (rollback = otro SWAP).
+    """
+    response = requests.get(
+        SOLR_CORE_ADMIN_URL,
+        params={"action": "SWAP", "core": SOLR_CORE, "other": SOLR_STAGING_CORE, "wt": "json"}
+    )
+    if response.status_code != 200:
+        raise Exception(f"SWAP falló: {response.text}")
+    print(f"Cores intercambiados: '{SOLR_CORE}' sirve ahora el índice nuevo.")
+
+def index_data_in_solr(data_df, version: str) -> bool:
     """
     Función principal para indexar datos en Solr.
-    Recibe un DataFrame de pandas con los datos del corpus.
+    Recibe un DataFrame de pandas con los datos del corpus y la versión de
+    la reindexación (se guarda en cada documento para que la API lo hidrate
+    con la versión del almacén de documentos que le corresponde).
+    Reconstruye el índice en SOLR_STAGING_CORE (sin tocar el core en
+    servicio), lo calienta y lo valida. Devuelve True si está listo para
+    el intercambio (swap_solr_cores).
     """
     print("\n--- Iniciando Indexación en Solr ---")
+    staging_url = solr_core_url(SOLR_STAGING_CORE)
     
     try:
         # 1. Conectar a Solr
-        print(f"Conectando a Solr en: {SOLR_URL}")
-        solr = pysolr.Solr(SOLR_URL, always_commit=True, timeout=30, decoder='utf-8')
+        print(f"Conectando a Solr en: {staging_url}")
+        solr = pysolr.Solr(staging_url, always_commit=False, timeout=30, decoder='utf-8')
         
         # 2. Verificar conexión
-        if not wait_for_solr(solr):
+        if not wait_for_solr(pysolr.Solr(SOLR_URL, timeout=30)):
             print("Asegúrese de que el contenedor 'solr' esté corriendo ('docker-compose ps').")
-            return
+            return False
+        if not solr_core_exists(SOLR_STAGING_CORE):
+            print(f"Error: no existe el core '{SOLR_STAGING_CORE}'.")
+            print("Recrea el contenedor 'solr' (docker-compose up -d solr) para que se precree.")
+            return False
 
-        # --- PASO 1: Configurar el Tesauro (Nuevo) ---
-        configure_solr_with_tesauro(solr)
+        # --- PASO 1: Configurar el Tesauro en el core nuevo ---
+        configure_solr_with_tesauro(solr, SOLR_STAGING_CORE)
 
     except Exception as e:
-        print(f"Error: No se pudo conectar a Solr en {SOLR_URL}")
+        print(f"Error: No se pudo conectar a Solr en {staging_url}")
         print(f"Detalle: {e}")
-        return
+        return False
 
     # --- Lógica de Fase 2 (Implementación) ---
 
     print("Preparando documentos para Solr...")
     
-    # 3. (Opcional pero recomendado) Limpiar índice existente
-    # print("Limpiando índice anterior...")
-    solr.delete(q='*:*') # ¡Cuidado! Borra todo.
+    # 3. Limpiar el core nuevo (el core en servicio no se toca)
+    solr.delete(q='*:*', commit=False)
 
     # 4. Preparar y añadir documentos en lotes
     batch_size = 500
@@ -161,36 +305,43 @@ def index_data_in_solr(data_df):
     
     print("Iniciando iteración del corpus...")
     
-    if data_df is not None and not data_df.empty:
-        try:
-            for index, row in tqdm(data_df.iterrows(), total=data_df.shape[0], desc="Indexando en Solr"):
-                
-                # *** ¡AJUSTE REALIZADO! ***
-                # Usamos los nombres de columna del DataFrame
-                doc = {
-                    'id': str(row['chunk_id']),
-                    'text_content_txt_es': str(row['text_content']), # Campo de texto en español
-                    'source_document_s': str(row['source_document'])  # Campo string
-                }
-                documents_batch.append(doc)
-                
-                # Enviar lote cuando esté lleno
-                if len(documents_batch) >= batch_size:
-                    solr.add(documents_batch)
-                    documents_batch = []
-
-            # Enviar el último lote restante
-            if documents_batch:
-                solr.add(documents_batch)
+    if data_df is None or data_df.empty:
+        print("No se proporcionaron datos (DataFrame vacío) para indexar.")
+        return False
+
+    try:
+        for index, row in tqdm(data_df.iterrows(), total=data_df.shape[0], desc="Indexando en Solr"):
+            
+            # *** ¡AJUSTE REALIZADO! ***
+            # Usamos los nombres de columna del DataFrame
+            doc = {
+                'id': str(row['chunk_id']),
+                'text_content_txt_es': str(row['text_content']), # Campo de texto en español
+                'source_document_s': str(row['source_document']),  # Campo string
+                'index_version_s': version                         # Versión de la reindexación
+            }
+            documents_batch.append(doc)
             
-            print(f"\nIndexación en Solr completada. Total: {data_df.shape[0]} documentos.")
+            # Enviar lote cuando esté lleno
+            if len(documents_batch) >= batch_size:
+                solr.add(documents_batch, commit=False)
+                documents_batch = []
 
-        except Exception as e:
-            print(f"\nError durante la indexación de Solr: {e}")
-            print("Verifica los nombres de las columnas y el esquema de Solr.")
-    else:
-        print("No se proporcionaron datos (DataFrame vacío) para indexar.")
+        # Enviar el último lote restante
+        if documents_batch:
+            solr.add(documents_batch, commit=False)
 
-    print("--- Indexación en Solr Finalizada ---")
+        # Un único commit al final (abre el searcher nuevo una sola vez)
+        solr.commit()
+        print(f"\nIndexación en Solr completada. Total: {data_df.shape[0]} documentos.")
 
- 
\ No newline at end of file
+        # 5. Calentar y validar antes del intercambio
+        ready = warm_and_validate_solr(solr, data_df)
+
+    except Exception as e:
+        print(f"\nError durante la indexación de Solr: {e}")
+        print("Verifica los nombres de las columnas y el esquema de Solr.")
+        ready = False
+
+    print("--- Indexación en Solr Finalizada ---")
+    return ready
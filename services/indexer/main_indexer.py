@@ -6,8 +6,9 @@ import nltk
 from tqdm import tqdm
 
 # Importamos las funciones de los otros archivos
-from index_solr import index_data_in_solr
-from index_milvus import index_data_in_milvus
+from index_solr import index_data_in_solr, swap_solr_cores
+from index_milvus import index_data_in_milvus, switch_milvus_alias, discard_milvus_collection
+from docstore import write_docstore, publish_docstore, discard_docstore
 
 # --- Configuración del Corpus y Segmentación ---
 CORPUS_PATH = "/data/corpus" # Ruta en Docker
@@ -15,6 +16,10 @@ FILE_PATTERN = "*.txt"
 CHUNK_SIZE = 5       # Número de oraciones por "pasaje" (chunk)
 CHUNK_OVERLAP = 2    # Número de oraciones a superponer
 
+# Exportación CSV de los chunks (la usa notebooks/GoldStandardGenerator.ipynb).
+# Vacío para desactivarla; el almacén de documentos es la fuente de la API.
+CHUNKS_CSV_PATH = os.getenv("CHUNKS_CSV_PATH", "/data/chunks_debug.csv")
+
 def setup_nltk():
     """Descarga los paquetes necesarios de NLTK."""
     try:
@@ -115,27 +120,82 @@ def main():
     print("Ejemplo de chunks generados:")
     print(data_df.head())
 
+    # Versión de esta reindexación (blue/green): todo se construye junto a
+    # lo que está en servicio y sólo se intercambia al final, ya validado.
+    version = time.strftime("%Y%m%d%H%M%S")
+    print(f"Versión del índice: {version}")
+
+    # 3. Guardar el texto de los chunks en el almacén local de documentos
+    #    (la API lo usa para hidratar los resultados de Solr y Milvus por id)
     try:
-        debug_path = "/data/chunks_debug.csv"
-        data_df.to_csv(debug_path, index=False, encoding='utf-8')
-        print(f"DataFrame de depuración guardado en: {debug_path}")
+        write_docstore(data_df, version)
     except Exception as e:
-        print(f"Error al guardar el CSV de depuración: {e}")
+        print(f"\n*** ERROR FATAL AL ESCRIBIR EL ALMACÉN DE DOCUMENTOS: {e} ***\n")
+        return
+
+    if CHUNKS_CSV_PATH:
+        try:
+            data_df.to_csv(CHUNKS_CSV_PATH, index=False, encoding='utf-8')
+            print(f"DataFrame de depuración guardado en: {CHUNKS_CSV_PATH}")
+        except Exception as e:
+            print(f"Error al guardar el CSV de depuración: {e}")
         
-    # 3. Indexar en Solr
+    # 4. Indexar en Solr (core de staging)
+    solr_ready = False
     try:
-        index_data_in_solr(data_df)
+        solr_ready = index_data_in_solr(data_df, version)
     except Exception as e:
         print(f"\n*** ERROR FATAL DURANTE INDEXACIÓN DE SOLR: {e} ***\n")
 
     print("\n" + "="*50 + "\n")
     
-    # 4. Indexar en Milvus
+    # 5. Indexar en Milvus (colección versionada)
+    milvus_collection = None
     try:
-        index_data_in_milvus(data_df)
+        milvus_collection = index_data_in_milvus(data_df, version)
     except Exception as e:
         print(f"\n*** ERROR FATAL DURANTE INDEXACIÓN DE MILVUS: {e} ***\n")
 
+    # 6. Publicación, todo o nada. Cada paso es atómico por sí solo (SWAP de
+    #    cores, alias de Milvus, puntero CURRENT), pero van uno detrás de otro
+    #    y la API relee CURRENT cada pocos segundos: durante ese intervalo un
+    #    backend puede servir la versión nueva y otro la anterior. Por eso cada
+    #    documento indexado lleva su versión y la API lo hidrata con esa misma
+    #    versión del almacén (la nueva ya está escrita; la anterior se conserva
+    #    para rollback). Si un backend no se puede publicar no se publica ninguno.
+    print("\n" + "="*50 + "\n")
+    print("--- Publicando la nueva versión ---")
+    published = False
+    if not solr_ready or not milvus_collection:
+        print("Algún índice no se construyó o no pasó la validación: se mantiene la versión en servicio.")
+    else:
+        try:
+            swap_solr_cores()
+        except Exception as e:
+            print(f"\n*** ERROR AL INTERCAMBIAR LOS CORES DE SOLR: {e} ***\n")
+        else:
+            try:
+                switch_milvus_alias(milvus_collection)
+                published = True
+            except Exception as e:
+                print(f"\n*** ERROR AL MOVER EL ALIAS DE MILVUS: {e} ***\n")
+                # Rollback: otro SWAP devuelve el core anterior a servicio
+                try:
+                    swap_solr_cores()
+                    print("Solr: intercambio revertido.")
+                except Exception as rollback_error:
+                    print(f"\n*** ERROR AL REVERTIR EL SWAP DE SOLR: {rollback_error}. Revíselo a mano. ***\n")
+
+    if published:
+        publish_docstore(version)
+    else:
+        discard_docstore(version)
+        if milvus_collection:
+            try:
+                discard_milvus_collection(milvus_collection)
+            except Exception as e:
+                print(f"No se pudo eliminar la colección no publicada '{milvus_collection}': {e}")
+
     end_time = time.time()
     print("\n" + "="*50)
     print(f"--- PROCESO DE INDEXACIÓN COMPLETADO ---")
@@ -1,51 +1,174 @@
 # Archivo: /services/indexer/parse_tesauro.py
 
-from rdflib import Graph, URIRef
-from rdflib.namespace import SKOS
+import os
+import json
+import hashlib
+import xml.etree.ElementTree as ET
 from tqdm import tqdm
 
-TESAURO_PATH = "/data/resource-tesauro.rdf"
+TESAURO_PATH = os.getenv("TESAURO_PATH", "/data/resource-tesauro.rdf")
 
-def parse_rdf_to_synonyms():
+# Artefacto compilado: grupos de sinónimos ya extraídos del RDF, indexados
+# por el hash SHA-256 del archivo fuente. Sólo se regenera si el RDF cambia.
+TESAURO_CACHE_PATH = os.getenv("TESAURO_CACHE_PATH", "/data/tesauro_compilado.json")
+CACHE_FORMAT_VERSION = 1
+
+# Nombres cualificados (formato de ElementTree) de los elementos RDF/SKOS
+RDF_NS = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+SKOS_NS = "http://www.w3.org/2004/02/skos/core#"
+RDF_ABOUT = f"{{{RDF_NS}}}about"
+RDF_NODE_ID = f"{{{RDF_NS}}}nodeID"
+SKOS_PREF_LABEL = f"{{{SKOS_NS}}}prefLabel"
+SKOS_ALT_LABEL = f"{{{SKOS_NS}}}altLabel"
+
+def file_sha256(path: str) -> str:
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def stream_rdf_concepts(path: str = TESAURO_PATH) -> list:
     """
-    Carga el resource-tesauro.rdf y lo convierte en una lista de
-    sinónimos planos para Solr, usando skos:prefLabel y skos:altLabel.
+    Recorre el RDF/XML en streaming (iterparse) y devuelve una lista de
+    grupos [prefLabel, altLabel, ...] en orden de aparición.
+    No construye el grafo completo en memoria: cada elemento se libera
+    en cuanto se cierra.
+    """
+    concepts = {}   # uri -> {"pref": [...], "alt": [...]}
+    subjects = []   # Pila de sujetos abiertos (elementos con rdf:about / rdf:nodeID)
+
+    def concept_for(uri):
+        return concepts.setdefault(uri, {"pref": [], "alt": []})
+
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            uri = elem.get(RDF_ABOUT) or elem.get(RDF_NODE_ID)
+            subjects.append(uri)
+            # Forma abreviada: <skos:Concept skos:prefLabel="...">
+            if uri is not None:
+                for attr, key in ((SKOS_PREF_LABEL, "pref"), (SKOS_ALT_LABEL, "alt")):
+                    if elem.get(attr):
+                        concept_for(uri)[key].append(elem.get(attr).strip())
+            continue
+
+        subjects.pop()
+        if elem.tag in (SKOS_PREF_LABEL, SKOS_ALT_LABEL):
+            # La etiqueta pertenece al sujeto abierto más cercano
+            owner = next((s for s in reversed(subjects) if s is not None), None)
+            label = (elem.text or "").strip()
+            if owner is not None and label:
+                key = "pref" if elem.tag == SKOS_PREF_LABEL else "alt"
+                concept_for(owner)[key].append(label)
+        elif len(subjects) == 1:
+            # Hijo directo de rdf:RDF cerrado: liberar su subárbol
+            elem.clear()
+
+    groups = []
+    for labels in tqdm(concepts.values(), desc="Compilando conceptos"):
+        if not labels["pref"]:
+            continue
+        # El grupo empieza con el término principal; se eliminan duplicados
+        group = [labels["pref"][0]]
+        for alt_label in labels["alt"]:
+            if alt_label not in group:
+                group.append(alt_label)
+        groups.append(group)
+    return groups
+
+def _read_cache(rdf_stat, rdf_hash=None):
+    """Devuelve los grupos del artefacto compilado si sigue vigente, o None."""
+    try:
+        with open(TESAURO_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cache.get("version") != CACHE_FORMAT_VERSION:
+        return None
+    # Atajo: mismo tamaño y mtime -> no hace falta recalcular el hash
+    if rdf_hash is None:
+        if cache.get("size") == rdf_stat.st_size and cache.get("mtime_ns") == rdf_stat.st_mtime_ns:
+            return cache.get("groups")
+        return None
+    if cache.get("sha256") == rdf_hash:
+        return cache.get("groups")
+    return None
+
+def _write_cache(rdf_stat, rdf_hash, groups):
+    """Escribe el artefacto compilado de forma atómica."""
+    cache = {
+        "version": CACHE_FORMAT_VERSION,
+        "source": os.path.basename(TESAURO_PATH),
+        "sha256": rdf_hash,
+        "size": rdf_stat.st_size,
+        "mtime_ns": rdf_stat.st_mtime_ns,
+        "groups": groups
+    }
+    tmp_path = f"{TESAURO_CACHE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, TESAURO_CACHE_PATH)
+
+def load_synonym_groups() -> list:
     """
-    print(f"Cargando tesauro desde: {TESAURO_PATH}")
-    g = Graph()
+    Devuelve los grupos de sinónimos [prefLabel, altLabel, ...] del tesauro.
+    Usa el artefacto compilado si el hash del RDF no ha cambiado; en caso
+    contrario lo regenera con el parser en streaming.
+    """
+    try:
+        rdf_stat = os.stat(TESAURO_PATH)
+    except OSError:
+        # Sin RDF disponible: se acepta el artefacto compilado tal cual
+        print(f"No se encontró '{TESAURO_PATH}'. Buscando tesauro compilado...")
+        try:
+            with open(TESAURO_CACHE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f).get("groups", [])
+        except (OSError, ValueError):
+            print("Asegúrate de que 'resource-tesauro.rdf' esté en la carpeta /data.")
+            return []
+
+    groups = _read_cache(rdf_stat)
+    if groups is not None:
+        print(f"Tesauro compilado vigente en {TESAURO_CACHE_PATH} ({len(groups)} grupos).")
+        return groups
+
+    rdf_hash = file_sha256(TESAURO_PATH)
+    groups = _read_cache(rdf_stat, rdf_hash)
+    if groups is not None:
+        print(f"Tesauro compilado vigente (hash {rdf_hash[:12]}). {len(groups)} grupos.")
+        # Refrescar tamaño/mtime para que la próxima vez baste el atajo
+        _write_cache(rdf_stat, rdf_hash, groups)
+        return groups
+
+    print(f"Compilando tesauro desde: {TESAURO_PATH}")
     try:
-        g.parse(TESAURO_PATH, format="xml")
-    except Exception as e:
+        groups = stream_rdf_concepts(TESAURO_PATH)
+    except ET.ParseError as e:
         print(f"Error fatal al parsear el RDF: {e}")
-        print("Asegúrate de que 'resource-tesauro.rdf' esté en la carpeta /data.")
         return []
 
-    print(f"Tesauro cargado. {len(g)} tripletas encontradas. Parseando conceptos...")
-    
+    try:
+        _write_cache(rdf_stat, rdf_hash, groups)
+        print(f"Tesauro compilado guardado en: {TESAURO_CACHE_PATH}")
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el tesauro compilado: {e}")
+    return groups
+
+def parse_rdf_to_synonyms():
+    """
+    Carga el resource-tesauro.rdf y lo convierte en una lista de
+    sinónimos planos para Solr, usando skos:prefLabel y skos:altLabel.
+    """
     # SKOS (Simple Knowledge Organization System) es el estándar que usa este tesauro.
     # skos:prefLabel = El término preferido (ej. "FARC-EP")
     # skos:altLabel = El término alternativo (ej. "FARC")
-    
-    concepts = list(g.subjects(predicate=SKOS.prefLabel))
-    synonym_groups = []
-
-    for concept_uri in tqdm(concepts, desc="Parseando conceptos"):
-        # Encontrar el término principal
-        pref_labels = list(g.objects(subject=concept_uri, predicate=SKOS.prefLabel))
-        if not pref_labels:
-            continue
-        
-        # El grupo de sinónimos empieza con el término principal
-        group = [str(pref_labels[0])]
-        
-        # Encontrar todos los términos alternativos
-        for alt_label in g.objects(subject=concept_uri, predicate=SKOS.altLabel):
-            group.append(str(alt_label))
-            
-        # Solr espera una línea separada por comas
-        # ej: "FARC-EP, FARC, Fuerzas Armadas Revolucionarias de Colombia"
-        if len(group) > 1:
-            synonym_groups.append(", ".join(group))
+    groups = load_synonym_groups()
+
+    # Solr espera una línea separada por comas
+    # ej: "FARC-EP, FARC, Fuerzas Armadas Revolucionarias de Colombia"
+    synonym_groups = [", ".join(group) for group in groups if len(group) > 1]
 
     print(f"Parseo completado. {len(synonym_groups)} grupos de sinónimos encontrados.")
     return synonym_groups
@@ -55,4 +178,4 @@ if __name__ == "__main__":
     synonyms = parse_rdf_to_synonyms()
     print("\n--- 10 Ejemplos de Grupos de Sinónimos ---")
     for s in synonyms[:10]:
-        print(s)
\ No newline at end of file
+        print(s)
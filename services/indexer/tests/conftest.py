@@ -0,0 +1,6 @@
+# Las pruebas importan los módulos como lo hace la imagen del indexer (/app).
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..")))
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+for module in ("tqdm", "requests", "pysolr", "pandas"):
+    pytest.importorskip(module)
+
+import index_solr
+
+URL = "http://solr/schema/analysis/synonyms/tesauro_cev"
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+class FakeSolrSynonyms:
+    """Registra las llamadas a la API REST de recursos gestionados."""
+
+    def __init__(self, managed_map=None):
+        self.managed_map = managed_map
+        self.calls = []
+
+    def get(self, url, headers=None):
+        self.calls.append(("GET", url))
+        if self.managed_map is None:
+            return FakeResponse(404)
+        return FakeResponse(body={"synonymMappings": {"managedMap": self.managed_map}})
+
+    def put(self, url, data=None, headers=None):
+        self.calls.append(("PUT", json.loads(data)))
+        return FakeResponse()
+
+    def delete(self, url, headers=None):
+        self.calls.append(("DELETE", url))
+        return FakeResponse()
+
+@pytest.fixture
+def solr(monkeypatch):
+    fake = FakeSolrSynonyms()
+    for method in ("get", "put", "delete"):
+        monkeypatch.setattr(index_solr.requests, method, getattr(fake, method))
+    return fake
+
+def test_build_synonym_map_is_symmetric_and_lowercase():
+    assert index_solr.build_synonym_map(["FARC-EP, FARC", "JEP", " , "]) == {
+        "farc-ep": {"farc"},
+        "farc": {"farc-ep"},
+    }
+
+def test_sync_creates_missing_resource_once(solr):
+    assert index_solr.sync_managed_synonyms(URL, ["FARC-EP, FARC"], {}) is True
+    assert [c[0] for c in solr.calls] == ["GET", "PUT"]
+    assert solr.calls[1][1]["synonyms"] == ["FARC-EP, FARC"]
+
+def test_sync_without_changes_does_not_write(solr):
+    solr.managed_map = {"FARC-EP": ["FARC"], "farc": ["farc-ep"]}
+    assert index_solr.sync_managed_synonyms(URL, ["FARC-EP, FARC"], {}) is False
+    assert [c[0] for c in solr.calls] == ["GET"]
+
+def test_sync_applies_only_the_differences(solr):
+    solr.managed_map = {
+        "farc-ep": ["farc"],
+        "farc": ["farc-ep"],
+        "Obsoleto": ["viejo"],
+        "jep": ["cev"],
+    }
+    changed = index_solr.sync_managed_synonyms(URL, ["FARC-EP, FARC", "JEP, Jurisdicción Especial"], {})
+
+    assert changed is True
+    deleted = [url for method, url in solr.calls if method == "DELETE"]
+    assert deleted == [f"{URL}/Obsoleto", f"{URL}/jep"]
+    added = [body for method, body in solr.calls if method == "PUT"]
+    assert added == [{"jep": ["jurisdicción especial"], "jurisdicción especial": ["jep"]}]
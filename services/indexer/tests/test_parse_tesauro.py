@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("tqdm")
+
+import parse_tesauro
+
+RDF = """<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:skos="http://www.w3.org/2004/02/skos/core#">
+  <skos:Concept rdf:about="http://example.org/farc">
+    <skos:prefLabel xml:lang="es">FARC-EP</skos:prefLabel>
+    <skos:altLabel xml:lang="es">FARC</skos:altLabel>
+    <skos:altLabel xml:lang="es">FARC</skos:altLabel>
+  </skos:Concept>
+  <skos:Concept rdf:about="http://example.org/jep" skos:prefLabel="JEP">
+    <skos:altLabel>Jurisdicción Especial para la Paz</skos:altLabel>
+  </skos:Concept>
+  <skos:Concept rdf:about="http://example.org/sin-pref">
+    <skos:altLabel>Huérfano</skos:altLabel>
+  </skos:Concept>
+</rdf:RDF>
+"""
+
+EXPECTED = [["FARC-EP", "FARC"], ["JEP", "Jurisdicción Especial para la Paz"]]
+
+@pytest.fixture
+def tesauro(tmp_path, monkeypatch):
+    rdf_path = tmp_path / "resource-tesauro.rdf"
+    rdf_path.write_text(RDF, encoding="utf-8")
+    monkeypatch.setattr(parse_tesauro, "TESAURO_PATH", str(rdf_path))
+    monkeypatch.setattr(parse_tesauro, "TESAURO_CACHE_PATH", str(tmp_path / "tesauro_compilado.json"))
+    return rdf_path
+
+def test_stream_rdf_concepts_groups_pref_and_alt_labels(tesauro):
+    assert parse_tesauro.stream_rdf_concepts(str(tesauro)) == EXPECTED
+
+def test_load_synonym_groups_uses_compiled_cache(tesauro, monkeypatch):
+    assert parse_tesauro.load_synonym_groups() == EXPECTED
+
+    def fail(path):
+        raise AssertionError("no debe volver a parsear el RDF")
+    monkeypatch.setattr(parse_tesauro, "stream_rdf_concepts", fail)
+    assert parse_tesauro.load_synonym_groups() == EXPECTED
+
+def test_load_synonym_groups_reuses_cache_when_only_mtime_changed(tesauro, monkeypatch):
+    parse_tesauro.load_synonym_groups()
+    tesauro.write_text(RDF, encoding="utf-8")   # mismo contenido, mtime nuevo
+
+    def fail(path):
+        raise AssertionError("el hash no cambió: no debe volver a parsear el RDF")
+    monkeypatch.setattr(parse_tesauro, "stream_rdf_concepts", fail)
+    assert parse_tesauro.load_synonym_groups() == EXPECTED
+
+def test_load_synonym_groups_recompiles_when_rdf_changes(tesauro):
+    parse_tesauro.load_synonym_groups()
+    tesauro.write_text(RDF.replace("JEP", "CEV"), encoding="utf-8")
+    assert parse_tesauro.load_synonym_groups()[1][0] == "CEV"
+
+def test_parse_rdf_to_synonyms_joins_groups_for_solr(tesauro):
+    assert parse_tesauro.parse_rdf_to_synonyms() == [
+        "FARC-EP, FARC",
+        "JEP, Jurisdicción Especial para la Paz",
+    ]